@@ -0,0 +1,154 @@
+import io
+import json
+import os
+import zipfile
+
+from .exports import batched, iter_edges, iter_nodes
+from .models import Files, MainFiles, Tags
+from .storage import blob_sha256
+
+
+ARCHIVE_FORMAT = 1
+
+MANIFEST_NAME = 'manifest.json'
+
+READ_SIZE = 1024 * 1024
+
+# Formats that are compressed already are stored as they are.
+COMPRESSED_EXTENSIONS = {'pdf', 'jpg', 'png', 'docx'}
+
+FILE_KINDS = (
+    ('file', Files),
+    ('main_file', MainFiles),
+)
+
+
+class _ZipStream(io.RawIOBase):
+    """
+    Write-only sink for ZipFile. It is not seekable, so ZipFile writes data
+    descriptors after every entry instead of seeking back, and the written
+    bytes are drained after each chunk.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.parts = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        if self.parts:
+            data = b''.join(self.parts)
+            self.parts = []
+            yield data
+
+
+def _file_rows(project, model):
+    return (
+        model.objects.filter(project=project)
+        .order_by('id')
+        .values_list('id', 'file_name', 'file', 'sha256', 'size', 'mime_type', 'uploadedAt')
+        .iterator()
+    )
+
+
+def _archive_path(kind, pk, name, sha256):
+    # Files with the same content share one entry of the archive, the
+    # original names are kept in the manifest.
+    if sha256:
+        return f'files/{sha256}'
+    return f'files/{kind}-{pk}/{os.path.basename(name)}'
+
+
+def _manifest(project, paths):
+    """JSON of the project in pieces; fills paths with (kind, id) -> path in the archive."""
+    yield '{\n'
+    yield f'"format": {ARCHIVE_FORMAT},\n'
+    yield f'"project": {json.dumps({"name": project.project_name, "createdAt": project.createdAt.isoformat()}, ensure_ascii=False)},\n'
+
+    yield '"tags": ['
+    tags = Tags.objects.filter(project=project).order_by('tag_name').values_list('tag_name', flat=True)
+    for i, name in enumerate(tags.iterator()):
+        yield (',' if i else '') + '\n' + json.dumps(name, ensure_ascii=False)
+    yield '\n],\n'
+
+    yield '"objects": ['
+    for i, (object_id, name, description, tag_names) in enumerate(iter_nodes(project)):
+        node = {'id': object_id, 'name': name, 'description': description, 'tags': tag_names}
+        yield (',' if i else '') + '\n' + json.dumps(node, ensure_ascii=False)
+    yield '\n],\n'
+
+    yield '"connections": ['
+    for i, (from_id, _, to_id, _) in enumerate(iter_edges(project)):
+        yield (',' if i else '') + f'\n[{from_id}, {to_id}]'
+    yield '\n],\n'
+
+    yield '"files": ['
+    first = True
+    for kind, model in FILE_KINDS:
+        for pk, file_name, name, sha256, size, mime_type, uploaded_at in _file_rows(project, model):
+            sha256 = sha256 or blob_sha256(name) or ''
+            path = _archive_path(kind, pk, name, sha256)
+            paths[(kind, pk)] = path
+            entry = {
+                'kind': kind,
+                'file_name': file_name,
+                'filename': os.path.basename(name),
+                'path': path,
+                'sha256': sha256,
+                'size': size,
+                'mime_type': mime_type,
+                'uploadedAt': uploaded_at.isoformat(),
+            }
+            yield ('' if first else ',') + '\n' + json.dumps(entry, ensure_ascii=False)
+            first = False
+    yield '\n]\n}\n'
+
+
+def _zip_info(path, date_time, compressed):
+    info = zipfile.ZipInfo(path, date_time=date_time)
+    info.compress_type = zipfile.ZIP_STORED if compressed else zipfile.ZIP_DEFLATED
+    info.external_attr = 0o644 << 16
+    return info
+
+
+def project_archive(project):
+    """
+    Iterator of the bytes of a ZIP with the project's manifest and stored
+    files. Everything is read and compressed in chunks, memory use does not
+    depend on the size of the project or of its files.
+    """
+    stream = _ZipStream()
+    paths = {}
+    with zipfile.ZipFile(stream, 'w') as archive:
+        info = _zip_info(MANIFEST_NAME, project.updatedAt.timetuple()[:6], compressed=False)
+        with archive.open(info, 'w') as entry:
+            for piece in batched(_manifest(project, paths)):
+                entry.write(piece.encode())
+                yield from stream.drain()
+
+        written = set()
+        for kind, model in FILE_KINDS:
+            storage = model._meta.get_field('file').storage
+            for pk, _, name, _, _, _, uploaded_at in _file_rows(project, model):
+                path = paths.get((kind, pk))
+                if path is None or path in written:
+                    continue
+                try:
+                    size = storage.size(name)
+                except OSError:
+                    continue
+                written.add(path)
+                extension = name.rsplit('.', 1)[-1].lower()
+                info = _zip_info(path, uploaded_at.timetuple()[:6], compressed=extension in COMPRESSED_EXTENSIONS)
+                with storage.open(name, 'rb') as source, archive.open(info, 'w', force_zip64=size >= zipfile.ZIP64_LIMIT) as entry:
+                    for chunk in iter(lambda: source.read(READ_SIZE), b''):
+                        entry.write(chunk)
+                        yield from stream.drain()
+                yield from stream.drain()
+    yield from stream.drain()
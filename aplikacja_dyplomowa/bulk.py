@@ -0,0 +1,110 @@
+from django.db import transaction
+
+from .graph import connections_changed
+from .models import ProjectObjects, Tags
+from .tag_filter import bump_tags_version
+
+
+BATCH_SIZE = 500
+
+TagLinks = ProjectObjects.tags.through
+Connections = ProjectObjects.connections.through
+
+OPERATIONS = ('add_tags', 'remove_tags', 'connect', 'disconnect')
+
+
+class BulkEditError(ValueError):
+    pass
+
+
+def _project_ids(queryset, ids):
+    try:
+        ids = {int(value) for value in ids}
+    except (TypeError, ValueError):
+        raise BulkEditError('Identyfikatory muszą być liczbami.')
+    found = set(queryset.filter(id__in=ids).values_list('id', flat=True))
+    if found != ids:
+        raise BulkEditError(f'Nieznane identyfikatory: {", ".join(str(value) for value in sorted(ids - found))}')
+    return sorted(ids)
+
+
+def object_ids(project, ids):
+    return _project_ids(ProjectObjects.objects.filter(project=project), ids)
+
+
+def tag_ids(project, ids):
+    return _project_ids(Tags.objects.filter(project=project), ids)
+
+
+def add_tags(project, objects, tags):
+    existing = set(
+        TagLinks.objects.filter(projectobjects_id__in=objects, tags_id__in=tags)
+        .values_list('projectobjects_id', 'tags_id')
+    )
+    rows = [
+        TagLinks(projectobjects_id=object_id, tags_id=tag_id)
+        for object_id in objects for tag_id in tags
+        if (object_id, tag_id) not in existing
+    ]
+    TagLinks.objects.bulk_create(rows, batch_size=BATCH_SIZE)
+    if rows:
+        bump_tags_version(project.id)
+    return len(rows)
+
+
+def remove_tags(project, objects, tags):
+    removed, _ = TagLinks.objects.filter(projectobjects_id__in=objects, tags_id__in=tags).delete()
+    if removed:
+        bump_tags_version(project.id)
+    return removed
+
+
+def connect(project, objects, targets):
+    existing = set(
+        Connections.objects.filter(from_projectobjects_id__in=objects, to_projectobjects_id__in=targets)
+        .values_list('from_projectobjects_id', 'to_projectobjects_id')
+    )
+    pairs = [
+        (source, target)
+        for source in objects for target in targets
+        if source != target and (source, target) not in existing
+    ]
+    Connections.objects.bulk_create(
+        [Connections(from_projectobjects_id=source, to_projectobjects_id=target) for source, target in pairs],
+        batch_size=BATCH_SIZE,
+    )
+    if pairs:
+        connections_changed(project.id, added=pairs)
+    return len(pairs)
+
+
+def disconnect(project, objects, targets):
+    links = Connections.objects.filter(from_projectobjects_id__in=objects, to_projectobjects_id__in=targets)
+    pairs = list(links.values_list('from_projectobjects_id', 'to_projectobjects_id'))
+    if pairs:
+        links.delete()
+        connections_changed(project.id, removed=pairs)
+    return len(pairs)
+
+
+def apply_operations(project, operations):
+    """
+    Apply a list of {'op', 'objects', 'tags' | 'targets'} operations in one
+    transaction. Every operation is one insert (batched) or one delete on
+    the through table. Returns the number of changed links per operation.
+    """
+    results = []
+    with transaction.atomic():
+        for operation in operations:
+            if not isinstance(operation, dict) or operation.get('op') not in OPERATIONS:
+                raise BulkEditError(f'Dozwolone operacje: {", ".join(OPERATIONS)}.')
+            op = operation['op']
+            objects = object_ids(project, operation.get('objects') or [])
+            if op in ('add_tags', 'remove_tags'):
+                tags = tag_ids(project, operation.get('tags') or [])
+                changed = add_tags(project, objects, tags) if op == 'add_tags' else remove_tags(project, objects, tags)
+            else:
+                targets = object_ids(project, operation.get('targets') or [])
+                changed = connect(project, objects, targets) if op == 'connect' else disconnect(project, objects, targets)
+            results.append({'op': op, 'changed': changed})
+    return results
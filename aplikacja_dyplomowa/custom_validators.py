@@ -105,10 +105,17 @@ class CustomUserAttributeSimilarityValidator(UserAttributeSimilarityValidator):
         )
 
 
+FILE_EXTENSIONS = ['txt', 'docx', 'csv', 'pdf', 'jpg', 'png']
+MAIN_FILE_EXTENSIONS = ['txt', 'docx', 'csv']
+IMAGE_EXTENSIONS = ['jpg', 'png']
+
+MAX_FILE_SIZE = 5242880
+
+
 def file_too_big(value):
     filesize = value.size
 
-    if filesize > 5242880:
+    if filesize > MAX_FILE_SIZE:
         return True
     else:
         return False
@@ -0,0 +1,100 @@
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .graph import connections_changed
+from .models import ChunkedUploads, Files, MainFiles, ProjectDeletions, ProjectObjects, Projects, Tags
+from .quotas import add_usage
+from .search import unindex_objects
+from .storage import release_file
+from .tasks import schedule
+from .uploads import abort_upload
+
+
+BATCH_SIZE = 500
+
+TagLinks = ProjectObjects.tags.through
+Connections = ProjectObjects.connections.through
+
+
+def _querysets(project_id):
+    """Rows of a project in the order they can be deleted without breaking foreign keys."""
+    return (
+        TagLinks.objects.filter(Q(projectobjects__project_id=project_id) | Q(tags__project_id=project_id)),
+        Connections.objects.filter(Q(from_projectobjects__project_id=project_id) | Q(to_projectobjects__project_id=project_id)),
+        ProjectObjects.objects.filter(project_id=project_id),
+        Tags.objects.filter(project_id=project_id),
+        Files.objects.filter(project_id=project_id),
+        MainFiles.objects.filter(project_id=project_id),
+    )
+
+
+def start_deletion(project):
+    """
+    Hide the project at once and delete its rows in the background. Returns
+    the ProjectDeletions row the status page follows.
+    """
+    with transaction.atomic():
+        Projects.objects.filter(id=project.id).update(deleting=True)
+        total = sum(queryset.count() for queryset in _querysets(project.id))
+        deletion = ProjectDeletions.objects.create(
+            project=project, project_name=project.project_name, user=project.user, total=total,
+        )
+        schedule(delete_project_rows, deletion.id)
+    return deletion
+
+
+def _delete_batch(model, queryset):
+    """Delete up to BATCH_SIZE rows in one transaction. Returns the number of deleted rows."""
+    with transaction.atomic():
+        ids = list(queryset.order_by('pk').values_list('pk', flat=True)[:BATCH_SIZE])
+        if not ids:
+            return 0
+        batch = model.objects.filter(pk__in=ids)
+        if model is ProjectObjects:
+            unindex_objects(ids)
+        elif model in (Files, MainFiles):
+            # Blob references are dropped now, the files are removed after commit.
+            usage = {}
+            for instance in batch.only('pk', 'file', 'size', 'project_id', 'user_id'):
+                if instance.file:
+                    release_file(instance.file)
+                key = (instance.project_id, instance.user_id)
+                usage[key] = usage.get(key, 0) + instance.size
+            for (project_id, user_id), size in usage.items():
+                add_usage(project_id, user_id, -size)
+        # The related rows are gone already and the per-row signals are
+        # replaced by the bulk work above, so skip the collector.
+        batch._raw_delete(batch.db)
+    return len(ids)
+
+
+def delete_project_rows(deletion_id):
+    """
+    Background task: delete the rows of a hidden project, BATCH_SIZE at a
+    time with a commit after every batch, so the write lock is only held
+    briefly. Safe to run again after an interruption.
+    """
+    deletion = ProjectDeletions.objects.filter(id=deletion_id, finishedAt__isnull=True).first()
+    if deletion is None or deletion.project_id is None:
+        return
+    project_id = deletion.project_id
+    connections_changed(project_id, invalidate=True)
+
+    for queryset in _querysets(project_id):
+        while deleted := _delete_batch(queryset.model, queryset):
+            ProjectDeletions.objects.filter(id=deletion_id).update(deleted=F('deleted') + deleted)
+
+    for upload in ChunkedUploads.objects.filter(project_id=project_id):
+        abort_upload(upload)
+    with transaction.atomic():
+        Projects.objects.filter(id=project_id).delete()
+        ProjectDeletions.objects.filter(id=deletion_id).update(finishedAt=timezone.now())
+
+
+def resume_deletions():
+    """Finish deletions interrupted by a restart. Returns their number."""
+    pending = list(ProjectDeletions.objects.filter(finishedAt__isnull=True).values_list('id', flat=True))
+    for deletion_id in pending:
+        delete_project_rows(deletion_id)
+    return len(pending)
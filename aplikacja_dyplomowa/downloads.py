@@ -0,0 +1,193 @@
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.http import FileResponse, HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe, quote_etag
+
+from .storage import blob_sha256
+
+
+_RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+DELIVERY_MODES = ('django', 'x-accel-redirect', 'x-sendfile')
+
+
+class FileRange:
+    """File-like window over [start, start + length) of an open file, read in blocks by FileResponse."""
+
+    def __init__(self, file, start, length):
+        self.file = file
+        self.remaining = length
+        self.name = file.name
+        file.seek(start)
+
+    def read(self, size=-1):
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        if size == 0:
+            return b''
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def file_etag(field_file, sha256, stat, encoding=''):
+    """
+    Strong ETag from the content hash, or from size and mtime when the hash
+    is not known yet. The gzip-encoded form of a file has its own ETag.
+    """
+    suffix = f'-{encoding}' if encoding else ''
+    sha256 = sha256 or blob_sha256(field_file.name)
+    if sha256:
+        return quote_etag(sha256 + suffix)
+    return quote_etag(f'{stat.st_size:x}-{stat.st_mtime_ns:x}{suffix}')
+
+
+def accepts_gzip(request):
+    for coding in request.headers.get('Accept-Encoding', '').split(','):
+        name, _, params = coding.strip().partition(';')
+        if name.strip().lower() in ('gzip', '*'):
+            try:
+                return float(params.strip().lower().removeprefix('q=') or 1) > 0
+            except ValueError:
+                return True
+    return False
+
+
+def parse_range(header, size):
+    """
+    (start, end) of a single byte range, None to send the whole file and
+    False when the range can not be satisfied. Several ranges in one header
+    are answered with the whole file.
+    """
+    match = _RANGE.match(header.replace(' ', ''))
+    if not match or match.group(1) == match.group(2) == '':
+        return None
+    first, last = match.groups()
+    if first == '':
+        length = int(last)
+        if length == 0 or size == 0:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(first)
+    if start >= size:
+        return False
+    end = min(int(last), size - 1) if last else size - 1
+    if start > end:
+        return None
+    return start, end
+
+
+def _if_range_passes(request, etag, last_modified):
+    value = request.headers.get('If-Range')
+    if not value:
+        return True
+    if value.startswith('"'):
+        return value == etag
+    return parse_http_date_safe(value) == last_modified
+
+
+def range_response(request, file, size, etag, last_modified, **kwargs):
+    """
+    FileResponse for an open file: the byte range asked for (206), 416 when
+    it can not be satisfied, the whole file otherwise. kwargs go to FileResponse.
+    """
+    byte_range = None
+    if request.headers.get('Range') and _if_range_passes(request, etag, last_modified):
+        byte_range = parse_range(request.headers['Range'], size)
+
+    if byte_range is False:
+        file.close()
+        response = HttpResponse(status=416)
+        response.headers['Content-Range'] = f'bytes */{size}'
+    elif byte_range:
+        start, end = byte_range
+        response = FileResponse(FileRange(file, start, end - start + 1), **kwargs)
+        response.status_code = 206
+        response.headers['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response.headers['Content-Length'] = end - start + 1
+    else:
+        response = FileResponse(file, **kwargs)
+    response.headers['Accept-Ranges'] = 'bytes'
+    return response
+
+
+def delivery_mode():
+    mode = getattr(settings, 'FILE_DELIVERY', 'django')
+    if mode not in DELIVERY_MODES:
+        raise ImproperlyConfigured(f'FILE_DELIVERY must be one of: {", ".join(DELIVERY_MODES)}')
+    return mode
+
+
+def internal_url():
+    return getattr(settings, 'FILE_DELIVERY_INTERNAL_URL', '/protected/')
+
+
+def offload_response(field_file, filename, as_attachment):
+    """
+    Empty response telling the front proxy which file to send. The proxy
+    answers byte ranges itself; the headers set here are passed through.
+    """
+    response = HttpResponse(content_type=mimetypes.guess_type(filename)[0] or 'application/octet-stream')
+    if disposition := content_disposition_header(as_attachment, filename):
+        response.headers['Content-Disposition'] = disposition
+    if delivery_mode() == 'x-accel-redirect':
+        relative = os.path.relpath(field_file.path, os.path.abspath(settings.MEDIA_ROOT))
+        response.headers['X-Accel-Redirect'] = internal_url() + quote(relative.replace(os.sep, '/'))
+    else:
+        response.headers['X-Sendfile'] = os.path.abspath(field_file.path)
+    return response
+
+
+def serve_file(request, field_file, sha256='', as_attachment=True):
+    """
+    Download with ETag/Last-Modified validators, 304 and 412 answers to
+    conditional requests and 206 answers to a single byte range. With
+    FILE_DELIVERY set, the bytes are sent by the front proxy instead.
+
+    Files kept compressed are sent as stored with Content-Encoding: gzip to
+    clients that accept it and decompressed while streaming to the others.
+    They are always sent by Django, proxies do not pass Content-Encoding
+    through for internal redirects.
+    """
+    storage = field_file.storage
+    compressed = getattr(storage, 'is_compressed', lambda name: False)(field_file.name)
+    encoded = compressed and accepts_gzip(request)
+    stat = os.stat(field_file.path)
+    etag = file_etag(field_file, sha256, stat, encoding='gzip' if encoded else '')
+    last_modified = int(stat.st_mtime)
+    filename = os.path.basename(field_file.name)
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None and delivery_mode() != 'django' and not compressed:
+        response = offload_response(field_file, filename, as_attachment)
+    elif response is None and encoded:
+        file = open(field_file.path, 'rb')
+        response = range_response(
+            request, file, stat.st_size, etag, last_modified, as_attachment=as_attachment, filename=filename,
+        )
+        response.headers['Content-Encoding'] = 'gzip'
+    elif response is None:
+        size = storage.size(field_file.name) if compressed else stat.st_size
+        file = storage.open(field_file.name, 'rb')
+        response = range_response(
+            request, file, size, etag, last_modified, as_attachment=as_attachment, filename=filename,
+        )
+        if response.status_code == 200:
+            response.headers['Content-Length'] = size
+
+    response.headers['ETag'] = etag
+    response.headers['Last-Modified'] = http_date(last_modified)
+    if compressed:
+        patch_vary_headers(response, ['Accept-Encoding'])
+    # Files are private; browsers keep them but ask again with the validators.
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
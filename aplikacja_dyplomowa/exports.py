@@ -0,0 +1,126 @@
+import csv
+import io
+import json
+from xml.sax.saxutils import escape, quoteattr
+
+from .models import ProjectObjects
+
+
+GRAPH_FORMATS = {
+    'jsonl': ('application/x-ndjson', 'jsonl'),
+    'graphml': ('application/graphml+xml', 'graphml'),
+    'csv': ('text/csv', 'csv'),
+}
+
+CHUNK_SIZE = 2000
+
+
+def batched(lines, size=500):
+    # Joining lines into bigger pieces keeps the per-chunk overhead of the
+    # streaming response low while memory stays bounded.
+    batch = []
+    for line in lines:
+        batch.append(line)
+        if len(batch) >= size:
+            yield ''.join(batch)
+            batch = []
+    if batch:
+        yield ''.join(batch)
+
+
+def iter_nodes(project):
+    """(id, name, description, [tag names]) of every object, read in chunks ordered by id."""
+    objects = (
+        ProjectObjects.objects.filter(project=project)
+        .order_by('id')
+        .values_list('id', 'object_name', 'object_description')
+        .iterator(chunk_size=CHUNK_SIZE)
+    )
+    links = (
+        ProjectObjects.tags.through.objects.filter(projectobjects__project=project)
+        .order_by('projectobjects_id', 'tags__tag_name')
+        .values_list('projectobjects_id', 'tags__tag_name')
+        .iterator(chunk_size=CHUNK_SIZE)
+    )
+
+    # Both streams are sorted by object id, merge them without keeping either in memory.
+    link = next(links, None)
+    for object_id, name, description in objects:
+        tags = []
+        while link is not None and link[0] <= object_id:
+            if link[0] == object_id:
+                tags.append(link[1])
+            link = next(links, None)
+        yield object_id, name, description, tags
+
+
+def iter_edges(project):
+    """(from id, from name, to id, to name) of every connection of the project."""
+    through = ProjectObjects.connections.through
+    return (
+        through.objects.filter(from_projectobjects__project=project)
+        .order_by('id')
+        .values_list(
+            'from_projectobjects_id', 'from_projectobjects__object_name',
+            'to_projectobjects_id', 'to_projectobjects__object_name',
+        )
+        .iterator(chunk_size=CHUNK_SIZE)
+    )
+
+
+def graph_jsonl(project):
+    def lines():
+        for object_id, name, description, tags in iter_nodes(project):
+            node = {'type': 'node', 'id': object_id, 'name': name, 'description': description, 'tags': tags}
+            yield json.dumps(node, ensure_ascii=False) + '\n'
+        for from_id, _, to_id, _ in iter_edges(project):
+            yield json.dumps({'type': 'edge', 'from': from_id, 'to': to_id}) + '\n'
+    return batched(lines())
+
+
+def graph_graphml(project):
+    def lines():
+        yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+        yield '<graphml xmlns="http://graphml.graphdrawing.org/xmlns">\n'
+        yield '<key id="name" for="node" attr.name="name" attr.type="string"/>\n'
+        yield '<key id="description" for="node" attr.name="description" attr.type="string"/>\n'
+        yield '<key id="tags" for="node" attr.name="tags" attr.type="string"/>\n'
+        yield f'<graph id={quoteattr(str(project))} edgedefault="directed">\n'
+        for object_id, name, description, tags in iter_nodes(project):
+            yield (
+                f'<node id="n{object_id}">'
+                f'<data key="name">{escape(name)}</data>'
+                f'<data key="description">{escape(description)}</data>'
+                f'<data key="tags">{escape(",".join(tags))}</data>'
+                f'</node>\n'
+            )
+        for from_id, _, to_id, _ in iter_edges(project):
+            yield f'<edge source="n{from_id}" target="n{to_id}"/>\n'
+        yield '</graph>\n</graphml>\n'
+    return batched(lines())
+
+
+def graph_csv(project):
+    def lines():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(['source_id', 'source_name', 'target_id', 'target_name'])
+        for row in iter_edges(project):
+            writer.writerow(row)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        yield buffer.getvalue()
+    return batched(lines())
+
+
+GRAPH_WRITERS = {
+    'jsonl': graph_jsonl,
+    'graphml': graph_graphml,
+    'csv': graph_csv,
+}
+
+
+def export_graph(project, graph_format):
+    """Iterator of text chunks with the project's graph in the given format."""
+    return GRAPH_WRITERS[graph_format](project)
@@ -0,0 +1,162 @@
+import codecs
+import csv
+import hashlib
+import zipfile
+from xml.etree.ElementTree import iterparse
+
+from django.conf import settings
+
+
+CHUNK_SIZE = 64 * 1024
+
+WORD_NS = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+
+
+def file_sha256(field_file):
+    digest = hashlib.sha256()
+    field_file.open('rb')
+    try:
+        for chunk in field_file.chunks(CHUNK_SIZE):
+            digest.update(chunk)
+    finally:
+        field_file.close()
+    return digest.hexdigest()
+
+
+def _max_chars():
+    return getattr(settings, 'FILE_INDEX_MAX_CHARS', 2000000)
+
+
+def detect_encoding(sample):
+    try:
+        sample.decode('utf-8')
+        return 'utf-8'
+    except UnicodeDecodeError as error:
+        # A multi-byte character cut at the end of the sample is still utf-8.
+        if error.start >= len(sample) - 3:
+            return 'utf-8'
+        return 'cp1250'
+
+
+def decoded_chunks(stream):
+    first = stream.read(CHUNK_SIZE)
+    decoder = codecs.getincrementaldecoder(detect_encoding(first))(errors='replace')
+    chunk = first
+    while chunk:
+        yield decoder.decode(chunk)
+        chunk = stream.read(CHUNK_SIZE)
+    yield decoder.decode(b'', final=True)
+
+
+def _limited(pieces):
+    limit = _max_chars()
+    parts = []
+    total = 0
+    for piece in pieces:
+        if total + len(piece) > limit:
+            parts.append(piece[:limit - total])
+            break
+        parts.append(piece)
+        total += len(piece)
+    return ''.join(parts)
+
+
+def extract_txt(stream):
+    return _limited(decoded_chunks(stream))
+
+
+def _lines(stream):
+    buffer = ''
+    for text in decoded_chunks(stream):
+        buffer += text
+        *lines, buffer = buffer.split('\n')
+        for line in lines:
+            yield line + '\n'
+    if buffer:
+        yield buffer
+
+
+def extract_csv(stream):
+    sample = stream.read(CHUNK_SIZE)
+    stream.seek(0)
+    try:
+        dialect = csv.Sniffer().sniff(sample.decode('utf-8', errors='replace'))
+    except csv.Error:
+        dialect = csv.excel
+    return _limited(' '.join(row) + '\n' for row in csv.reader(_lines(stream), dialect))
+
+
+def docx_styled_paragraphs(document):
+    """(style id or '', text) of every paragraph of an open word/document.xml, streamed."""
+    parts = []
+    style = ''
+    for event, element in iterparse(document, events=('end',)):
+        if element.tag == WORD_NS + 't' and element.text:
+            parts.append(element.text)
+        elif element.tag == WORD_NS + 'tab':
+            parts.append('\t')
+        elif element.tag == WORD_NS + 'pStyle':
+            style = element.get(WORD_NS + 'val', '')
+        elif element.tag == WORD_NS + 'p':
+            yield style, ''.join(parts) + '\n'
+            parts = []
+            style = ''
+            element.clear()
+
+
+def docx_paragraphs(document):
+    """Text of every paragraph of an open word/document.xml, streamed."""
+    for style, text in docx_styled_paragraphs(document):
+        yield text
+
+
+def extract_docx(stream):
+    with zipfile.ZipFile(stream) as archive:
+        with archive.open('word/document.xml') as document:
+            return _limited(docx_paragraphs(document))
+
+
+def _pdf_pages_text(reader):
+    for page in reader.pages:
+        yield (page.extract_text() or '') + '\n'
+
+
+def extract_pdf(stream):
+    """
+    Text of a PDF, page by page until FILE_INDEX_MAX_CHARS. PdfReader seeks
+    to the objects it needs, the file is never read into memory whole.
+    Without pypdf PDFs are not indexed.
+    """
+    try:
+        from pypdf import PdfReader
+        from pypdf.errors import PyPdfError
+    except ImportError:
+        return ''
+    try:
+        return _limited(_pdf_pages_text(PdfReader(stream)))
+    except PyPdfError:
+        return ''
+
+
+EXTRACTORS = {
+    'txt': extract_txt,
+    'csv': extract_csv,
+    'docx': extract_docx,
+    'pdf': extract_pdf,
+}
+
+
+def extract_text(field_file):
+    """Return the text content of an uploaded file or None for unsupported types."""
+    extension = field_file.name.rsplit('.', 1)[-1].lower()
+    extractor = EXTRACTORS.get(extension)
+    if extractor is None:
+        return None
+    field_file.open('rb')
+    try:
+        return extractor(field_file.file)
+    except (zipfile.BadZipFile, KeyError, SyntaxError, ValueError):
+        return ''
+    finally:
+        field_file.close()
+
@@ -4,7 +4,7 @@ from django.contrib.auth.models import User
 from django.contrib.auth.forms import UserCreationForm, ValidationError, PasswordChangeForm
 from django.contrib.auth import password_validation
 from .models import Projects, Tags, ProjectObjects, Files, MainFiles
-from .custom_validators import file_too_big
+from .custom_validators import file_too_big, FILE_EXTENSIONS, MAIN_FILE_EXTENSIONS
 from django.core.validators import FileExtensionValidator
 
 
@@ -112,6 +112,17 @@ class ProjectForm(ModelForm):
         }
 
 
+class ProjectImportForm(Form):
+
+    archive = forms.FileField(label='Archiwum projektu (ZIP)')
+    project = forms.ModelChoiceField(queryset=Projects.objects.none(), required=False, empty_label='Nowy projekt', label='Importuj do')
+    project_name = forms.CharField(max_length=64, required=False, label='Nazwa nowego projektu', help_text='Domyślnie nazwa z archiwum.')
+
+    def __init__(self, *args, user=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['project'].queryset = Projects.objects.filter(user=user, deleting=False)
+
+
 class TagForm(ModelForm):
     class Meta:
         model = Tags
@@ -162,6 +173,46 @@ class ProjectObjectAddConnectionForm(Form):
     connections = forms.ModelMultipleChoiceField(queryset=ProjectObjects.objects.none(), widget=forms.CheckboxSelectMultiple, required=False)
 
 
+class BulkEditForm(Form):
+
+    OPERATION_CHOICES = [
+        ('add_tags', 'Dodaj tagi'),
+        ('remove_tags', 'Usuń tagi'),
+        ('connect', 'Dodaj połączenia'),
+        ('disconnect', 'Usuń połączenia'),
+    ]
+
+    objects = forms.ModelMultipleChoiceField(queryset=ProjectObjects.objects.none(), widget=forms.MultipleHiddenInput)
+    operation = forms.ChoiceField(choices=OPERATION_CHOICES, label='Operacja')
+    tags = forms.ModelMultipleChoiceField(queryset=Tags.objects.none(), widget=forms.CheckboxSelectMultiple, required=False, label='Tagi')
+    targets = forms.CharField(required=False, label='Obiekty docelowe', help_text='Nazwy obiektów oddzielone przecinkami.')
+
+    def __init__(self, *args, project=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.project = project
+        self.fields['objects'].queryset = ProjectObjects.objects.filter(project=project)
+        self.fields['objects'].error_messages['required'] = 'Zaznacz przynajmniej jeden obiekt.'
+        self.fields['tags'].queryset = Tags.objects.filter(project=project)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        operation = cleaned_data.get('operation')
+
+        if operation in ('add_tags', 'remove_tags') and not cleaned_data.get('tags'):
+            self.add_error('tags', 'Wybierz przynajmniej jeden tag.')
+
+        if operation in ('connect', 'disconnect'):
+            names = [name.strip() for name in cleaned_data.get('targets', '').split(',') if name.strip()]
+            targets = dict(ProjectObjects.objects.filter(project=self.project, object_name__in=names).values_list('object_name', 'id'))
+            missing = [name for name in names if name not in targets]
+            if not names:
+                self.add_error('targets', 'Podaj przynajmniej jeden obiekt.')
+            elif missing:
+                self.add_error('targets', f'Nieznane obiekty: {", ".join(missing)}')
+            cleaned_data['target_ids'] = list(targets.values())
+        return cleaned_data
+
+
 class FilesForm(ModelForm):
 
     class Meta:
@@ -177,7 +228,7 @@ class FilesForm(ModelForm):
         file = cleaned_data.get('file')
 
         if file:
-            validator = FileExtensionValidator(['txt', 'docx', 'csv', 'pdf', 'jpg', 'png'])
+            validator = FileExtensionValidator(FILE_EXTENSIONS)
             if file_too_big(file):
                 self.add_error(None, ValidationError('Plik jest za duży. Maksymalny rozmiar to 5 MB.'))
             try:
@@ -211,7 +262,7 @@ class MainFilesForm(ModelForm):
         main_file = cleaned_data.get('file')
 
         if main_file:
-            validator = FileExtensionValidator(['txt', 'docx', 'csv'])
+            validator = FileExtensionValidator(MAIN_FILE_EXTENSIONS)
             if file_too_big(main_file):
                 self.add_error(None, ValidationError('Plik jest za duży. Maksymalny rozmiar to 5 MB.'))
             try:
@@ -0,0 +1,442 @@
+import threading
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+
+from .models import Projects, ProjectObjects
+
+
+DIRECTIONS = ('out', 'in', 'both')
+
+_through = ProjectObjects.connections.through
+CONNECTIONS_TABLE = _through._meta.db_table
+FROM_COLUMN = _through._meta.get_field('from_projectobjects').column
+TO_COLUMN = _through._meta.get_field('to_projectobjects').column
+OBJECTS_TABLE = ProjectObjects._meta.db_table
+
+
+def max_depth():
+    return getattr(settings, 'GRAPH_MAX_DEPTH', 5)
+
+
+def clamp_depth(value, default=1):
+    try:
+        depth = int(value)
+    except (TypeError, ValueError):
+        depth = default
+    return max(1, min(depth, max_depth()))
+
+
+def _step_sql(direction):
+    # Next node and join condition of one hop; written against the through
+    # table directly so every hop is an index lookup on from/to.
+    if direction == 'out':
+        return f'c.{TO_COLUMN}', f'c.{FROM_COLUMN} = hood.node'
+    if direction == 'in':
+        return f'c.{FROM_COLUMN}', f'c.{TO_COLUMN} = hood.node'
+    return (
+        f'CASE WHEN c.{FROM_COLUMN} = hood.node THEN c.{TO_COLUMN} ELSE c.{FROM_COLUMN} END',
+        f'(c.{FROM_COLUMN} = hood.node OR c.{TO_COLUMN} = hood.node)',
+    )
+
+
+def _neighbourhood_cte(direction):
+    # UNION drops repeated (node, depth) pairs, so cycles are bounded by the
+    # depth limit; nodes keeps the shortest distance of every object.
+    next_node, condition = _step_sql(direction)
+    return (
+        f'WITH RECURSIVE hood(node, depth) AS ('
+        f'SELECT %s, 0 '
+        f'UNION '
+        f'SELECT {next_node}, hood.depth + 1 FROM hood '
+        f'JOIN {CONNECTIONS_TABLE} c ON {condition} '
+        f'WHERE hood.depth < %s'
+        f'), '
+        f'nodes(node, depth) AS (SELECT node, MIN(depth) FROM hood GROUP BY node) '
+    )
+
+
+def neighbourhood(project_object, depth=1, direction='both'):
+    """
+    Objects reachable from project_object within depth hops, as a list of
+    (id, object_name, depth) ordered by depth and name. Computed with one
+    recursive CTE over the connections table.
+    """
+    if direction not in DIRECTIONS:
+        direction = 'both'
+    sql = (
+        _neighbourhood_cte(direction)
+        + f'SELECT o.id, o.object_name, nodes.depth FROM nodes '
+        f'JOIN {OBJECTS_TABLE} o ON o.id = nodes.node '
+        f'WHERE o.project_id = %s '
+        f'ORDER BY nodes.depth, o.object_name, o.id'
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [project_object.id, depth, project_object.project_id])
+        return cursor.fetchall()
+
+
+def neighbourhood_edges(project_object, depth=1, direction='both'):
+    """Connections (from_id, to_id) between the objects of the neighbourhood, both ends in its project."""
+    if direction not in DIRECTIONS:
+        direction = 'both'
+    sql = (
+        _neighbourhood_cte(direction)
+        + f'SELECT c.{FROM_COLUMN}, c.{TO_COLUMN} FROM {CONNECTIONS_TABLE} c '
+        f'JOIN nodes a ON a.node = c.{FROM_COLUMN} '
+        f'JOIN nodes b ON b.node = c.{TO_COLUMN} '
+        f'JOIN {OBJECTS_TABLE} oa ON oa.id = c.{FROM_COLUMN} '
+        f'JOIN {OBJECTS_TABLE} ob ON ob.id = c.{TO_COLUMN} '
+        f'WHERE oa.project_id = %s AND ob.project_id = %s'
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [project_object.id, depth, project_object.project_id, project_object.project_id])
+        return cursor.fetchall()
+
+
+class Adjacency:
+    """
+    Compressed (CSR) adjacency of one project's connections. Objects are
+    stored as positions in the sorted ids array; out_targets[out_offsets[i]:
+    out_offsets[i + 1]] are the positions i points to, in_* the reverse.
+
+    Instances are never modified: changes() returns a new adjacency sharing
+    the arrays and carrying the difference in a small overlay, which is
+    folded back into fresh arrays once it grows.
+    """
+
+    def __init__(self, edges):
+        ids = array('q', sorted({node for edge in edges for node in edge}))
+        size = len(ids)
+
+        out_counts = [0] * (size + 1)
+        in_counts = [0] * (size + 1)
+        positions = []
+        for source, target in edges:
+            source_position = bisect_left(ids, source)
+            target_position = bisect_left(ids, target)
+            positions.append((source_position, target_position))
+            out_counts[source_position + 1] += 1
+            in_counts[target_position + 1] += 1
+
+        for i in range(size):
+            out_counts[i + 1] += out_counts[i]
+            in_counts[i + 1] += in_counts[i]
+
+        out_targets = array('l', [0]) * len(positions)
+        in_targets = array('l', [0]) * len(positions)
+        out_fill = out_counts[:-1]
+        in_fill = in_counts[:-1]
+        for source_position, target_position in positions:
+            out_targets[out_fill[source_position]] = target_position
+            out_fill[source_position] += 1
+            in_targets[in_fill[target_position]] = source_position
+            in_fill[target_position] += 1
+
+        self.ids = ids
+        self.out_offsets = array('l', out_counts)
+        self.out_targets = out_targets
+        self.in_offsets = array('l', in_counts)
+        self.in_targets = in_targets
+        self.base_edges = len(positions)
+
+        self.added_out = {}
+        self.added_in = {}
+        self.removed = frozenset()
+        self.removed_nodes = frozenset()
+
+    @classmethod
+    def load(cls, project_id):
+        """Build the adjacency of a project from one scan of the connections table."""
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT c.{FROM_COLUMN}, c.{TO_COLUMN} FROM {CONNECTIONS_TABLE} c '
+                f'JOIN {OBJECTS_TABLE} o ON o.id = c.{FROM_COLUMN} '
+                f'WHERE o.project_id = %s',
+                [project_id],
+            )
+            return cls(cursor.fetchall())
+
+    def _position(self, object_id):
+        position = bisect_left(self.ids, object_id)
+        if position < len(self.ids) and self.ids[position] == object_id:
+            return position
+        return None
+
+    def _base(self, object_id, offsets, targets):
+        position = self._position(object_id)
+        if position is None:
+            return []
+        ids = self.ids
+        return [ids[target] for target in targets[offsets[position]:offsets[position + 1]]]
+
+    def successors(self, object_id):
+        if object_id in self.removed_nodes:
+            return []
+        result = self._base(object_id, self.out_offsets, self.out_targets)
+        if self.removed or self.removed_nodes:
+            result = [
+                target for target in result
+                if (object_id, target) not in self.removed and target not in self.removed_nodes
+            ]
+        result.extend(self.added_out.get(object_id, ()))
+        return result
+
+    def predecessors(self, object_id):
+        if object_id in self.removed_nodes:
+            return []
+        result = self._base(object_id, self.in_offsets, self.in_targets)
+        if self.removed or self.removed_nodes:
+            result = [
+                source for source in result
+                if (source, object_id) not in self.removed and source not in self.removed_nodes
+            ]
+        result.extend(self.added_in.get(object_id, ()))
+        return result
+
+    def neighbours(self, object_id, direction='both'):
+        if direction == 'out':
+            return self.successors(object_id)
+        if direction == 'in':
+            return self.predecessors(object_id)
+        return self.successors(object_id) + self.predecessors(object_id)
+
+    def out_degree(self, object_id):
+        return len(self.successors(object_id))
+
+    def in_degree(self, object_id):
+        return len(self.predecessors(object_id))
+
+    def has_edge(self, source, target):
+        return target in self.successors(source)
+
+    def edges(self):
+        ids = self.ids
+        for position, source in enumerate(ids):
+            if source in self.removed_nodes:
+                continue
+            for target in self.out_targets[self.out_offsets[position]:self.out_offsets[position + 1]]:
+                target = ids[target]
+                if (source, target) not in self.removed and target not in self.removed_nodes:
+                    yield source, target
+        for source, targets in self.added_out.items():
+            for target in targets:
+                yield source, target
+
+    @property
+    def overlay_size(self):
+        return sum(len(targets) for targets in self.added_out.values()) + len(self.removed) + len(self.removed_nodes)
+
+    @property
+    def nbytes(self):
+        arrays = (self.ids, self.out_offsets, self.out_targets, self.in_offsets, self.in_targets)
+        # Rough cost of the python objects kept in the overlay.
+        return sum(len(values) * values.itemsize for values in arrays) + 128 * self.overlay_size
+
+    def changes(self, added=(), removed=(), removed_nodes=()):
+        """Return a new adjacency with the edges added/removed. Repeated changes are no-ops."""
+        added_out = {source: list(targets) for source, targets in self.added_out.items()}
+        added_in = {target: list(sources) for target, sources in self.added_in.items()}
+        removed_edges = set(self.removed)
+        deleted_nodes = set(self.removed_nodes) | set(removed_nodes)
+
+        for node in removed_nodes:
+            for target in added_out.pop(node, ()):
+                if node in added_in.get(target, ()):
+                    added_in[target].remove(node)
+            for source in added_in.pop(node, ()):
+                if node in added_out.get(source, ()):
+                    added_out[source].remove(node)
+
+        def in_base(source, target):
+            return (source, target) not in removed_edges and target in self._base(source, self.out_offsets, self.out_targets)
+
+        for source, target in removed:
+            if target in added_out.get(source, ()):
+                added_out[source].remove(target)
+                added_in[target].remove(source)
+            elif in_base(source, target):
+                removed_edges.add((source, target))
+
+        for source, target in added:
+            if source in deleted_nodes or target in deleted_nodes or target in added_out.get(source, ()):
+                continue
+            if (source, target) in removed_edges:
+                removed_edges.discard((source, target))
+            elif not in_base(source, target):
+                added_out.setdefault(source, []).append(target)
+                added_in.setdefault(target, []).append(source)
+
+        result = Adjacency.__new__(Adjacency)
+        result.__dict__.update(self.__dict__)
+        result.added_out = added_out
+        result.added_in = added_in
+        result.removed = frozenset(removed_edges)
+        result.removed_nodes = frozenset(deleted_nodes)
+
+        if result.overlay_size > max(1024, result.base_edges // 8):
+            return Adjacency(list(result.edges()))
+        return result
+
+
+def _reverse(direction):
+    return {'out': 'in', 'in': 'out'}.get(direction, 'both')
+
+
+def shortest_path(adjacency, source_id, target_id, direction='both'):
+    """
+    Ids on the shortest path from source_id to target_id (both included) or
+    None when they are not connected. Bidirectional BFS: the smaller frontier
+    is expanded each round, from the target side along reversed edges.
+    """
+    if source_id == target_id:
+        return [source_id]
+
+    forward_parents = {source_id: None}
+    backward_parents = {target_id: None}
+    forward_frontier = [source_id]
+    backward_frontier = [target_id]
+    backward_direction = _reverse(direction)
+    meeting = None
+
+    while forward_frontier and backward_frontier and meeting is None:
+        if len(forward_frontier) <= len(backward_frontier):
+            frontier, parents, other, step_direction = forward_frontier, forward_parents, backward_parents, direction
+        else:
+            frontier, parents, other, step_direction = backward_frontier, backward_parents, forward_parents, backward_direction
+
+        next_frontier = []
+        for node in frontier:
+            for neighbour in adjacency.neighbours(node, step_direction):
+                if neighbour in parents:
+                    continue
+                parents[neighbour] = node
+                if neighbour in other:
+                    meeting = neighbour
+                    break
+                next_frontier.append(neighbour)
+            if meeting is not None:
+                break
+
+        if frontier is forward_frontier:
+            forward_frontier = next_frontier
+        else:
+            backward_frontier = next_frontier
+
+    if meeting is None:
+        return None
+
+    path = []
+    node = meeting
+    while node is not None:
+        path.append(node)
+        node = forward_parents[node]
+    path.reverse()
+    node = backward_parents[meeting]
+    while node is not None:
+        path.append(node)
+        node = backward_parents[node]
+    return path
+
+
+def are_connected(adjacency, source_id, target_id, direction='both'):
+    return shortest_path(adjacency, source_id, target_id, direction) is not None
+
+
+class AdjacencyCache:
+    """
+    Per-process LRU of project adjacencies bounded by GRAPH_CACHE_BYTES.
+    Entries carry the project's graph_version; an entry whose version does
+    not match the database (another worker changed the graph) is reloaded.
+    """
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def budget(self):
+        return getattr(settings, 'GRAPH_CACHE_BYTES', 64 * 1024 * 1024)
+
+    def get(self, project_id, version):
+        with self._lock:
+            entry = self._entries.get(project_id)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(project_id)
+                return entry[1]
+        return None
+
+    def put(self, project_id, version, adjacency):
+        with self._lock:
+            self._discard(project_id)
+            size = adjacency.nbytes
+            if size > self.budget():
+                return
+            self._entries[project_id] = (version, adjacency, size)
+            self._bytes += size
+            while self._bytes > self.budget():
+                oldest = next(iter(self._entries))
+                self._discard(oldest)
+
+    def discard(self, project_id):
+        with self._lock:
+            self._discard(project_id)
+
+    def _discard(self, project_id):
+        entry = self._entries.pop(project_id, None)
+        if entry is not None:
+            self._bytes -= entry[2]
+
+    def apply(self, project_id, version, **changes):
+        """Move an entry from version - 1 to version by applying the changes, or drop it."""
+        with self._lock:
+            entry = self._entries.get(project_id)
+        if entry is None:
+            return
+        if version is None or entry[0] != version - 1 or not changes:
+            self.discard(project_id)
+            return
+        self.put(project_id, version, entry[1].changes(**changes))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    @property
+    def nbytes(self):
+        return self._bytes
+
+
+adjacency_cache = AdjacencyCache()
+
+
+def get_adjacency(project):
+    """Adjacency of the project, from the process cache when its version is current."""
+    adjacency = adjacency_cache.get(project.id, project.graph_version)
+    if adjacency is None:
+        adjacency = Adjacency.load(project.id)
+        adjacency_cache.put(project.id, project.graph_version, adjacency)
+    return adjacency
+
+
+def _apply_connection_changes(project_id, changes):
+    version = Projects.objects.filter(id=project_id).values_list('graph_version', flat=True).first()
+    adjacency_cache.apply(project_id, version, **changes)
+
+
+def connections_changed(project_id, added=(), removed=(), removed_nodes=(), invalidate=False):
+    """
+    Record a change of the project's connections: bump graph_version so
+    other processes reload, and update this process' cached adjacency once
+    the transaction commits. invalidate=True drops the cached entry instead.
+    """
+    Projects.objects.filter(id=project_id).update(graph_version=F('graph_version') + 1)
+    changes = {}
+    if not invalidate:
+        changes = {'added': list(added), 'removed': list(removed), 'removed_nodes': list(removed_nodes)}
+    transaction.on_commit(lambda: _apply_connection_changes(project_id, changes))
@@ -0,0 +1,302 @@
+import hashlib
+import json
+import os
+import re
+import tempfile
+import zipfile
+
+from django.core.files.base import File
+from django.db import IntegrityError, transaction
+
+from .archives import ARCHIVE_FORMAT, FILE_KINDS, MANIFEST_NAME, READ_SIZE
+from .custom_validators import FILE_EXTENSIONS, IMAGE_EXTENSIONS, MAIN_FILE_EXTENSIONS
+from .graph import connections_changed
+from .metadata import count_file, detect_mime_type
+from .models import Files, ProjectObjects, Projects, Tags
+from .quotas import QuotaExceeded, add_usage, check_quota
+from .search import index_file, index_objects
+from .storage import add_reference
+from .tag_filter import bump_tags_version
+from .tasks import schedule
+from .thumbnails import thumbnail_file
+
+
+BATCH_SIZE = 500
+
+TagLinks = ProjectObjects.tags.through
+Connections = ProjectObjects.connections.through
+
+FILE_KIND_EXTENSIONS = {
+    'file': FILE_EXTENSIONS,
+    'main_file': MAIN_FILE_EXTENSIONS,
+}
+
+_SHA256 = re.compile(r'^[0-9a-f]{64}$')
+
+# Conflicts listed in the summary, the counts are always complete.
+MAX_REPORTED = 50
+
+
+class ArchiveImportError(ValueError):
+    pass
+
+
+def _max_length(model, field):
+    return model._meta.get_field(field).max_length
+
+
+def read_manifest(archive):
+    try:
+        with archive.open(MANIFEST_NAME) as manifest_file:
+            manifest = json.load(manifest_file)
+    except KeyError:
+        raise ArchiveImportError('Archiwum nie zawiera pliku manifest.json.')
+    except (ValueError, UnicodeDecodeError):
+        raise ArchiveImportError('Plik manifest.json jest uszkodzony.')
+    if not isinstance(manifest, dict) or manifest.get('format') != ARCHIVE_FORMAT:
+        raise ArchiveImportError('Nieobsługiwana wersja archiwum.')
+    return manifest
+
+
+class _Summary:
+    """Counts of created rows and names that were already taken or invalid."""
+
+    def __init__(self):
+        self.created = {'tags': 0, 'objects': 0, 'tag_links': 0, 'connections': 0, 'files': 0}
+        self.conflicts = {'tags': [], 'objects': [], 'files': []}
+        self.invalid = {'tags': [], 'objects': [], 'files': []}
+
+    def report(self, kind, name, invalid=False):
+        names = (self.invalid if invalid else self.conflicts)[kind]
+        names.append(name)
+
+    def as_dict(self, project):
+        return {
+            'project': project,
+            'created': self.created,
+            'conflicts': {kind: {'count': len(names), 'names': names[:MAX_REPORTED]} for kind, names in self.conflicts.items()},
+            'invalid': {kind: {'count': len(names), 'names': names[:MAX_REPORTED]} for kind, names in self.invalid.items()},
+        }
+
+
+def _valid_name(name, max_length):
+    return isinstance(name, str) and name.strip() == name and 0 < len(name) <= max_length
+
+
+def _import_tags(project, manifest, summary):
+    """Create the missing tags; names taken already map to the existing tag. Returns name -> id."""
+    existing = dict(Tags.objects.filter(project=project, user=project.user).values_list('tag_name', 'id'))
+    max_length = _max_length(Tags, 'tag_name')
+    new = []
+    names = list(manifest.get('tags') or [])
+    for node in manifest.get('objects') or []:
+        names.extend(node.get('tags') or [])
+    for name in dict.fromkeys(names):
+        if not _valid_name(name, max_length):
+            summary.report('tags', str(name), invalid=True)
+        elif name in existing:
+            summary.report('tags', name)
+        else:
+            new.append(Tags(tag_name=name, project=project, user=project.user))
+    Tags.objects.bulk_create(new, batch_size=BATCH_SIZE)
+    summary.created['tags'] = len(new)
+    return dict(Tags.objects.filter(project=project, user=project.user).values_list('tag_name', 'id'))
+
+
+def _import_objects(project, manifest, summary):
+    """Create the objects; names taken already map to the existing object. Returns archive id -> id."""
+    existing = dict(ProjectObjects.objects.filter(project=project, user=project.user).values_list('object_name', 'id'))
+    max_length = _max_length(ProjectObjects, 'object_name')
+    new = []
+    names = {}
+    for node in manifest.get('objects') or []:
+        name = node.get('name')
+        if not _valid_name(name, max_length):
+            summary.report('objects', str(name), invalid=True)
+            continue
+        names[node.get('id')] = name
+        if name in existing:
+            summary.report('objects', name)
+            continue
+        existing[name] = None
+        new.append(ProjectObjects(
+            object_name=name,
+            object_description=node.get('description') or '',
+            project=project,
+            user=project.user,
+        ))
+    ProjectObjects.objects.bulk_create(new, batch_size=BATCH_SIZE)
+    summary.created['objects'] = len(new)
+
+    ids = dict(ProjectObjects.objects.filter(project=project, user=project.user).values_list('object_name', 'id'))
+    # bulk_create skips update_search_index_on_object_save.
+    index_objects([
+        (ids[project_object.object_name], project_object.object_name, project_object.object_description, project.id)
+        for project_object in new
+    ])
+    return {archive_id: ids[name] for archive_id, name in names.items()}
+
+
+def _import_links(project, manifest, object_ids, tag_ids, summary):
+    links = {
+        (object_ids[node['id']], tag_ids[name])
+        for node in manifest.get('objects') or [] if node.get('id') in object_ids
+        for name in node.get('tags') or [] if name in tag_ids
+    }
+    before = TagLinks.objects.filter(projectobjects__project=project).count()
+    TagLinks.objects.bulk_create(
+        [TagLinks(projectobjects_id=object_id, tags_id=tag_id) for object_id, tag_id in sorted(links)],
+        batch_size=BATCH_SIZE, ignore_conflicts=True,
+    )
+    summary.created['tag_links'] = TagLinks.objects.filter(projectobjects__project=project).count() - before
+
+    edges = set()
+    for edge in manifest.get('connections') or []:
+        if isinstance(edge, list) and len(edge) == 2 and edge[0] in object_ids and edge[1] in object_ids:
+            source, target = object_ids[edge[0]], object_ids[edge[1]]
+            if source != target:
+                edges.add((source, target))
+    before = Connections.objects.filter(from_projectobjects__project=project).count()
+    Connections.objects.bulk_create(
+        [Connections(from_projectobjects_id=source, to_projectobjects_id=target) for source, target in sorted(edges)],
+        batch_size=BATCH_SIZE, ignore_conflicts=True,
+    )
+    summary.created['connections'] = Connections.objects.filter(from_projectobjects__project=project).count() - before
+
+
+def _extract(archive, path, storage, sha256, filename):
+    """
+    Copy an archive entry into the blob store in chunks, checking its hash.
+    Returns (size, head, True when the blob was written now) or None.
+    """
+    directory = os.path.dirname(storage.blob_path(sha256))
+    os.makedirs(directory, exist_ok=True)
+    descriptor, temporary = tempfile.mkstemp(dir=directory, suffix='.part')
+    digest = hashlib.sha256()
+    head = b''
+    try:
+        with os.fdopen(descriptor, 'wb') as output, archive.open(path) as source:
+            for chunk in iter(lambda: source.read(READ_SIZE), b''):
+                head = head or chunk[:16]
+                digest.update(chunk)
+                output.write(chunk)
+        if digest.hexdigest() != sha256:
+            return None
+        written = not os.path.exists(storage.blob_path(sha256))
+        storage.link_blob(temporary, sha256, filename)
+        return os.path.getsize(temporary), head, written
+    except (KeyError, zipfile.BadZipFile):
+        return None
+    finally:
+        os.remove(temporary)
+
+
+def _import_files(project, manifest, archive, summary, new_blobs):
+    models = dict(FILE_KINDS)
+    taken = {
+        kind: set(model.objects.filter(project=project, user=project.user).values_list('file_name', flat=True))
+        for kind, model in FILE_KINDS
+    }
+    rows = {kind: [] for kind in models}
+    sources = {}
+    for entry in manifest.get('files') or []:
+        kind = entry.get('kind')
+        name = entry.get('file_name')
+        filename = os.path.basename(entry.get('filename') or '')
+        sha256 = str(entry.get('sha256') or '')
+        model = models.get(kind)
+        if (
+            model is None or not _valid_name(name, _max_length(model, 'file_name')) or not _SHA256.match(sha256)
+            or filename.rsplit('.', 1)[-1].lower() not in FILE_KIND_EXTENSIONS[kind]
+        ):
+            summary.report('files', str(name), invalid=True)
+            continue
+        if name in taken[kind]:
+            summary.report('files', name)
+            continue
+
+        storage = model._meta.get_field('file').storage
+        extracted = _extract(archive, entry.get('path') or '', storage, sha256, filename)
+        if extracted is None:
+            summary.report('files', name, invalid=True)
+            continue
+        size, head, written = extracted
+        if written:
+            new_blobs.append((storage, sha256))
+        taken[kind].add(name)
+        sources[sha256] = entry.get('path')
+        blob_name = storage.blob_file_name(sha256, filename, max_length=_max_length(model, 'file'))
+        rows[kind].append(model(
+            file_name=name, file=blob_name, sha256=sha256, size=size,
+            mime_type=detect_mime_type(head, filename), project=project, user=project.user,
+        ))
+
+    size = sum(row.size for kind_rows in rows.values() for row in kind_rows)
+    try:
+        check_quota(project, project.user_id, size)
+    except QuotaExceeded as exception:
+        raise ArchiveImportError(str(exception))
+    add_usage(project.id, project.user_id, size)
+
+    for kind, model in FILE_KINDS:
+        storage = model._meta.get_field('file').storage
+        model.objects.bulk_create(rows[kind], batch_size=BATCH_SIZE)
+        summary.created['files'] += len(rows[kind])
+        created = model.objects.filter(project=project, file_name__in=[row.file_name for row in rows[kind]])
+        # bulk_create sends no signals, do what add_blob_reference_on_upload and
+        # the other post_save receivers do for a single upload (usage is added above).
+        for pk, name, sha256, size in created.values_list('pk', 'file', 'sha256', 'size'):
+            with archive.open(sources[sha256]) as source:
+                add_reference(name, size, storage, File(source))
+            schedule(count_file, model, pk)
+            schedule(index_file, model, pk)
+            if model is Files and name.rsplit('.', 1)[-1].lower() in IMAGE_EXTENSIONS:
+                schedule(thumbnail_file, model, pk)
+
+
+def import_archive(archive_file, user, project=None, project_name=None):
+    """
+    Recreate the contents of a project archive in one transaction, into the
+    given project or into a new one. Tags, objects, tag links, connections
+    and files are inserted with bulk_create in batches; names that are
+    taken already are not created again but reported, tags and connections
+    of the archive then point at the existing tag or object.
+    Returns the summary dict.
+    """
+    try:
+        archive = zipfile.ZipFile(archive_file)
+    except (zipfile.BadZipFile, OSError):
+        raise ArchiveImportError('Plik nie jest archiwum ZIP.')
+
+    with archive:
+        manifest = read_manifest(archive)
+        summary = _Summary()
+        new_blobs = []
+        try:
+            with transaction.atomic():
+                if project is None:
+                    project_name = project_name or (manifest.get('project') or {}).get('name') or ''
+                    if not _valid_name(project_name, _max_length(Projects, 'project_name')):
+                        raise ArchiveImportError('Niepoprawna nazwa projektu.')
+                    try:
+                        with transaction.atomic():
+                            project = Projects.objects.create(project_name=project_name, user=user)
+                    except IntegrityError:
+                        raise ArchiveImportError('Projekt o tej nazwie już istnieje.')
+
+                try:
+                    tag_ids = _import_tags(project, manifest, summary)
+                    object_ids = _import_objects(project, manifest, summary)
+                    _import_links(project, manifest, object_ids, tag_ids, summary)
+                    _import_files(project, manifest, archive, summary, new_blobs)
+                except (AttributeError, TypeError):
+                    raise ArchiveImportError('Plik manifest.json jest uszkodzony.')
+
+                bump_tags_version(project.id)
+                connections_changed(project.id, invalidate=True)
+        except BaseException:
+            # Blobs written for a rolled back import have no references.
+            for storage, sha256 in new_blobs:
+                storage.delete(storage.blob_file_name(sha256, 'blob'))
+            raise
+    return summary.as_dict(project)
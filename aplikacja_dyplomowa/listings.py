@@ -0,0 +1,60 @@
+from .pagination import keyset_paginate
+
+
+FILE_ORDERINGS = {
+    'uploaded': ('Data przesłania', ('uploadedAt', 'id')),
+    '-uploaded': ('Data przesłania (od najnowszych)', ('-uploadedAt', '-id')),
+    'name': ('Nazwa', ('file_name', 'id')),
+    '-name': ('Nazwa (malejąco)', ('-file_name', '-id')),
+    'size': ('Rozmiar', ('size', 'id')),
+    '-size': ('Rozmiar (od największych)', ('-size', '-id')),
+    'type': ('Typ', ('mime_type', 'id')),
+}
+
+# Query parameter -> lookup on the stored metadata; sizes are given in kB.
+FILE_FILTERS = {
+    'min_size': ('size__gte', 1024),
+    'max_size': ('size__lte', 1024),
+    'min_pages': ('page_count__gte', 1),
+    'min_words': ('word_count__gte', 1),
+    'min_lines': ('line_count__gte', 1),
+}
+
+
+def _number(value):
+    try:
+        return max(int(value), 0)
+    except (TypeError, ValueError):
+        return None
+
+
+def file_listing(request, queryset):
+    """
+    One page of Files/MainFiles sorted (?sort=) and filtered (?type=,
+    ?min_size=, ...) by the stored metadata columns, with the values for
+    the filter form. Nothing is read from storage.
+    """
+    types = list(queryset.exclude(mime_type='').order_by('mime_type').values_list('mime_type', flat=True).distinct())
+
+    filters = {}
+    selected_type = request.GET.get('type', '')
+    if selected_type:
+        queryset = queryset.filter(mime_type=selected_type)
+    for parameter, (lookup, unit) in FILE_FILTERS.items():
+        value = _number(request.GET.get(parameter))
+        if value is not None:
+            queryset = queryset.filter(**{lookup: value * unit})
+            filters[parameter] = value
+
+    sort = request.GET.get('sort', 'uploaded')
+    if sort not in FILE_ORDERINGS:
+        sort = 'uploaded'
+    page = keyset_paginate(request, queryset, FILE_ORDERINGS[sort][1])
+
+    return page, {
+        'sort': sort,
+        'sorts': [(key, label) for key, (label, _) in FILE_ORDERINGS.items()],
+        'types': types,
+        'selected_type': selected_type,
+        'filters': filters,
+    }
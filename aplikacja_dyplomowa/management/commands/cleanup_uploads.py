@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from aplikacja_dyplomowa.uploads import cleanup_stale_uploads
+
+
+class Command(BaseCommand):
+    help = 'Removes unfinished chunked uploads together with their temporary files.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, default=24, help='Remove uploads not touched for this many hours.')
+
+    def handle(self, *args, **options):
+        removed = cleanup_stale_uploads(hours=options['hours'])
+        self.stdout.write(self.style.SUCCESS(f'Removed {removed} unfinished uploads.'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from aplikacja_dyplomowa.storage import BATCH_SIZE, compress_blobs
+
+
+class Command(BaseCommand):
+    help = 'Compresses stored files whose extension is in STORAGE_COMPRESS_EXTENSIONS and are still kept plain.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Rows read per query.')
+
+    def handle(self, *args, **options):
+        compressed, saved = compress_blobs(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Compressed {compressed} files, saved {saved} bytes.'))
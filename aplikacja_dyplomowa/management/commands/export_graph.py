@@ -0,0 +1,30 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from aplikacja_dyplomowa.exports import GRAPH_FORMATS, export_graph
+from aplikacja_dyplomowa.models import Projects
+
+
+class Command(BaseCommand):
+    help = 'Streams the object graph of a project as JSON Lines, GraphML or a CSV edge list.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('project_id', type=int)
+        parser.add_argument('--format', choices=sorted(GRAPH_FORMATS), default='jsonl')
+        parser.add_argument('--output', help='Output file, standard output when omitted.')
+
+    def handle(self, *args, **options):
+        try:
+            project = Projects.objects.get(id=options['project_id'])
+        except Projects.DoesNotExist:
+            raise CommandError('Project does not exist.')
+
+        chunks = export_graph(project, options['format'])
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8', newline='') as output:
+                for chunk in chunks:
+                    output.write(chunk)
+        else:
+            for chunk in chunks:
+                sys.stdout.write(chunk)
@@ -0,0 +1,28 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from aplikacja_dyplomowa.archives import project_archive
+from aplikacja_dyplomowa.models import Projects
+
+
+class Command(BaseCommand):
+    help = 'Streams a ZIP archive with the manifest and the stored files of a project.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('project_id', type=int)
+        parser.add_argument('--output', help='Output file, standard output when omitted.')
+
+    def handle(self, *args, **options):
+        try:
+            project = Projects.objects.get(id=options['project_id'])
+        except Projects.DoesNotExist:
+            raise CommandError('Project does not exist.')
+
+        if options['output']:
+            with open(options['output'], 'wb') as output:
+                for chunk in project_archive(project):
+                    output.write(chunk)
+        else:
+            for chunk in project_archive(project):
+                sys.stdout.buffer.write(chunk)
@@ -0,0 +1,42 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from aplikacja_dyplomowa.imports import ArchiveImportError, import_archive
+from aplikacja_dyplomowa.models import Projects
+
+
+class Command(BaseCommand):
+    help = 'Recreates a project from an archive made by export_project, in a new or an existing project.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('archive')
+        parser.add_argument('--user', required=True, help='Username of the owner.')
+        parser.add_argument('--project', type=int, help='Import into this project instead of a new one.')
+        parser.add_argument('--name', help='Name of the new project, the archived name when omitted.')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError('User does not exist.')
+        project = None
+        if options['project'] is not None:
+            try:
+                project = Projects.objects.get(id=options['project'], user=user)
+            except Projects.DoesNotExist:
+                raise CommandError('Project does not exist.')
+
+        try:
+            with open(options['archive'], 'rb') as archive:
+                summary = import_archive(archive, user, project=project, project_name=options['name'])
+        except (OSError, ArchiveImportError) as exception:
+            raise CommandError(str(exception))
+
+        created = ', '.join(f'{kind}: {count}' for kind, count in summary['created'].items())
+        self.stdout.write(self.style.SUCCESS(f'Imported into project {summary["project"].id} ({created}).'))
+        for kind, conflicts in summary['conflicts'].items():
+            if conflicts['count']:
+                self.stdout.write(f'Names of {kind} taken already ({conflicts["count"]}): {", ".join(conflicts["names"])}')
+        for kind, invalid in summary['invalid'].items():
+            if invalid['count']:
+                self.stdout.write(f'Invalid {kind} skipped ({invalid["count"]}): {", ".join(invalid["names"])}')
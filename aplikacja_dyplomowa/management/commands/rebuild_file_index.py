@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from aplikacja_dyplomowa.search import rebuild_file_index
+
+
+class Command(BaseCommand):
+    help = 'Extracts and indexes the text of uploaded files that are not indexed yet.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Drop extracted texts and index every file again.')
+
+    def handle(self, *args, **options):
+        indexed = rebuild_file_index(full=options['full'])
+        self.stdout.write(self.style.SUCCESS(f'Processed {indexed} files.'))
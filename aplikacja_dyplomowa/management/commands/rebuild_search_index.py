@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from aplikacja_dyplomowa.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the full-text search index of project objects.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        total = rebuild_index(batch_size=options['batch_size'])
+        if total is None:
+            self.stdout.write(self.style.WARNING('FTS5 is not available for this database, search uses LIKE.'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Indexed {total} objects.'))
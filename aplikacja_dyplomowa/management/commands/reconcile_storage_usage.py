@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from aplikacja_dyplomowa.quotas import BATCH_SIZE, reconcile_usage
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the per-user and per-project storage usage counters from the sizes of the files on disk.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8, help='Threads reading file sizes.')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Rows read per query.')
+
+    def handle(self, *args, **options):
+        checked, corrected = reconcile_usage(workers=options['workers'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Checked {checked} files, corrected {corrected} sizes.'))
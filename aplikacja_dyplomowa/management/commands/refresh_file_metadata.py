@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from aplikacja_dyplomowa.metadata import refresh_metadata
+from aplikacja_dyplomowa.models import Files, MainFiles
+
+
+class Command(BaseCommand):
+    help = 'Fills size, MIME type and page/word/line counts of files uploaded before they were stored.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Read the metadata of every file again.')
+
+    def handle(self, *args, **options):
+        refreshed = sum(refresh_metadata(model, everything=options['all']) for model in (Files, MainFiles))
+        self.stdout.write(self.style.SUCCESS(f'Refreshed metadata of {refreshed} files.'))
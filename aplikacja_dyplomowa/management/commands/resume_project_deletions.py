@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from aplikacja_dyplomowa.deletion import resume_deletions
+
+
+class Command(BaseCommand):
+    help = 'Finishes project deletions that were interrupted, for example by a restart.'
+
+    def handle(self, *args, **options):
+        resumed = resume_deletions()
+        self.stdout.write(self.style.SUCCESS(f'Finished {resumed} project deletions.'))
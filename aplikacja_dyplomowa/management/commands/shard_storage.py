@@ -0,0 +1,23 @@
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from aplikacja_dyplomowa.storage import BATCH_SIZE, move_to_blobs, shard_blobs
+
+
+class Command(BaseCommand):
+    help = (
+        'Moves files stored before content-addressed storage into the blob store, rewriting '
+        'Files.file and MainFiles.file in batches, then moves flat blobs into hashed shards. Can be run again.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Rows updated per transaction.')
+
+    def handle(self, *args, **options):
+        moved, missing, freed = move_to_blobs(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Moved {moved} files into blobs, freed {freed} bytes.'))
+        if missing:
+            self.stdout.write(self.style.WARNING(f'{missing} files were missing on disk and were skipped.'))
+
+        blobs, derivatives = shard_blobs(default_storage)
+        self.stdout.write(self.style.SUCCESS(f'Moved {blobs} blobs and {derivatives} derivative folders into shards.'))
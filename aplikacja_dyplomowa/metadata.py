@@ -0,0 +1,187 @@
+import mimetypes
+import re
+import zipfile
+from xml.etree.ElementTree import iterparse
+
+from .extraction import decoded_chunks, docx_paragraphs, extract_pdf
+
+
+_WORD = re.compile(r'\S+')
+
+DOCX_MIME_TYPE = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+
+_SIGNATURES = (
+    (b'%PDF-', 'application/pdf'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'\xff\xd8\xff', 'image/jpeg'),
+)
+
+EXTENSION_MIME_TYPES = {
+    'txt': 'text/plain',
+    'csv': 'text/csv',
+    'docx': DOCX_MIME_TYPE,
+    'pdf': 'application/pdf',
+    'jpg': 'image/jpeg',
+    'png': 'image/png',
+}
+
+APP_NS = '{http://schemas.openxmlformats.org/officeDocument/2006/extended-properties}'
+
+
+def detect_mime_type(head, name):
+    """MIME type from the first bytes of a file, the extension decides only for text and zip based formats."""
+    for signature, mime_type in _SIGNATURES:
+        if head.startswith(signature):
+            return mime_type
+    extension = name.rsplit('.', 1)[-1].lower()
+    if extension == 'docx' and head.startswith(b'PK\x03\x04'):
+        return DOCX_MIME_TYPE
+    if extension in ('txt', 'csv') and b'\x00' not in head:
+        return 'text/csv' if extension == 'csv' else 'text/plain'
+    return mimetypes.guess_type(name)[0] or 'application/octet-stream'
+
+
+def content_matches_extension(head, name):
+    """False when the first bytes show that a file is not what its extension says."""
+    extension = name.rsplit('.', 1)[-1].lower()
+    expected = EXTENSION_MIME_TYPES.get(extension)
+    if extension in ('txt', 'csv'):
+        return detect_mime_type(head, name) == expected
+    # Binary formats have to start with their signature, the extension alone is not enough.
+    signatures = _SIGNATURES + ((b'PK\x03\x04', DOCX_MIME_TYPE),)
+    return any(head.startswith(signature) for signature, mime_type in signatures if mime_type == expected)
+
+
+def read_head(field_file, size=16):
+    """First bytes of a stored file or of a file that is being uploaded."""
+    if not field_file._committed:
+        upload = field_file.file
+        upload.seek(0)
+        head = upload.read(size)
+        upload.seek(0)
+        return head
+    with field_file.storage.open(field_file.name, 'rb') as stored:
+        return stored.read(size)
+
+
+class _TextCounter:
+    """Words and lines of a text fed in pieces, words cut between pieces are counted once."""
+
+    def __init__(self):
+        self.words = 0
+        self.lines = 0
+        self.in_word = False
+        self.open_line = False
+
+    def feed(self, piece):
+        if not piece:
+            return
+        words = sum(1 for _ in _WORD.finditer(piece))
+        if self.in_word and not piece[0].isspace():
+            words -= 1
+        self.words += words
+        self.lines += piece.count('\n')
+        self.in_word = not piece[-1].isspace()
+        self.open_line = not piece.endswith('\n')
+
+    @property
+    def line_count(self):
+        return self.lines + (1 if self.open_line else 0)
+
+
+def _count_text(stream):
+    counter = _TextCounter()
+    for piece in decoded_chunks(stream):
+        counter.feed(piece)
+    return counter
+
+
+def _docx_pages(archive):
+    # Word keeps the page count of the last save in docProps/app.xml.
+    try:
+        with archive.open('docProps/app.xml') as properties:
+            for event, element in iterparse(properties, events=('end',)):
+                if element.tag == APP_NS + 'Pages' and element.text and element.text.isdigit():
+                    return int(element.text)
+    except KeyError:
+        pass
+    return None
+
+
+def _pdf_pages(stream):
+    try:
+        from pypdf import PdfReader
+        from pypdf.errors import PyPdfError
+    except ImportError:
+        return None
+    try:
+        return len(PdfReader(stream).pages)
+    except PyPdfError:
+        return None
+
+
+def count_contents(field_file):
+    """{page_count, word_count, line_count} of a stored file, None where they do not apply."""
+    counts = {'page_count': None, 'word_count': None, 'line_count': None}
+    extension = field_file.name.rsplit('.', 1)[-1].lower()
+    field_file.open('rb')
+    stream = field_file.file
+    try:
+        if extension == 'txt':
+            counter = _count_text(stream)
+            counts['word_count'] = counter.words
+            counts['line_count'] = counter.line_count
+        elif extension == 'csv':
+            counts['line_count'] = _count_text(stream).line_count
+        elif extension == 'docx':
+            counter = _TextCounter()
+            with zipfile.ZipFile(stream) as archive:
+                with archive.open('word/document.xml') as document:
+                    for paragraph in docx_paragraphs(document):
+                        counter.feed(paragraph)
+                counts['page_count'] = _docx_pages(archive)
+            counts['word_count'] = counter.words
+        elif extension == 'pdf':
+            counts['page_count'] = _pdf_pages(stream)
+            stream.seek(0)
+            counter = _TextCounter()
+            counter.feed(extract_pdf(stream))
+            counts['word_count'] = counter.words
+    except (zipfile.BadZipFile, KeyError, SyntaxError, ValueError):
+        pass
+    finally:
+        field_file.close()
+    return counts
+
+
+def store_metadata(instance):
+    """Set size and MIME type of a Files/MainFiles instance before it is saved; the counts come later."""
+    instance.size = instance.file.size
+    instance.mime_type = detect_mime_type(read_head(instance.file), instance.file.name)
+    instance.page_count = instance.word_count = instance.line_count = None
+
+
+def count_file(model, pk):
+    """Background task filling the page/word/line counts of a row."""
+    instance = model.objects.filter(pk=pk).first()
+    if instance is None or not instance.file:
+        return
+    model.objects.filter(pk=pk).update(**count_contents(instance.file))
+
+
+def refresh_metadata(model, batch_size=200, everything=False):
+    """Fill the metadata of rows that have none yet (all rows with everything=True). Returns the number of rows."""
+    rows = model.objects.exclude(file='').order_by('pk')
+    if not everything:
+        rows = rows.filter(mime_type='')
+    refreshed = 0
+    for instance in rows.iterator(chunk_size=batch_size):
+        try:
+            store_metadata(instance)
+        except OSError:
+            continue
+        model.objects.filter(pk=instance.pk).update(
+            size=instance.size, mime_type=instance.mime_type, **count_contents(instance.file),
+        )
+        refreshed += 1
+    return refreshed
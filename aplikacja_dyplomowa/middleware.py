@@ -0,0 +1,60 @@
+import os
+from urllib.parse import unquote
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import Http404
+from django.utils.http import parse_http_date_safe
+
+from .downloads import internal_url, range_response
+
+
+OFFLOAD_HEADERS = ('X-Accel-Redirect', 'X-Sendfile')
+
+
+class FileDeliveryStandInMiddleware:
+    """
+    Local stand-in for the front proxy: sends the file named in the
+    X-Accel-Redirect or X-Sendfile header the way nginx or Apache would,
+    byte ranges included. Only active with FILE_DELIVERY_STANDIN = True.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'FILE_DELIVERY_STANDIN', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if response.status_code != 200 or not any(header in response for header in OFFLOAD_HEADERS):
+            return response
+
+        path = self.internal_path(response)
+        if path is None or not os.path.isfile(path):
+            raise Http404('Plik nie istnieje.')
+
+        delivered = range_response(
+            request, open(path, 'rb'), os.path.getsize(path),
+            response.get('ETag'), parse_http_date_safe(response.get('Last-Modified', '')),
+        )
+        if 'Content-Disposition' in delivered:
+            del delivered['Content-Disposition']
+        for header, value in response.items():
+            if header not in OFFLOAD_HEADERS and header != 'Content-Length':
+                delivered[header] = value
+        delivered.cookies = response.cookies
+        return delivered
+
+    def internal_path(self, response):
+        media_root = os.path.abspath(settings.MEDIA_ROOT)
+        if 'X-Accel-Redirect' in response:
+            url = response['X-Accel-Redirect']
+            if not url.startswith(internal_url()):
+                return None
+            path = os.path.abspath(os.path.join(media_root, unquote(url[len(internal_url()):])))
+        else:
+            path = os.path.abspath(response['X-Sendfile'])
+        # Like an internal location, only files under MEDIA_ROOT can be sent.
+        if not path.startswith(media_root + os.sep):
+            return None
+        return path
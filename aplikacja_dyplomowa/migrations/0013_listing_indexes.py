@@ -0,0 +1,33 @@
+# Generated by Django 4.2 on 2026-10-18 10:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('aplikacja_dyplomowa', '0012_remove_files_tags'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='files',
+            index=models.Index(fields=['project', 'uploadedAt', 'id'], name='files_project_uploaded_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='mainfiles',
+            index=models.Index(fields=['project', 'uploadedAt', 'id'], name='mainfiles_project_uploaded_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='projectobjects',
+            index=models.Index(fields=['project', 'object_name', 'id'], name='objects_project_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='projects',
+            index=models.Index(fields=['user', 'createdAt', 'id'], name='projects_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tags',
+            index=models.Index(fields=['project', 'tag_name', 'id'], name='tags_project_name_idx'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+from django.db import migrations, OperationalError
+
+
+FTS_TABLE = 'aplikacja_dyplomowa_projectobjects_fts'
+
+
+def create_fts_table(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != 'sqlite':
+        return
+    try:
+        schema_editor.execute(
+            f'CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5('
+            "object_name, object_description, project_id UNINDEXED, "
+            "tokenize='unicode61 remove_diacritics 2')"
+        )
+    except OperationalError:
+        # SQLite built without FTS5, search falls back to LIKE.
+        return
+    schema_editor.execute(
+        f'INSERT INTO {FTS_TABLE} (rowid, object_name, object_description, project_id) '
+        'SELECT id, object_name, object_description, project_id FROM aplikacja_dyplomowa_projectobjects'
+    )
+
+
+def drop_fts_table(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('aplikacja_dyplomowa', '0013_listing_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts_table, drop_fts_table),
+    ]
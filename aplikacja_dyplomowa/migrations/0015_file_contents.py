@@ -0,0 +1,55 @@
+# Generated by Django 4.2 on 2026-10-18 10:36
+
+from django.db import migrations, models, OperationalError
+
+
+FILE_FTS_TABLE = 'aplikacja_dyplomowa_filecontents_fts'
+
+
+def create_file_fts_table(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    try:
+        schema_editor.execute(
+            f'CREATE VIRTUAL TABLE IF NOT EXISTS {FILE_FTS_TABLE} USING fts5('
+            "text, content='aplikacja_dyplomowa_filecontents', content_rowid='id', "
+            "tokenize='unicode61 remove_diacritics 2')"
+        )
+    except OperationalError:
+        # SQLite built without FTS5, file search falls back to LIKE.
+        pass
+
+
+def drop_file_fts_table(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(f'DROP TABLE IF EXISTS {FILE_FTS_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('aplikacja_dyplomowa', '0014_projectobjects_fts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FileContents',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sha256', models.CharField(max_length=64, unique=True)),
+                ('text', models.TextField()),
+                ('extractedAt', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='files',
+            name='sha256',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='mainfiles',
+            name='sha256',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+        migrations.RunPython(create_file_fts_table, drop_file_fts_table),
+    ]
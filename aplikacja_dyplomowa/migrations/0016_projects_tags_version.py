@@ -0,0 +1,18 @@
+# Generated by Django 4.2 on 2026-10-18 10:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('aplikacja_dyplomowa', '0015_file_contents'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='projects',
+            name='tags_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2 on 2026-10-18 10:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('aplikacja_dyplomowa', '0016_projects_tags_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='projects',
+            name='graph_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
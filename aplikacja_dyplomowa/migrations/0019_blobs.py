@@ -0,0 +1,33 @@
+# Generated by Django 4.2 on 2026-10-18 10:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('aplikacja_dyplomowa', '0018_chunked_uploads'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Blobs',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sha256', models.CharField(max_length=64, unique=True)),
+                ('size', models.BigIntegerField()),
+                ('references', models.PositiveIntegerField(default=0)),
+                ('createdAt', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='files',
+            name='file',
+            field=models.FileField(max_length=255, upload_to=''),
+        ),
+        migrations.AlterField(
+            model_name='mainfiles',
+            name='file',
+            field=models.FileField(max_length=255, upload_to=''),
+        ),
+    ]
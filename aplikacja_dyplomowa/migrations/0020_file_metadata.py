@@ -0,0 +1,101 @@
+# Generated by Django 4.2 on 2026-10-18 10:53
+
+from django.db import migrations, models
+
+
+def fill_sizes(apps, schema_editor):
+    # Sizes are cheap to read and listings sort by them; MIME types and
+    # counts are filled by the refresh_file_metadata command.
+    for model_name in ('Files', 'MainFiles'):
+        model = apps.get_model('aplikacja_dyplomowa', model_name)
+        for pk, name in model.objects.exclude(file='').values_list('pk', 'file').iterator():
+            try:
+                size = model._meta.get_field('file').storage.size(name)
+            except OSError:
+                continue
+            model.objects.filter(pk=pk).update(size=size)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('aplikacja_dyplomowa', '0019_blobs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='files',
+            name='line_count',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='files',
+            name='mime_type',
+            field=models.CharField(blank=True, max_length=128),
+        ),
+        migrations.AddField(
+            model_name='files',
+            name='page_count',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='files',
+            name='size',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='files',
+            name='word_count',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='mainfiles',
+            name='line_count',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='mainfiles',
+            name='mime_type',
+            field=models.CharField(blank=True, max_length=128),
+        ),
+        migrations.AddField(
+            model_name='mainfiles',
+            name='page_count',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='mainfiles',
+            name='size',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='mainfiles',
+            name='word_count',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='files',
+            index=models.Index(fields=['project', 'size', 'id'], name='files_project_size_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='files',
+            index=models.Index(fields=['project', 'mime_type', 'id'], name='files_project_mime_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='files',
+            index=models.Index(fields=['project', 'file_name', 'id'], name='files_project_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='mainfiles',
+            index=models.Index(fields=['project', 'size', 'id'], name='mainfiles_project_size_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='mainfiles',
+            index=models.Index(fields=['project', 'mime_type', 'id'], name='mainfiles_project_mime_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='mainfiles',
+            index=models.Index(fields=['project', 'file_name', 'id'], name='mainfiles_project_name_idx'),
+        ),
+        migrations.RunPython(fill_sizes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 4.2 on 2026-10-18 10:59
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('aplikacja_dyplomowa', '0020_file_metadata'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProjectDeletions',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('project_name', models.CharField(max_length=64)),
+                ('total', models.PositiveIntegerField(default=0)),
+                ('deleted', models.PositiveIntegerField(default=0)),
+                ('createdAt', models.DateTimeField(auto_now_add=True)),
+                ('finishedAt', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='projects',
+            unique_together=set(),
+        ),
+        migrations.AddField(
+            model_name='projects',
+            name='deleting',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddConstraint(
+            model_name='projects',
+            constraint=models.UniqueConstraint(condition=models.Q(('deleting', False)), fields=('project_name', 'user'), name='projects_unique_name'),
+        ),
+        migrations.AddField(
+            model_name='projectdeletions',
+            name='project',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='aplikacja_dyplomowa.projects'),
+        ),
+        migrations.AddField(
+            model_name='projectdeletions',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 4.2 on 2026-10-18 11:03
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_usage(apps, schema_editor):
+    # Sums of the stored sizes; reconcile_storage_usage rebuilds them from disk.
+    Projects = apps.get_model('aplikacja_dyplomowa', 'Projects')
+    StorageUsages = apps.get_model('aplikacja_dyplomowa', 'StorageUsages')
+    projects = {}
+    users = {}
+    for model_name in ('Files', 'MainFiles'):
+        model = apps.get_model('aplikacja_dyplomowa', model_name)
+        rows = model.objects.values('project_id', 'user_id').annotate(total=models.Sum('size'))
+        for row in rows:
+            projects[row['project_id']] = projects.get(row['project_id'], 0) + row['total']
+            users[row['user_id']] = users.get(row['user_id'], 0) + row['total']
+    for project_id, used in projects.items():
+        Projects.objects.filter(id=project_id).update(storage_used=used)
+    StorageUsages.objects.bulk_create([StorageUsages(user_id=user_id, used=used) for user_id, used in users.items()])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('aplikacja_dyplomowa', '0021_project_deletions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='projects',
+            name='storage_used',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='StorageUsages',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('used', models.BigIntegerField(default=0)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.RunPython(fill_usage, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2 on 2026-10-18 11:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('aplikacja_dyplomowa', '0022_storage_usage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chunkeduploads',
+            name='claimedAt',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
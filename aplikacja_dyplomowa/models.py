@@ -1,6 +1,9 @@
 from django.db import models
 from django.contrib.auth.models import User
 import os
+import uuid
+
+from .custom_validators import IMAGE_EXTENSIONS
 
 
 # Create your models here.
@@ -11,9 +14,23 @@ class Projects(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     createdAt = models.DateTimeField(auto_now_add=True)
     updatedAt = models.DateTimeField(auto_now=True)
+    tags_version = models.PositiveIntegerField(default=0)
+    graph_version = models.PositiveIntegerField(default=0)
+    # Set when a background deletion starts, the project is hidden from then on.
+    deleting = models.BooleanField(default=False)
+    # Bytes of the project's files, kept up to date by aplikacja_dyplomowa.quotas.
+    storage_used = models.BigIntegerField(default=0)
 
     class Meta:
-        unique_together = ['project_name', 'user']
+        constraints = [
+            # A project that is being deleted does not keep its name taken.
+            models.UniqueConstraint(
+                fields=['project_name', 'user'], condition=models.Q(deleting=False), name='projects_unique_name',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'createdAt', 'id'], name='projects_user_created_idx'),
+        ]
 
     def __repr__(self):
         return f'{self.project_name}'
@@ -31,6 +48,9 @@ class Tags(models.Model):
 
     class Meta:
         unique_together = ['tag_name', 'project', 'user']
+        indexes = [
+            models.Index(fields=['project', 'tag_name', 'id'], name='tags_project_name_idx'),
+        ]
 
     def __repr__(self):
         return f'{self.tag_name}'
@@ -51,6 +71,9 @@ class ProjectObjects(models.Model):
 
     class Meta:
         unique_together = ['object_name', 'project', 'user']
+        indexes = [
+            models.Index(fields=['project', 'object_name', 'id'], name='objects_project_name_idx'),
+        ]
 
     def __str__(self):
         return f'{self.object_name}'
@@ -58,7 +81,13 @@ class ProjectObjects(models.Model):
 
 class Files(models.Model):
     file_name = models.CharField(max_length=16)
-    file = models.FileField()
+    file = models.FileField(max_length=255)
+    sha256 = models.CharField(max_length=64, blank=True, db_index=True)
+    size = models.BigIntegerField(default=0)
+    mime_type = models.CharField(max_length=128, blank=True)
+    page_count = models.PositiveIntegerField(null=True, blank=True)
+    word_count = models.PositiveIntegerField(null=True, blank=True)
+    line_count = models.PositiveIntegerField(null=True, blank=True)
     project = models.ForeignKey(Projects, on_delete=models.CASCADE)
     uploadedAt = models.DateTimeField(auto_now_add=True)
     updatedAt = models.DateTimeField(auto_now=True)
@@ -66,6 +95,12 @@ class Files(models.Model):
 
     class Meta:
         unique_together = ['file_name', 'project', 'user']
+        indexes = [
+            models.Index(fields=['project', 'uploadedAt', 'id'], name='files_project_uploaded_idx'),
+            models.Index(fields=['project', 'size', 'id'], name='files_project_size_idx'),
+            models.Index(fields=['project', 'mime_type', 'id'], name='files_project_mime_idx'),
+            models.Index(fields=['project', 'file_name', 'id'], name='files_project_name_idx'),
+        ]
 
     def __str__(self):
         return f'{self.file_name}'
@@ -73,10 +108,19 @@ class Files(models.Model):
     def filename(self):
         return os.path.basename(self.file.name)
 
+    def is_image(self):
+        return self.file.name.rsplit('.', 1)[-1].lower() in IMAGE_EXTENSIONS
+
 
 class MainFiles(models.Model):
     file_name = models.CharField(max_length=16)
-    file = models.FileField()
+    file = models.FileField(max_length=255)
+    sha256 = models.CharField(max_length=64, blank=True, db_index=True)
+    size = models.BigIntegerField(default=0)
+    mime_type = models.CharField(max_length=128, blank=True)
+    page_count = models.PositiveIntegerField(null=True, blank=True)
+    word_count = models.PositiveIntegerField(null=True, blank=True)
+    line_count = models.PositiveIntegerField(null=True, blank=True)
     project = models.ForeignKey(Projects, on_delete=models.CASCADE)
     uploadedAt = models.DateTimeField(auto_now_add=True)
     updatedAt = models.DateTimeField(auto_now=True)
@@ -84,9 +128,84 @@ class MainFiles(models.Model):
 
     class Meta:
         unique_together = ['file_name', 'project', 'user']
+        indexes = [
+            models.Index(fields=['project', 'uploadedAt', 'id'], name='mainfiles_project_uploaded_idx'),
+            models.Index(fields=['project', 'size', 'id'], name='mainfiles_project_size_idx'),
+            models.Index(fields=['project', 'mime_type', 'id'], name='mainfiles_project_mime_idx'),
+            models.Index(fields=['project', 'file_name', 'id'], name='mainfiles_project_name_idx'),
+        ]
 
     def __str__(self):
         return f'{self.file_name}'
 
     def filename(self):
         return os.path.basename(self.file.name)
+
+
+class Blobs(models.Model):
+    sha256 = models.CharField(max_length=64, unique=True)
+    size = models.BigIntegerField()
+    references = models.PositiveIntegerField(default=0)
+    createdAt = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'{self.sha256}'
+
+
+class FileContents(models.Model):
+    sha256 = models.CharField(max_length=64, unique=True)
+    text = models.TextField()
+    extractedAt = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'{self.sha256}'
+
+
+class ChunkedUploads(models.Model):
+    KIND_CHOICES = [
+        ('file', 'Plik'),
+        ('main_file', 'Plik z fabułą'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    kind = models.CharField(max_length=16, choices=KIND_CHOICES)
+    file_name = models.CharField(max_length=16)
+    filename = models.CharField(max_length=255)
+    size = models.BigIntegerField()
+    offset = models.BigIntegerField(default=0)
+    chunks = models.JSONField(default=list)
+    # Set while a request writes a chunk or finishes the upload.
+    claimedAt = models.DateTimeField(null=True, blank=True)
+    project = models.ForeignKey(Projects, on_delete=models.CASCADE)
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    createdAt = models.DateTimeField(auto_now_add=True)
+    updatedAt = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'{self.filename}'
+
+
+class StorageUsages(models.Model):
+    user = models.OneToOneField(User, on_delete=models.CASCADE)
+    used = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f'{self.user}'
+
+
+class ProjectDeletions(models.Model):
+    project = models.ForeignKey(Projects, on_delete=models.SET_NULL, null=True)
+    project_name = models.CharField(max_length=64)
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    total = models.PositiveIntegerField(default=0)
+    deleted = models.PositiveIntegerField(default=0)
+    createdAt = models.DateTimeField(auto_now_add=True)
+    finishedAt = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f'{self.project_name}'
+
+    def progress(self):
+        if self.finishedAt is not None or not self.total:
+            return 100
+        return min(self.deleted * 100 // self.total, 99)
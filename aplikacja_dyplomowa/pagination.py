@@ -0,0 +1,141 @@
+import base64
+import binascii
+import json
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+
+def get_page_size(request):
+    default = getattr(settings, 'PAGINATION_PAGE_SIZE', 50)
+    maximum = getattr(settings, 'PAGINATION_MAX_PAGE_SIZE', 200)
+    try:
+        size = int(request.GET.get('size', default))
+    except ValueError:
+        size = default
+    return max(1, min(size, maximum))
+
+
+def encode_cursor(values):
+    raw = json.dumps([str(value) for value in values]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def _field_name(field):
+    return field.lstrip('-')
+
+
+def _reversed(field):
+    return field[1:] if field.startswith('-') else f'-{field}'
+
+
+def decode_cursor(cursor, model, ordering):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if not isinstance(values, list) or len(values) != len(ordering):
+            return None
+        return [model._meta.get_field(_field_name(field)).to_python(value) for field, value in zip(ordering, values)]
+    except (ValueError, TypeError, binascii.Error, ValidationError):
+        return None
+
+
+def _seek(ordering, values, forward):
+    # (a, b) > (x, y)  <=>  a > x OR (a = x AND b > y), written so the
+    # composite index on the ordering columns can be used for the range scan.
+    # Descending fields ('-name') compare the other way round.
+    condition = Q()
+    for i, field in enumerate(ordering):
+        lookup = 'gt' if forward != field.startswith('-') else 'lt'
+        term = Q(**{f'{_field_name(field)}__{lookup}': values[i]})
+        for prev_field, prev_value in zip(ordering[:i], values[:i]):
+            term &= Q(**{_field_name(prev_field): prev_value})
+        condition |= term
+    return condition
+
+
+class KeysetPage:
+
+    def __init__(self, request, object_list, ordering, has_next, has_previous):
+        self.request = request
+        self.object_list = object_list
+        self.ordering = ordering
+        self.has_next = has_next
+        self.has_previous = has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def _cursor(self, obj):
+        return encode_cursor(getattr(obj, _field_name(field)) for field in self.ordering)
+
+    def _query(self, key, obj):
+        params = self.request.GET.copy()
+        params.pop('after', None)
+        params.pop('before', None)
+        params[key] = self._cursor(obj)
+        return params.urlencode()
+
+    @property
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+    @property
+    def next_query(self):
+        if self.has_next and self.object_list:
+            return self._query('after', self.object_list[-1])
+        return ''
+
+    @property
+    def previous_query(self):
+        if self.has_previous and self.object_list:
+            return self._query('before', self.object_list[0])
+        return ''
+
+    @property
+    def first_query(self):
+        params = self.request.GET.copy()
+        params.pop('after', None)
+        params.pop('before', None)
+        return params.urlencode()
+
+
+def keyset_paginate(request, queryset, ordering):
+    """
+    Return one page of queryset ordered by the ordering fields ('-name'
+    for descending, the last one must be unique). The page position is taken from the
+    after/before cursors in the query string, so fetching any page costs
+    one index range scan regardless of how deep it is.
+    """
+    ordering = tuple(ordering)
+    size = get_page_size(request)
+    model = queryset.model
+
+    after = request.GET.get('after')
+    before = request.GET.get('before')
+    values = None
+    forward = True
+    if after:
+        values = decode_cursor(after, model, ordering)
+    elif before:
+        values = decode_cursor(before, model, ordering)
+        forward = values is None
+
+    if values is not None:
+        queryset = queryset.filter(_seek(ordering, values, forward))
+
+    if forward:
+        rows = list(queryset.order_by(*ordering)[:size + 1])
+        has_more = len(rows) > size
+        rows = rows[:size]
+        return KeysetPage(request, rows, ordering, has_next=has_more, has_previous=values is not None)
+
+    rows = list(queryset.order_by(*[_reversed(field) for field in ordering])[:size + 1])
+    has_more = len(rows) > size
+    rows = rows[:size]
+    rows.reverse()
+    return KeysetPage(request, rows, ordering, has_next=True, has_previous=has_more)
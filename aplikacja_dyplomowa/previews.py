@@ -0,0 +1,208 @@
+import csv
+import itertools
+import json
+import math
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+from django.conf import settings
+
+from .extraction import CHUNK_SIZE, detect_encoding
+from .thumbnails import content_sha256
+
+
+INDEX_NAME = 'csv_index.json'
+
+# Decompressed copy of a compressed CSV, pages are read from it so seeking
+# to an offset does not inflate everything before it.
+DATA_NAME = 'csv_data.csv'
+
+# Indexes written with another version are built again.
+INDEX_VERSION = 1
+
+# Longer lines are taken as a broken file, the index stops before them.
+MAX_LINE = 1024 * 1024
+
+# csv.Sniffer takes time quadratic in the sample on quoted data, a few
+# kilobytes are enough to tell the dialect.
+SNIFF_SIZE = 8 * 1024
+
+_UTF8_BOM = b'\xef\xbb\xbf'
+
+_DELIMITERS = ',;\t|'
+
+_DIALECT_FIELDS = ('delimiter', 'quotechar', 'doublequote', 'escapechar', 'skipinitialspace')
+
+
+def page_size():
+    return getattr(settings, 'CSV_PREVIEW_ROWS', 50)
+
+
+def index_step():
+    return getattr(settings, 'CSV_PREVIEW_INDEX_STEP', 1000)
+
+
+def is_csv(field_file):
+    return field_file.name.rsplit('.', 1)[-1].lower() == 'csv'
+
+
+class _Lines:
+    """Decoded lines of a binary stream for csv.reader; offset is the byte position after the last line read."""
+
+    def __init__(self, stream, offset, encoding):
+        self.stream = stream
+        self.offset = offset
+        self.encoding = encoding
+
+    def __iter__(self):
+        for line in iter(lambda: self.stream.readline(MAX_LINE), b''):
+            if len(line) == MAX_LINE and not line.endswith(b'\n'):
+                raise csv.Error('line too long')
+            self.offset += len(line)
+            yield line.decode(self.encoding, errors='replace')
+
+
+def _sniff(sample):
+    """csv.reader arguments and whether the first row is a header, guessed from the start of the file."""
+    # The last line of the sample is usually cut.
+    text = sample.rpartition('\n')[0] or sample
+    sniffer = csv.Sniffer()
+    try:
+        dialect = sniffer.sniff(text, delimiters=_DELIMITERS)
+    except csv.Error:
+        dialect = csv.excel
+    try:
+        header = sniffer.has_header(text)
+    except csv.Error:
+        header = False
+    return {field: getattr(dialect, field) for field in _DIALECT_FIELDS}, header
+
+
+def build_index(path, step):
+    """
+    Parse a CSV once and note the byte offset of every step-th row,
+    together with the encoding, dialect, header and column count. A file
+    that can not be parsed to the end is indexed up to the broken row.
+    """
+    with open(path, 'rb') as stream:
+        sample = stream.read(CHUNK_SIZE)
+        encoding = detect_encoding(sample)
+        start = len(_UTF8_BOM) if sample.startswith(_UTF8_BOM) else 0
+        dialect, has_header = _sniff(sample[start:start + SNIFF_SIZE].decode(encoding, errors='replace'))
+        stream.seek(start)
+
+        lines = _Lines(stream, start, encoding)
+        reader = csv.reader(lines, **dialect)
+        header = None
+        offsets = []
+        rows = columns = 0
+        complete = True
+        try:
+            if has_header:
+                header = next(reader, None)
+                columns = len(header or ())
+            position = lines.offset
+            for row in reader:
+                if rows % step == 0:
+                    offsets.append(position)
+                position = lines.offset
+                rows += 1
+                columns = max(columns, len(row))
+        except csv.Error:
+            complete = False
+
+    return {
+        'version': INDEX_VERSION,
+        'encoding': encoding,
+        'dialect': dialect,
+        'header': header,
+        'columns': columns,
+        'rows': rows,
+        'complete': complete,
+        'step': step,
+        'offsets': offsets,
+    }
+
+
+@contextmanager
+def _replacing(path, mode='wb'):
+    # Written under a temporary name and renamed, readers never see half a file.
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    descriptor, temporary = tempfile.mkstemp(dir=directory, suffix='.part')
+    try:
+        with os.fdopen(descriptor, mode) as output:
+            yield output
+        os.replace(temporary, path)
+    except BaseException:
+        os.remove(temporary)
+        raise
+
+
+def source_path(instance, sha256):
+    """Local path of the plain bytes of a stored CSV; compressed blobs are decompressed once into the derivative cache."""
+    field_file = instance.file
+    storage = field_file.storage
+    if not getattr(storage, 'is_compressed', lambda name: False)(field_file.name):
+        return field_file.path
+    path = storage.derivative_path(sha256, DATA_NAME)
+    if not os.path.exists(path):
+        with storage.open(field_file.name, 'rb') as source, _replacing(path) as output:
+            shutil.copyfileobj(source, output, CHUNK_SIZE)
+    return path
+
+
+def csv_index(instance, sha256, path):
+    """Row index of a stored CSV read from path, from the derivative cache or built and cached on first use."""
+    step = index_step()
+    index_path = instance.file.storage.derivative_path(sha256, INDEX_NAME)
+    try:
+        with open(index_path) as cached:
+            index = json.load(cached)
+        if index.get('version') == INDEX_VERSION and index.get('step') == step:
+            return index
+    except (OSError, ValueError):
+        pass
+    index = build_index(path, step)
+    with _replacing(index_path, 'w') as output:
+        json.dump(index, output)
+    return index
+
+
+def read_rows(path, index, first, count):
+    """Data rows first to first + count - 1, parsed from the nearest indexed offset on."""
+    if first >= index['rows']:
+        return []
+    step = index['step']
+    with open(path, 'rb') as stream:
+        stream.seek(index['offsets'][first // step])
+        reader = csv.reader(_Lines(stream, 0, index['encoding']), **index['dialect'])
+        rows = []
+        try:
+            rows.extend(itertools.islice(reader, first % step, first % step + count))
+        except csv.Error:
+            pass
+    return rows
+
+
+def preview_page(instance, number):
+    """One page of rows of a CSV file, numbered from 1; numbers out of range give the nearest page."""
+    sha256 = content_sha256(instance)
+    path = source_path(instance, sha256)
+    index = csv_index(instance, sha256, path)
+    size = page_size()
+    pages = max(1, math.ceil(index['rows'] / size))
+    number = min(max(number, 1), pages)
+    first = (number - 1) * size
+    return {
+        'header': index['header'],
+        'rows': read_rows(path, index, first, size),
+        'first_row': first + 1,
+        'columns': index['columns'],
+        'total_rows': index['rows'],
+        'complete': index['complete'],
+        'number': number,
+        'pages': pages,
+    }
@@ -0,0 +1,107 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .models import Files, MainFiles, Projects, StorageUsages
+
+
+BATCH_SIZE = 500
+
+
+class QuotaExceeded(Exception):
+    pass
+
+
+def user_quota():
+    return getattr(settings, 'STORAGE_QUOTA_PER_USER', None)
+
+
+def project_quota():
+    return getattr(settings, 'STORAGE_QUOTA_PER_PROJECT', None)
+
+
+def user_usage(user_id):
+    return StorageUsages.objects.filter(user_id=user_id).values_list('used', flat=True).first() or 0
+
+
+def remaining(project, user_id):
+    """Bytes that may still be uploaded to the project, None when there is no limit."""
+    limits = []
+    if project_quota() is not None:
+        used = Projects.objects.filter(id=project.id).values_list('storage_used', flat=True).first() or 0
+        limits.append(project_quota() - used)
+    if user_quota() is not None:
+        limits.append(user_quota() - user_usage(user_id))
+    return max(min(limits), 0) if limits else None
+
+
+def check_quota(project, user_id, size):
+    """Raise QuotaExceeded when size more bytes do not fit in the user's or the project's quota."""
+    left = remaining(project, user_id)
+    if left is not None and size > left:
+        raise QuotaExceeded(f'Przekroczono limit miejsca. Pozostało {left // 1024} kB.')
+
+
+def add_usage(project_id, user_id, delta):
+    """Move both counters by delta bytes, atomically with F() so concurrent uploads do not lose updates."""
+    if not delta:
+        return
+    Projects.objects.filter(id=project_id).update(storage_used=F('storage_used') + delta)
+    if StorageUsages.objects.filter(user_id=user_id).update(used=F('used') + delta):
+        return
+    try:
+        with transaction.atomic():
+            StorageUsages.objects.create(user_id=user_id, used=delta)
+    except IntegrityError:
+        StorageUsages.objects.filter(user_id=user_id).update(used=F('used') + delta)
+
+
+def _size_on_disk(storage, name):
+    try:
+        # The original size, also for blobs kept compressed.
+        return storage.size(name)
+    except OSError:
+        return None
+
+
+def reconcile_usage(workers=8, batch_size=BATCH_SIZE):
+    """
+    Rebuild the counters from the sizes on disk. The files are stat'ed by
+    a pool of threads a batch at a time; stored sizes that differ are
+    corrected on the way. Returns (rows checked, sizes corrected).
+    """
+    projects = {}
+    users = {}
+    checked = corrected = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for model in (Files, MainFiles):
+            storage = model._meta.get_field('file').storage
+            last_pk = 0
+            while True:
+                rows = list(
+                    model.objects.filter(pk__gt=last_pk).exclude(file='').order_by('pk')
+                    .values_list('pk', 'file', 'size', 'project_id', 'user_id')[:batch_size]
+                )
+                if not rows:
+                    break
+                last_pk = rows[-1][0]
+                sizes = executor.map(lambda row: _size_on_disk(storage, row[1]), rows)
+                for (pk, _, size, project_id, user_id), actual in zip(rows, sizes):
+                    if actual is not None and actual != size:
+                        model.objects.filter(pk=pk).update(size=actual)
+                        size = actual
+                        corrected += 1
+                    projects[project_id] = projects.get(project_id, 0) + size
+                    users[user_id] = users.get(user_id, 0) + size
+                checked += len(rows)
+
+    with transaction.atomic():
+        Projects.objects.exclude(id__in=projects).update(storage_used=0)
+        for project_id, used in projects.items():
+            Projects.objects.filter(id=project_id).update(storage_used=used)
+        StorageUsages.objects.exclude(user_id__in=users).update(used=0)
+        for user_id, used in users.items():
+            StorageUsages.objects.update_or_create(user_id=user_id, defaults={'used': used})
+    return checked, corrected
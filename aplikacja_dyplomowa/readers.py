@@ -0,0 +1,226 @@
+import json
+import os
+import re
+import tempfile
+import zipfile
+from contextlib import contextmanager
+
+from django.conf import settings
+
+from .extraction import CHUNK_SIZE, detect_encoding, docx_styled_paragraphs
+from .thumbnails import content_sha256
+
+
+INDEX_NAME = 'reader_index.json'
+
+# Text of a docx or of a compressed txt, written once as utf-8; segments are
+# read from it, as offsets can not be seeked to in the stored file.
+TEXT_NAME = 'reader_text.txt'
+
+# Indexes written with another version are built again.
+INDEX_VERSION = 3
+
+READER_EXTENSIONS = ('txt', 'docx')
+
+MAX_LINE = 1024 * 1024
+
+MAX_TITLE = 100
+
+# Optional short title after a separator: "Rozdział 3. Powrót", "Chapter IV: The Storm".
+# Sentence punctuation is not allowed in it, so prose that starts like a heading stays prose.
+_TITLE = r'(?:\s*[.:\-–—]\s*[^.!?;]{0,60}[^.!?;,:\s])?'
+
+# Whole-line headings: markdown, a keyword with a number or an upper case
+# Roman numeral, or such a numeral alone. Only the keywords ignore case.
+_HEADING = re.compile(
+    r'^(?:#{1,6}\s+\S.*'
+    r'|(?i:rozdział|rozdzial|chapter|część|czesc|part)\s+(?:\d+|[IVXLCDM]+)\.?' + _TITLE +
+    r'|(?i:prolog|prologue|epilog|epilogue)' + _TITLE +
+    r'|[IVXLCDM]+\.?)$'
+)
+
+# Style ids of Word headings; Polish Word calls them Nagwek1, Nagwek2...
+_HEADING_STYLE = re.compile(r'^(heading|nagwek|nagłówek|title|tytu)', re.IGNORECASE)
+
+
+class ReaderError(ValueError):
+    pass
+
+
+def segment_size():
+    return getattr(settings, 'PLOT_READER_SEGMENT_BYTES', 64 * 1024)
+
+
+def has_reader(field_file):
+    return field_file.name.rsplit('.', 1)[-1].lower() in READER_EXTENSIONS
+
+
+def _clean(text):
+    return text.strip().lstrip('\ufeff')
+
+
+def _is_heading(text):
+    text = _clean(text)
+    return 0 < len(text) <= MAX_TITLE and _HEADING.match(text) is not None
+
+
+class _Segments:
+    """
+    Byte ranges of a text fed line by line: a new segment starts at every
+    heading, and chapters longer than limit bytes are cut at the next line.
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.segments = []
+        self.start = self.position = 0
+        self.title = ''
+        self.part = 1
+        self.line_start = True
+
+    def _close(self):
+        if self.position > self.start:
+            title = self.title if self.part == 1 or not self.title else f'{self.title} ({self.part})'
+            self.segments.append([self.start, self.position - self.start, title])
+            self.part += 1
+        self.start = self.position
+
+    def feed(self, line, text, heading):
+        if heading:
+            self._close()
+            self.title = _clean(text)[:MAX_TITLE]
+            self.part = 1
+        elif self.line_start and self.position - self.start >= self.limit:
+            self._close()
+        self.position += len(line)
+        self.line_start = line.endswith(b'\n')
+
+    def finish(self):
+        self._close()
+        return self.segments
+
+
+@contextmanager
+def _replacing(path, mode='wb'):
+    # Written under a temporary name and renamed, readers never see half a file.
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    descriptor, temporary = tempfile.mkstemp(dir=directory, suffix='.part')
+    try:
+        with os.fdopen(descriptor, mode) as output:
+            yield output
+        os.replace(temporary, path)
+    except BaseException:
+        os.remove(temporary)
+        raise
+
+
+def _index_txt(field_file, segments):
+    with field_file.storage.open(field_file.name, 'rb') as stream:
+        encoding = detect_encoding(stream.read(CHUNK_SIZE))
+        stream.seek(0)
+        for line in iter(lambda: stream.readline(MAX_LINE), b''):
+            text = line.decode(encoding, errors='replace')
+            segments.feed(line, text, _is_heading(text))
+    return encoding
+
+
+def _index_compressed_txt(field_file, segments, text_path):
+    # Seeking in a gzip blob inflates everything before the offset, so the
+    # decoded text is written once next to the index and the offsets point there.
+    with field_file.storage.open(field_file.name, 'rb') as stream:
+        encoding = detect_encoding(stream.read(CHUNK_SIZE))
+        stream.seek(0)
+        with _replacing(text_path) as output:
+            for raw in iter(lambda: stream.readline(MAX_LINE), b''):
+                text = raw.decode(encoding, errors='replace')
+                line = text.encode()
+                output.write(line)
+                segments.feed(line, text, _is_heading(text))
+    return 'utf-8'
+
+
+def _index_docx(field_file, segments, text_path):
+    # Offsets can not point into the compressed document.xml, so its text is
+    # extracted once next to the index and the offsets point there.
+    try:
+        with field_file.storage.open(field_file.name, 'rb') as stream, zipfile.ZipFile(stream) as archive:
+            with archive.open('word/document.xml') as document, _replacing(text_path) as output:
+                for style, text in docx_styled_paragraphs(document):
+                    line = text.encode()
+                    output.write(line)
+                    heading = _HEADING_STYLE.match(style) is not None and bool(_clean(text))
+                    segments.feed(line, text, heading or _is_heading(text))
+    except (zipfile.BadZipFile, KeyError, SyntaxError):
+        raise ReaderError('Nie można odczytać dokumentu.')
+    return 'utf-8'
+
+
+def reader_index(instance, sha256):
+    """
+    Segments (byte offset, length, title) of a txt or docx plot file, from
+    the derivative cache of its content or built and cached on first use.
+    """
+    field_file = instance.file
+    storage = field_file.storage
+    path = storage.derivative_path(sha256, INDEX_NAME)
+    text_path = storage.derivative_path(sha256, TEXT_NAME)
+    limit = segment_size()
+    try:
+        with open(path) as cached:
+            index = json.load(cached)
+        if (
+            index.get('version') == INDEX_VERSION and index.get('limit') == limit
+            and (index.get('source') == 'file' or os.path.exists(text_path))
+        ):
+            return index
+    except (OSError, ValueError):
+        pass
+
+    segments = _Segments(limit)
+    if field_file.name.rsplit('.', 1)[-1].lower() == 'docx':
+        encoding, source = _index_docx(field_file, segments, text_path), 'text'
+    elif getattr(storage, 'is_compressed', lambda name: False)(field_file.name):
+        encoding, source = _index_compressed_txt(field_file, segments, text_path), 'text'
+    else:
+        encoding, source = _index_txt(field_file, segments), 'file'
+    index = {
+        'version': INDEX_VERSION,
+        'limit': limit,
+        'encoding': encoding,
+        'source': source,
+        'segments': segments.finish(),
+    }
+    with _replacing(path, 'w') as output:
+        json.dump(index, output)
+    return index
+
+
+def read_segment(instance, sha256, index, number):
+    """Text of one segment (numbered from 0), only its bytes are read."""
+    offset, length, title = index['segments'][number]
+    field_file = instance.file
+    if index['source'] == 'text':
+        source = open(field_file.storage.derivative_path(sha256, TEXT_NAME), 'rb')
+    else:
+        source = field_file.storage.open(field_file.name, 'rb')
+    with source:
+        source.seek(offset)
+        data = source.read(length)
+    return data.decode(index['encoding'], errors='replace').lstrip('\ufeff')
+
+
+def reader_page(instance, number):
+    """One segment of a plot file, numbered from 1; numbers out of range give the nearest segment."""
+    sha256 = content_sha256(instance)
+    index = reader_index(instance, sha256)
+    titles = [title or f'Fragment {i}' for i, (_, _, title) in enumerate(index['segments'], 1)]
+    count = len(titles)
+    number = min(max(number, 1), max(count, 1))
+    return {
+        'number': number,
+        'count': count,
+        'title': titles[number - 1] if count else '',
+        'text': read_segment(instance, sha256, index, number - 1) if count else '',
+        'contents': list(enumerate(titles, 1)),
+    }
@@ -0,0 +1,78 @@
+from functools import wraps
+
+from django.core.exceptions import ValidationError
+from django.http import Http404
+
+from .models import Projects
+
+
+def _cache(request):
+    cache = getattr(request, '_scoped_resources', None)
+    if cache is None:
+        cache = {}
+        request._scoped_resources = cache
+    return cache
+
+
+def get_project(request, project_pk):
+    """Return the user's project in one query, memoized for the request. Projects being deleted are hidden."""
+    cache = _cache(request)
+    key = (Projects, str(project_pk))
+    if key not in cache:
+        try:
+            cache[key] = Projects.objects.get(id=project_pk, user_id=request.user.id, deleting=False)
+        except (Projects.DoesNotExist, ValueError):
+            cache[key] = None
+    return cache[key]
+
+
+def get_project_child(request, model, project_pk, child_pk):
+    """Return a project child joined with its project, scoped to both the project and the user."""
+    cache = _cache(request)
+    key = (model, str(child_pk), str(project_pk))
+    if key not in cache:
+        try:
+            child = model.objects.select_related('project').get(
+                id=child_pk,
+                project_id=project_pk,
+                project__user_id=request.user.id,
+                project__deleting=False,
+                user_id=request.user.id,
+            )
+        except (model.DoesNotExist, ValueError, ValidationError):
+            child = None
+        cache[key] = child
+        if child is not None:
+            cache[(Projects, str(project_pk))] = child.project
+    return cache[key]
+
+
+def project_required(view_func):
+    """
+    Replace the project_pk argument with the user's project. Projects of
+    other users, missing ones and those being deleted give a 404 alike.
+    """
+    @wraps(view_func)
+    def wrapper(request, project_pk, *args, **kwargs):
+        project = get_project(request, project_pk)
+        if project is None:
+            raise Http404('Nie znaleziono projektu.')
+        return view_func(request, project, *args, **kwargs)
+    return wrapper
+
+
+def project_child_required(model, pk_kwarg):
+    """
+    Replace project_pk and pk_kwarg with the project and the model instance.
+    An instance outside the user's project gives a 404, as in project_required.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, project_pk, *args, **kwargs):
+            child_pk = kwargs.pop(pk_kwarg)
+            child = get_project_child(request, model, project_pk, child_pk)
+            if child is None:
+                raise Http404('Nie znaleziono zasobu projektu.')
+            return view_func(request, child.project, child, *args, **kwargs)
+        return wrapper
+    return decorator
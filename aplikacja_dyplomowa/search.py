@@ -0,0 +1,323 @@
+import re
+
+from django.conf import settings
+from django.db import connection, OperationalError
+from django.db.models import Q
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .extraction import extract_text, file_sha256
+from .models import ProjectObjects, Files, MainFiles, FileContents
+
+
+FTS_TABLE = 'aplikacja_dyplomowa_projectobjects_fts'
+FILE_FTS_TABLE = 'aplikacja_dyplomowa_filecontents_fts'
+
+SNIPPET_START = '\x02'
+SNIPPET_END = '\x03'
+
+_fts_state = {}
+
+
+def create_fts_table(conn):
+    """Create the FTS5 table on SQLite builds that support it. Returns False otherwise."""
+    if conn.vendor != 'sqlite':
+        return False
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                f'CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5('
+                "object_name, object_description, project_id UNINDEXED, "
+                "tokenize='unicode61 remove_diacritics 2')"
+            )
+    except OperationalError:
+        return False
+    return True
+
+
+def create_file_fts_table(conn):
+    """Create the FTS5 index over FileContents.text (external content, the text is not stored twice)."""
+    if conn.vendor != 'sqlite':
+        return False
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                f'CREATE VIRTUAL TABLE IF NOT EXISTS {FILE_FTS_TABLE} USING fts5('
+                "text, content='aplikacja_dyplomowa_filecontents', content_rowid='id', "
+                "tokenize='unicode61 remove_diacritics 2')"
+            )
+    except OperationalError:
+        return False
+    return True
+
+
+def fts_enabled(table=FTS_TABLE):
+    key = (connection.alias, str(connection.settings_dict['NAME']), table)
+    if key not in _fts_state:
+        enabled = False
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [table])
+                enabled = cursor.fetchone() is not None
+        _fts_state[key] = enabled
+    return _fts_state[key]
+
+
+def reset_fts_state():
+    _fts_state.clear()
+
+
+def index_object(project_object):
+    if not fts_enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [project_object.id])
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, object_name, object_description, project_id) VALUES (%s, %s, %s, %s)',
+            [project_object.id, project_object.object_name, project_object.object_description, project_object.project_id],
+        )
+
+
+def unindex_object(object_id):
+    if not fts_enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [object_id])
+
+
+def unindex_objects(object_ids):
+    if not object_ids or not fts_enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [[object_id] for object_id in object_ids])
+
+
+def index_objects(rows):
+    """Add (id, object_name, object_description, project_id) rows of new objects to the index in one statement."""
+    if not rows or not fts_enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'INSERT INTO {FTS_TABLE} (rowid, object_name, object_description, project_id) VALUES (%s, %s, %s, %s)',
+            rows,
+        )
+
+
+def rebuild_index(batch_size=1000):
+    """Drop and refill the FTS table from ProjectObjects. Returns the number of indexed rows or None."""
+    with connection.cursor() as cursor:
+        cursor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+    reset_fts_state()
+    if not create_fts_table(connection):
+        return None
+
+    rows = ProjectObjects.objects.values_list('id', 'object_name', 'object_description', 'project_id')
+    batch = []
+    total = 0
+    for row in rows.iterator(chunk_size=batch_size):
+        batch.append(row)
+        if len(batch) >= batch_size:
+            index_objects(batch)
+            total += len(batch)
+            batch = []
+    index_objects(batch)
+    total += len(batch)
+    return total
+
+
+def build_match_query(text):
+    """Turn free text into an FTS5 query: every word is quoted and prefix-matched."""
+    words = re.findall(r'\w+', text)
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+class RankedObjectResults:
+    """
+    Lazy, sliceable result set for Paginator: only the requested page is
+    fetched from the FTS index (ordered by bm25), then loaded as objects.
+    """
+
+    def __init__(self, project, match):
+        self.project = project
+        self.match = match
+        self._count = None
+
+    def count(self):
+        if self._count is None:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'SELECT COUNT(*) FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s AND project_id = %s',
+                    [self.match, self.project.id],
+                )
+                self._count = cursor.fetchone()[0]
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, item):
+        if not isinstance(item, slice):
+            return self[item:item + 1][0]
+        start = item.start or 0
+        stop = item.stop if item.stop is not None else self.count()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s AND project_id = %s '
+                f'ORDER BY bm25({FTS_TABLE}, 10.0, 1.0) LIMIT %s OFFSET %s',
+                [self.match, self.project.id, max(stop - start, 0), start],
+            )
+            ids = [row[0] for row in cursor.fetchall()]
+        objects = ProjectObjects.objects.filter(project=self.project).in_bulk(ids)
+        return [objects[object_id] for object_id in ids if object_id in objects]
+
+
+def search_objects(project, text):
+    """
+    Search objects of the project by name and description. Uses the FTS5
+    index when present, otherwise falls back to a LIKE scan.
+    """
+    match = build_match_query(text)
+    if not match:
+        return ProjectObjects.objects.none()
+    if fts_enabled():
+        return RankedObjectResults(project, match)
+    return ProjectObjects.objects.filter(
+        Q(object_name__icontains=text) | Q(object_description__icontains=text),
+        project=project,
+    ).order_by('object_name', 'id')
+
+
+def index_file_contents(contents):
+    if not fts_enabled(FILE_FTS_TABLE):
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'INSERT INTO {FILE_FTS_TABLE} (rowid, text) VALUES (%s, %s)', [contents.id, contents.text])
+
+
+def forget_file_contents(sha256):
+    """Drop the extracted text of a content nothing references anymore, with its entry in the file index."""
+    contents = FileContents.objects.filter(sha256=sha256).first()
+    if contents is None:
+        return
+    if fts_enabled(FILE_FTS_TABLE):
+        with connection.cursor() as cursor:
+            # The index keeps no copy of the text, the 'delete' command needs it to find the terms.
+            cursor.execute(
+                f"INSERT INTO {FILE_FTS_TABLE} ({FILE_FTS_TABLE}, rowid, text) VALUES ('delete', %s, %s)",
+                [contents.id, contents.text],
+            )
+    contents.delete()
+
+
+def index_file(model, pk):
+    """
+    Checksum an uploaded Files/MainFiles row and index its text. Content
+    that is already known by checksum is not extracted again.
+    """
+    instance = model.objects.filter(pk=pk).first()
+    if instance is None or not instance.file:
+        return
+
+    sha256 = instance.sha256
+    if not sha256:
+        sha256 = file_sha256(instance.file)
+        model.objects.filter(pk=pk).update(sha256=sha256)
+
+    if FileContents.objects.filter(sha256=sha256).exists():
+        return
+
+    text = extract_text(instance.file)
+    if text is None:
+        return
+
+    contents, created = FileContents.objects.get_or_create(sha256=sha256, defaults={'text': text})
+    if created:
+        index_file_contents(contents)
+
+
+def rebuild_file_index(full=False):
+    """
+    Index files that were not indexed yet. With full=True the extracted
+    texts are dropped and every file is extracted again.
+    """
+    if full:
+        FileContents.objects.all().delete()
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP TABLE IF EXISTS {FILE_FTS_TABLE}')
+        reset_fts_state()
+        create_file_fts_table(connection)
+
+    indexed = 0
+    known = FileContents.objects.values_list('sha256', flat=True)
+    for model in (Files, MainFiles):
+        pending = model.objects.exclude(sha256__in=known).values_list('pk', flat=True)
+        for pk in pending.iterator():
+            index_file(model, pk)
+            indexed += 1
+    return indexed
+
+
+def _highlight(snippet):
+    html = escape(snippet)
+    return mark_safe(html.replace(SNIPPET_START, '<mark>').replace(SNIPPET_END, '</mark>'))
+
+
+def _fallback_snippet(text, query, width=80):
+    position = text.lower().find(query.lower())
+    if position < 0:
+        return text[:width * 2]
+    start = max(position - width, 0)
+    end = position + len(query) + width
+    return (
+        ('…' if start else '') + text[start:position] + SNIPPET_START
+        + text[position:position + len(query)] + SNIPPET_END
+        + text[position + len(query):end] + ('…' if end < len(text) else '')
+    )
+
+
+FILE_SEARCH_KINDS = (
+    (Files, 'file', 'aplikacja_dyplomowa_files'),
+    (MainFiles, 'main_file', 'aplikacja_dyplomowa_mainfiles'),
+)
+
+
+def search_files(project, text):
+    """
+    Search the extracted text of the project's files and plot files. Returns
+    dicts with kind, id, name and an HTML snippet, best matches first.
+    """
+    limit = getattr(settings, 'FILE_SEARCH_LIMIT', 100)
+    match = build_match_query(text)
+    if not match:
+        return []
+
+    results = []
+    if fts_enabled(FILE_FTS_TABLE):
+        with connection.cursor() as cursor:
+            for model, kind, table in FILE_SEARCH_KINDS:
+                cursor.execute(
+                    f'SELECT f.id, f.file_name, '
+                    f'snippet({FILE_FTS_TABLE}, 0, %s, %s, %s, 16), bm25({FILE_FTS_TABLE}) AS rank '
+                    f'FROM {FILE_FTS_TABLE} '
+                    f'JOIN aplikacja_dyplomowa_filecontents c ON c.id = {FILE_FTS_TABLE}.rowid '
+                    f'JOIN {table} f ON f.sha256 = c.sha256 '
+                    f'WHERE {FILE_FTS_TABLE} MATCH %s AND f.project_id = %s '
+                    f'ORDER BY rank LIMIT %s',
+                    [SNIPPET_START, SNIPPET_END, '…', match, project.id, limit],
+                )
+                for file_id, name, snippet, rank in cursor.fetchall():
+                    results.append({'kind': kind, 'id': file_id, 'name': name, 'snippet': _highlight(snippet), 'rank': rank})
+        results.sort(key=lambda result: result['rank'])
+        return results
+
+    for model, kind, table in FILE_SEARCH_KINDS:
+        files = model.objects.filter(project=project).exclude(sha256='').values_list('id', 'file_name', 'sha256')
+        by_hash = {}
+        for file_id, name, sha256 in files:
+            by_hash.setdefault(sha256, []).append((file_id, name))
+        contents = FileContents.objects.filter(sha256__in=list(by_hash), text__icontains=text)
+        for item in contents[:limit]:
+            snippet = _highlight(_fallback_snippet(item.text, text))
+            for file_id, name in by_hash[item.sha256]:
+                results.append({'kind': kind, 'id': file_id, 'name': name, 'snippet': snippet, 'rank': 0})
+    return results
@@ -1,23 +1,124 @@
-from .models import Files, MainFiles
-
-import os
+from .models import Files, MainFiles, ProjectObjects, Tags
+from .search import index_object, unindex_object, index_file
+from .tasks import schedule
+from .tag_filter import bump_tags_version
+from .graph import connections_changed
+from .storage import blob_sha256, add_reference, release_file
+from .thumbnails import thumbnail_file
+from .metadata import store_metadata, count_file
+from .quotas import add_usage
 
 from django.dispatch import receiver
 
-from django.db.models.signals import pre_delete, pre_save
+from django.db.models.signals import pre_delete, pre_save, post_save, post_delete, m2m_changed
 
 
 @receiver(pre_delete, sender=Files)
 def auto_delete_file_on_model_delete(sender, instance, **kwargs):
 
     if instance.file:
-        if os.path.isfile(instance.file.path):
-            os.remove(instance.file.path)
+        release_file(instance.file)
+    add_usage(instance.project_id, instance.user_id, -instance.size)
 
 
 @receiver(pre_delete, sender=MainFiles)
 def auto_delete_file_on_model_delete(sender, instance, **kwargs):
 
     if instance.file:
-        if os.path.isfile(instance.file.path):
-            os.remove(instance.file.path)
+        release_file(instance.file)
+    add_usage(instance.project_id, instance.user_id, -instance.size)
+
+
+@receiver(post_save, sender=Files)
+@receiver(post_save, sender=MainFiles)
+def add_storage_usage_on_upload(sender, instance, created, **kwargs):
+    if created:
+        add_usage(instance.project_id, instance.user_id, instance.size)
+
+
+@receiver(post_save, sender=Files)
+@receiver(post_save, sender=MainFiles)
+def add_blob_reference_on_upload(sender, instance, created, **kwargs):
+    sha256 = blob_sha256(instance.file.name)
+    if not created or sha256 is None:
+        return
+    # The uploaded file is still open after the save, it can write the blob
+    # again if a concurrent delete removed it.
+    add_reference(instance.file.name, instance.file.size, instance.file.storage, instance.file._file)
+    if instance.sha256 != sha256:
+        instance.sha256 = sha256
+        sender.objects.filter(pk=instance.pk).update(sha256=sha256)
+
+
+@receiver(post_save, sender=ProjectObjects)
+def update_search_index_on_object_save(sender, instance, **kwargs):
+    index_object(instance)
+
+
+@receiver(post_delete, sender=ProjectObjects)
+def update_search_index_on_object_delete(sender, instance, **kwargs):
+    unindex_object(instance.id)
+
+
+@receiver(post_save, sender=Files)
+@receiver(post_save, sender=MainFiles)
+def index_file_contents_on_upload(sender, instance, created, **kwargs):
+    if created:
+        schedule(index_file, sender, instance.pk)
+
+
+@receiver(pre_save, sender=Files)
+@receiver(pre_save, sender=MainFiles)
+def store_file_metadata(sender, instance, **kwargs):
+    # Read once when new content is stored, never on page views.
+    if instance.file and (not instance.file._committed or not instance.mime_type):
+        store_metadata(instance)
+        instance._count_pending = True
+
+
+@receiver(post_save, sender=Files)
+@receiver(post_save, sender=MainFiles)
+def count_file_contents(sender, instance, **kwargs):
+    if getattr(instance, '_count_pending', False):
+        instance._count_pending = False
+        schedule(count_file, sender, instance.pk)
+
+
+@receiver(post_save, sender=Files)
+def create_thumbnails_on_upload(sender, instance, created, **kwargs):
+    if created and instance.is_image():
+        schedule(thumbnail_file, sender, instance.pk)
+
+
+@receiver(m2m_changed, sender=ProjectObjects.tags.through)
+def bump_tags_version_on_tag_assignment(sender, instance, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        bump_tags_version(instance.project_id)
+
+
+@receiver(post_save, sender=Tags)
+@receiver(post_delete, sender=Tags)
+@receiver(post_save, sender=ProjectObjects)
+@receiver(post_delete, sender=ProjectObjects)
+def bump_tags_version_on_change(sender, instance, **kwargs):
+    bump_tags_version(instance.project_id)
+
+
+@receiver(m2m_changed, sender=ProjectObjects.connections.through)
+def update_graph_index_on_connection_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'post_clear':
+        connections_changed(instance.project_id, invalidate=True)
+    elif action in ('post_add', 'post_remove'):
+        if reverse:
+            edges = [(pk, instance.id) for pk in pk_set]
+        else:
+            edges = [(instance.id, pk) for pk in pk_set]
+        if action == 'post_add':
+            connections_changed(instance.project_id, added=edges)
+        else:
+            connections_changed(instance.project_id, removed=edges)
+
+
+@receiver(post_delete, sender=ProjectObjects)
+def update_graph_index_on_object_delete(sender, instance, **kwargs):
+    connections_changed(instance.project_id, removed_nodes=[instance.id])
@@ -0,0 +1,396 @@
+import gzip
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.core.files.base import File
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .models import Blobs, Files, MainFiles
+from .search import forget_file_contents
+
+
+BLOB_DIR = 'blobs'
+
+DERIVATIVE_DIR = 'derivatives'
+
+COMPRESSED_SUFFIX = '.gz'
+
+_BLOB_NAME = re.compile(r'^([0-9a-f]{64})/([^/]+)$')
+
+_SHA256 = re.compile(r'^[0-9a-f]{64}$')
+
+BATCH_SIZE = 200
+
+
+def blob_sha256(name):
+    """The content hash of a blob name, None for files stored before blobs."""
+    match = _BLOB_NAME.match(name or '')
+    return match.group(1) if match else None
+
+
+def shard(sha256):
+    """ab/cd/<sha256>: two levels of 256 directories keep every directory small."""
+    return os.path.join(sha256[:2], sha256[2:4], sha256)
+
+
+def _trim(name, max_length):
+    if max_length is None or len(name) <= max_length:
+        return name
+    root, extension = os.path.splitext(name)
+    return root[:max(max_length - len(extension), 1)] + extension
+
+
+class GzipBlobFile(gzip.GzipFile):
+    """
+    Decompressed view of a compressed blob. It reports itself as not
+    seekable, so FileResponse does not try to seek to the end; seeking
+    forward (for byte ranges) still works by decompressing.
+    """
+
+    def __init__(self, path, size):
+        super().__init__(path, 'rb')
+        self.size = size
+
+    def seekable(self):
+        return False
+
+
+def _gzip_size(path):
+    # The last four bytes of a gzip member are the uncompressed size modulo
+    # 2**32, uploads are far below that.
+    with open(path, 'rb') as stored:
+        stored.seek(-4, os.SEEK_END)
+        return int.from_bytes(stored.read(4), 'little')
+
+
+def compressed_extensions():
+    return getattr(settings, 'STORAGE_COMPRESS_EXTENSIONS', [])
+
+
+class BlobStorage(FileSystemStorage):
+    """
+    Content-addressed storage. Every unique content is written once to
+    blobs/ab/cd/<sha256>, the name kept in the database is '<sha256>/<original
+    name>', so the original name is still shown and used for downloads.
+    Names without the hash prefix are plain files from before blobs.
+
+    Contents uploaded with an extension from STORAGE_COMPRESS_EXTENSIONS are
+    kept gzip-compressed as <sha256>.gz. open() and size() still give the
+    original bytes and size, so only downloads need to know about it.
+    """
+
+    def _stored_blob(self, sha256):
+        """Path of the stored content, plain or compressed, None when it is not stored."""
+        name = os.path.join(BLOB_DIR, shard(sha256))
+        # The flat path holds blobs written before sharding, until shard_blobs moved them.
+        for candidate in (name, name + COMPRESSED_SUFFIX, os.path.join(BLOB_DIR, sha256)):
+            path = super().path(candidate)
+            if os.path.exists(path):
+                return path
+        return None
+
+    def blob_path(self, sha256):
+        return self._stored_blob(sha256) or super().path(os.path.join(BLOB_DIR, shard(sha256)))
+
+    def blob_file_name(self, sha256, name, max_length=None):
+        if max_length is not None:
+            max_length -= len(sha256) + 1
+        return f'{sha256}/{_trim(os.path.basename(name), max_length)}'
+
+    def path(self, name):
+        sha256 = blob_sha256(name)
+        if sha256 is not None:
+            return self.blob_path(sha256)
+        return super().path(name)
+
+    def is_compressed(self, name):
+        return blob_sha256(name) is not None and self.path(name).endswith(COMPRESSED_SUFFIX)
+
+    def _open(self, name, mode='rb'):
+        if self.is_compressed(name):
+            path = self.path(name)
+            return File(GzipBlobFile(path, _gzip_size(path)), name)
+        return super()._open(name, mode)
+
+    def size(self, name):
+        if self.is_compressed(name):
+            return _gzip_size(self.path(name))
+        return super().size(name)
+
+    def get_available_name(self, name, max_length=None):
+        # The hash prefix added in _save identifies the content, there is no
+        # collision to probe for. Only leave room for the prefix.
+        if max_length is not None:
+            max_length -= 65
+        return _trim(os.path.basename(name), max_length)
+
+    def _compress(self, name):
+        return name.rsplit('.', 1)[-1].lower() in compressed_extensions()
+
+    def _write_blob(self, target, chunks, compress):
+        # Written under a temporary name and renamed, so a blob that exists
+        # is always complete, even with concurrent uploads.
+        directory = os.path.dirname(target)
+        os.makedirs(directory, exist_ok=True)
+        descriptor, temporary = tempfile.mkstemp(dir=directory, suffix='.part')
+        try:
+            with os.fdopen(descriptor, 'wb') as output:
+                if compress:
+                    # mtime=0 keeps the compressed bytes the same for the same content.
+                    with gzip.GzipFile(fileobj=output, mode='wb', compresslevel=6, mtime=0) as compressed:
+                        for chunk in chunks:
+                            compressed.write(chunk)
+                else:
+                    for chunk in chunks:
+                        output.write(chunk)
+            os.replace(temporary, target + (COMPRESSED_SUFFIX if compress else ''))
+        except BaseException:
+            os.remove(temporary)
+            raise
+        if self.file_permissions_mode is not None:
+            os.chmod(target + (COMPRESSED_SUFFIX if compress else ''), self.file_permissions_mode)
+
+    def _save(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        sha256 = digest.hexdigest()
+
+        if self._stored_blob(sha256) is None:
+            target = self.blob_path(sha256)
+            if self._compress(name):
+                self._write_blob(target, content.chunks(), compress=True)
+            elif hasattr(content, 'temporary_file_path'):
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                file_move_safe(content.temporary_file_path(), target, allow_overwrite=True)
+                if self.file_permissions_mode is not None:
+                    os.chmod(target, self.file_permissions_mode)
+            else:
+                self._write_blob(target, content.chunks(), compress=False)
+        return self.blob_file_name(sha256, name)
+
+    def link_blob(self, path, sha256, name=''):
+        """Add a local file with known content hash to the blob store, unless the content is stored already."""
+        if self._stored_blob(sha256) is not None:
+            return
+        target = self.blob_path(sha256)
+        if self._compress(name):
+            with open(path, 'rb') as source:
+                self._write_blob(target, iter(lambda: source.read(1024 * 1024), b''), compress=True)
+            return
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        try:
+            os.link(path, target)
+        except FileExistsError:
+            return
+        except OSError:
+            shutil.copyfile(path, target)
+        if self.file_permissions_mode is not None:
+            os.chmod(target, self.file_permissions_mode)
+
+    def compress_blob(self, sha256):
+        """Compress a plain stored blob in place. Returns the number of bytes saved."""
+        path = self._stored_blob(sha256)
+        if path is None or path.endswith(COMPRESSED_SUFFIX):
+            return 0
+        target = super().path(os.path.join(BLOB_DIR, shard(sha256)))
+        with open(path, 'rb') as source:
+            self._write_blob(target, iter(lambda: source.read(1024 * 1024), b''), compress=True)
+        saved = os.path.getsize(path) - os.path.getsize(target + COMPRESSED_SUFFIX)
+        os.remove(path)
+        return saved
+
+    def ensure_blob(self, sha256, name, content):
+        """
+        Write the content again when the blob is not stored, because a
+        delete() of its last reference removed it after the upload found it.
+        content is a File or the path of a local file with the same bytes.
+        """
+        if self._stored_blob(sha256) is not None:
+            return
+        if isinstance(content, str):
+            self.link_blob(content, sha256, name)
+        else:
+            self._write_blob(self.blob_path(sha256), content.chunks(), compress=self._compress(name))
+
+    def delete(self, name):
+        """
+        Remove a blob only when no Files/MainFiles row references it anymore,
+        together with its derivatives and its extracted text.
+        """
+        sha256 = blob_sha256(name)
+        if sha256 is None:
+            return super().delete(name)
+        with transaction.atomic():
+            # The row stays locked until the file is gone: add_reference() of
+            # a concurrent upload either came first and is counted here, or
+            # waits and then finds the blob missing and writes it again.
+            blob, _ = Blobs.objects.select_for_update().get_or_create(
+                sha256=sha256, defaults={'size': 0, 'references': 0},
+            )
+            if blob.references > 0:
+                return
+            blob.delete()
+            forget_file_contents(sha256)
+            path = self._stored_blob(sha256)
+            if path is not None:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            shutil.rmtree(self.derivative_path(sha256), ignore_errors=True)
+
+    def derivative_path(self, sha256, name=''):
+        """
+        Path in the cache of files derived from a content (thumbnails and
+        the like), kept per content hash and removed together with the blob.
+        """
+        return os.path.join(super().path(os.path.join(DERIVATIVE_DIR, shard(sha256))), name)
+
+
+def add_reference(name, size, storage=None, content=None):
+    """
+    Count one more row referencing the blob of name. With storage and
+    content (see BlobStorage.ensure_blob) given, the blob is written again
+    when a concurrent delete() removed it before the reference was counted.
+    """
+    sha256 = blob_sha256(name)
+    if sha256 is None:
+        return
+    while not Blobs.objects.filter(sha256=sha256).update(references=F('references') + 1):
+        try:
+            with transaction.atomic():
+                Blobs.objects.create(sha256=sha256, size=size, references=1)
+            break
+        except IntegrityError:
+            # Created by another upload meanwhile, or locked by delete() and
+            # removed again; count on whichever row is there now.
+            continue
+    if storage is not None and content is not None:
+        storage.ensure_blob(sha256, name, content)
+
+
+def release_file(field_file):
+    """
+    Drop the reference of a deleted row. The content itself is removed after
+    commit and only if nothing else references it.
+    """
+    name = field_file.name
+    storage = field_file.storage
+    sha256 = blob_sha256(name)
+    if sha256 is not None:
+        Blobs.objects.filter(sha256=sha256, references__gt=0).update(references=F('references') - 1)
+    transaction.on_commit(lambda: storage.delete(name))
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as source:
+        for block in iter(lambda: source.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def move_to_blobs(batch_size=BATCH_SIZE):
+    """
+    Move files stored before blobs into the blob store, one transaction per
+    batch. Rows that point at blobs already are skipped, so an interrupted
+    run can be started again. Returns (moved files, missing files, bytes freed).
+    """
+    moved = missing = freed = 0
+    for model in (Files, MainFiles):
+        field = model._meta.get_field('file')
+        storage = field.storage
+        last_pk = 0
+        while True:
+            rows = list(
+                model.objects.filter(pk__gt=last_pk).exclude(file='').exclude(file__regex=r'^[0-9a-f]{64}/')
+                .order_by('pk').values_list('pk', 'file')[:batch_size]
+            )
+            if not rows:
+                break
+            last_pk = rows[-1][0]
+
+            replaced = []
+            with transaction.atomic():
+                for pk, name in rows:
+                    path = storage.path(name)
+                    if not os.path.isfile(path):
+                        missing += 1
+                        continue
+                    sha256 = _sha256(path)
+                    size = os.path.getsize(path)
+                    if os.path.exists(storage.blob_path(sha256)):
+                        freed += size
+                    storage.link_blob(path, sha256, name)
+                    blob_name = storage.blob_file_name(sha256, name, max_length=field.max_length)
+                    model.objects.filter(pk=pk).update(file=blob_name, sha256=sha256)
+                    add_reference(blob_name, size, storage, path)
+                    replaced.append(path)
+            for path in replaced:
+                os.remove(path)
+            moved += len(replaced)
+    return moved, missing, freed
+
+
+def _move_into_shards(root, is_file):
+    moved = 0
+    if not os.path.isdir(root):
+        return moved
+    with os.scandir(root) as entries:
+        for entry in entries:
+            if not _SHA256.match(entry.name) or entry.is_file() != is_file:
+                continue
+            target = os.path.join(root, shard(entry.name))
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            if os.path.exists(target):
+                # Written in the sharded place meanwhile, the content is the same.
+                if is_file:
+                    os.remove(entry.path)
+                else:
+                    shutil.rmtree(entry.path, ignore_errors=True)
+            else:
+                os.replace(entry.path, target)
+            moved += 1
+    return moved
+
+
+def shard_blobs(storage):
+    """
+    Move blobs and derivative folders from the flat layout of earlier
+    versions into ab/cd/ shards. Every move is one rename, so the storage
+    stays readable while it runs and an interrupted run can be started
+    again. Returns (moved blobs, moved derivative folders).
+    """
+    return (
+        _move_into_shards(storage.path(BLOB_DIR), is_file=True),
+        _move_into_shards(storage.path(DERIVATIVE_DIR), is_file=False),
+    )
+
+
+def compress_blobs(batch_size=BATCH_SIZE):
+    """
+    Compress stored plain blobs of files whose extension is in
+    STORAGE_COMPRESS_EXTENSIONS. Already compressed blobs are skipped, so
+    an interrupted run can be started again. Returns (compressed blobs, bytes saved).
+    """
+    compressed = saved = 0
+    extensions = compressed_extensions()
+    for model in (Files, MainFiles):
+        storage = model._meta.get_field('file').storage
+        names = model.objects.filter(file__regex=r'^[0-9a-f]{64}/').values_list('file', flat=True)
+        for name in names.iterator(chunk_size=batch_size):
+            if name.rsplit('.', 1)[-1].lower() not in extensions:
+                continue
+            freed = storage.compress_blob(blob_sha256(name))
+            if freed:
+                compressed += 1
+                saved += freed
+    return compressed, saved
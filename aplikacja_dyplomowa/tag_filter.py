@@ -0,0 +1,233 @@
+import hashlib
+import re
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, F, Q
+
+from .models import Projects, ProjectObjects, Tags
+from .pagination import KeysetPage, keyset_paginate
+
+
+class TagQueryError(ValueError):
+    pass
+
+
+_TOKEN = re.compile(r'\s*(?:(\()|(\))|"([^"]*)"|([^\s()"]+))')
+
+OPERATORS = {'AND', 'OR', 'NOT'}
+
+
+def tokenize(text):
+    tokens = []
+    position = 0
+    text = text.strip()
+    while position < len(text):
+        match = _TOKEN.match(text, position)
+        if not match:
+            raise TagQueryError('Niepoprawne zapytanie.')
+        position = match.end()
+        opening, closing, quoted, word = match.groups()
+        if opening:
+            tokens.append(('(', None))
+        elif closing:
+            tokens.append((')', None))
+        elif quoted is not None:
+            tokens.append(('tag', quoted))
+        elif word.upper() in OPERATORS:
+            tokens.append((word.upper(), None))
+        else:
+            tokens.append(('tag', word))
+    return tokens
+
+
+class _Parser:
+    """
+    Grammar (NOT binds tighter than AND, AND tighter than OR, adjacent terms
+    are joined with AND):
+
+        or   := and ('OR' and)*
+        and  := not (['AND'] not)*
+        not  := 'NOT' not | atom
+        atom := tag | '(' or ')'
+    """
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.position = 0
+
+    def peek(self):
+        if self.position < len(self.tokens):
+            return self.tokens[self.position][0]
+        return None
+
+    def take(self):
+        token = self.tokens[self.position]
+        self.position += 1
+        return token
+
+    def parse(self):
+        if not self.tokens:
+            raise TagQueryError('Zapytanie jest puste.')
+        tree = self.parse_or()
+        if self.peek() is not None:
+            raise TagQueryError('Niepoprawne zapytanie.')
+        return tree
+
+    def parse_or(self):
+        tree = self.parse_and()
+        while self.peek() == 'OR':
+            self.take()
+            tree = ('or', tree, self.parse_and())
+        return tree
+
+    def parse_and(self):
+        tree = self.parse_not()
+        while self.peek() in ('AND', 'NOT', 'tag', '('):
+            if self.peek() == 'AND':
+                self.take()
+            tree = ('and', tree, self.parse_not())
+        return tree
+
+    def parse_not(self):
+        if self.peek() == 'NOT':
+            self.take()
+            return ('not', self.parse_not())
+        return self.parse_atom()
+
+    def parse_atom(self):
+        kind = self.peek()
+        if kind == 'tag':
+            return ('tag', self.take()[1])
+        if kind == '(':
+            self.take()
+            tree = self.parse_or()
+            if self.peek() != ')':
+                raise TagQueryError('Brakuje nawiasu zamykającego.')
+            self.take()
+            return tree
+        raise TagQueryError('Niepoprawne zapytanie.')
+
+
+def parse(text):
+    return _Parser(tokenize(text)).parse()
+
+
+def tag_names(tree):
+    if tree[0] == 'tag':
+        return {tree[1]}
+    names = set()
+    for child in tree[1:]:
+        names |= tag_names(child)
+    return names
+
+
+def resolve(tree, project):
+    """Replace tag names with ids of the project's tags (one query)."""
+    names = tag_names(tree)
+    tags = {tag.tag_name: tag for tag in Tags.objects.filter(project=project, tag_name__in=names)}
+    missing = sorted(names - set(tags))
+    if missing:
+        raise TagQueryError(f'Nieznane tagi: {", ".join(missing)}')
+
+    def replace(node):
+        if node[0] == 'tag':
+            return ('tag', tags[node[1]].id)
+        return (node[0],) + tuple(replace(child) for child in node[1:])
+    return replace(tree), list(tags.values())
+
+
+def tag_ids(tree):
+    if tree[0] == 'tag':
+        return {tree[1]}
+    ids = set()
+    for child in tree[1:]:
+        ids |= tag_ids(child)
+    return ids
+
+
+def _annotation(tag_id):
+    return f'tag_{tag_id}_matches'
+
+
+def compile_q(tree):
+    kind = tree[0]
+    if kind == 'tag':
+        return Q(**{f'{_annotation(tree[1])}__gt': 0})
+    if kind == 'not':
+        return ~compile_q(tree[1])
+    if kind == 'and':
+        return compile_q(tree[1]) & compile_q(tree[2])
+    return compile_q(tree[1]) | compile_q(tree[2])
+
+
+def filter_queryset(project, tree):
+    """
+    One statement: objects LEFT JOIN their tag links, GROUP BY object, one
+    COUNT per referenced tag and the boolean expression in HAVING.
+    """
+    annotations = {
+        _annotation(tag_id): Count('tags', filter=Q(tags__id=tag_id))
+        for tag_id in sorted(tag_ids(tree))
+    }
+    return ProjectObjects.objects.filter(project=project).annotate(**annotations).filter(compile_q(tree))
+
+
+def canonical(tree):
+    if tree[0] == 'tag':
+        return str(tree[1])
+    if tree[0] == 'not':
+        return f'NOT({canonical(tree[1])})'
+    return f'{tree[0].upper()}({canonical(tree[1])},{canonical(tree[2])})'
+
+
+def bump_tags_version(project_id):
+    Projects.objects.filter(id=project_id).update(tags_version=F('tags_version') + 1)
+
+
+def _cache_key(project, tree, *parts):
+    digest = hashlib.sha1('|'.join((canonical(tree),) + tuple(str(part) for part in parts)).encode()).hexdigest()
+    return f'tag_filter:{project.id}:{project.tags_version}:{digest}'
+
+
+def _timeout():
+    return getattr(settings, 'TAG_FILTER_CACHE_TIMEOUT', 300)
+
+
+def filter_page(request, project, tree):
+    """
+    Page of objects matching the resolved expression, cached per project
+    and tags_version, so any change of tag assignments invalidates it.
+    """
+    ordering = ('object_name', 'id')
+    key = _cache_key(
+        project, tree, 'page',
+        request.GET.get('after', ''), request.GET.get('before', ''), request.GET.get('size', ''),
+    )
+    cached = cache.get(key)
+    if cached is not None:
+        rows, has_next, has_previous = cached
+        return KeysetPage(request, rows, ordering, has_next, has_previous)
+
+    page = keyset_paginate(request, filter_queryset(project, tree), ordering)
+    cache.set(key, (page.object_list, page.has_next, page.has_previous), _timeout())
+    return page
+
+
+def filter_counts(project, tree):
+    """Total of matching objects and, for every tag of the expression, how many of them carry it."""
+    key = _cache_key(project, tree, 'counts')
+    counts = cache.get(key)
+    if counts is None:
+        ids = sorted(tag_ids(tree))
+        aggregates = {
+            f'tag_{tag_id}': Count('id', filter=Q(**{f'{_annotation(tag_id)}__gt': 0}))
+            for tag_id in ids
+        }
+        result = filter_queryset(project, tree).aggregate(total=Count('id'), **aggregates)
+        counts = {
+            'total': result['total'],
+            'tags': {tag_id: result[f'tag_{tag_id}'] for tag_id in ids},
+        }
+        cache.set(key, counts, _timeout())
+    return counts
@@ -0,0 +1,43 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections, transaction
+
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, 'BACKGROUND_WORKERS', 2),
+            thread_name_prefix='aplikacja-background',
+        )
+    return _executor
+
+
+def _run(func, args, kwargs):
+    try:
+        func(*args, **kwargs)
+    except Exception:
+        logger.exception('Background task %s failed', func.__name__)
+    finally:
+        # Worker threads get their own connections, close them so they do not leak.
+        connections.close_all()
+
+
+def run_in_background(func, *args, **kwargs):
+    """Run func outside of the request. With BACKGROUND_TASKS_SYNC it runs inline."""
+    if getattr(settings, 'BACKGROUND_TASKS_SYNC', False):
+        func(*args, **kwargs)
+        return
+    _get_executor().submit(_run, func, args, kwargs)
+
+
+def schedule(func, *args, **kwargs):
+    """Run func in the background once the current transaction commits."""
+    transaction.on_commit(lambda: run_in_background(func, *args, **kwargs))
@@ -1,3 +1,762 @@
-from django.test import TestCase
+import gzip
+import hashlib
+import io
+import json
+import os
+import tempfile
+import zipfile
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.http import Http404, HttpResponse
+from django.test import Client, RequestFactory, TestCase, override_settings
+from django.utils import timezone
+from django.utils.http import http_date
+
+from .custom_validators import FILE_EXTENSIONS, MAX_FILE_SIZE
+from .models import (
+    Blobs, ChunkedUploads, FileContents, Files, MainFiles, ProjectDeletions, ProjectObjects, Projects, StorageUsages, Tags,
+)
+from .archives import ARCHIVE_FORMAT, MANIFEST_NAME, project_archive
+from .deletion import _delete_batch, _querysets, resume_deletions, start_deletion
+from .downloads import parse_range
+from .graph import Adjacency, AdjacencyCache, clamp_depth, shortest_path
+from .imports import ArchiveImportError, import_archive
+from .readers import reader_page
+from .search import FILE_FTS_TABLE, FTS_TABLE
+from .storage import add_reference, blob_sha256
+from .tag_filter import TagQueryError, filter_counts, filter_queryset, parse, resolve
+from .resolvers import get_project, get_project_child, project_child_required, project_required
+from .upload_handlers import QUOTA_ERROR, limit_uploads
+from .uploads import UploadError, finish_upload, start_upload, temp_path, write_chunk
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), BACKGROUND_TASKS_SYNC=True)
+class UploadFormLimitTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('autor', password='haslo')
+        self.project = Projects.objects.create(project_name='projekt', user=self.user)
+        self.client = Client(enforce_csrf_checks=True)
+        self.client.force_login(self.user)
+        self.url = f'/project/{self.project.id}/file/upload'
+
+    def upload(self, content):
+        # The form sends the token before the file, as the template does.
+        self.client.get(self.url)
+        return self.client.post(self.url, {
+            'csrfmiddlewaretoken': self.client.cookies['csrftoken'].value,
+            'file_name': 'notatki',
+            'file': SimpleUploadedFile('notatki.txt', content),
+        })
+
+    def test_oversized_upload_shows_the_size_error(self):
+        response = self.upload(b'a' * (MAX_FILE_SIZE + 128 * 1024))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Plik jest za duży.')
+        self.assertEqual(response['Connection'], 'close')
+        self.assertFalse(Files.objects.exists())
+
+    def test_rejected_upload_is_not_read_to_the_end(self):
+        request = RequestFactory().post(self.url, {
+            'csrfmiddlewaretoken': 'token',
+            'file_name': 'notatki',
+            'file': SimpleUploadedFile('notatki.txt', b'a' * (MAX_FILE_SIZE + 128 * 1024)),
+        })
+        request.user = self.user
+        handler = limit_uploads(request, Files, self.project, FILE_EXTENSIONS)
+        self.assertEqual(request.POST['csrfmiddlewaretoken'], 'token')
+        self.assertTrue(handler.error.startswith('Plik jest za duży.'))
+        self.assertLess(request._stream._pos, MAX_FILE_SIZE)
+
+    @override_settings(STORAGE_QUOTA_PER_USER=10 * 1024)
+    def test_upload_over_quota_shows_the_quota_error(self):
+        # Large enough for the declared length alone to be over the quota.
+        response = self.upload(b'a' * (128 * 1024))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, QUOTA_ERROR)
+        self.assertFalse(Files.objects.exists())
+
+    @override_settings(STORAGE_QUOTA_PER_USER=10 * 1024)
+    def test_upload_over_quota_while_streaming_shows_the_quota_error(self):
+        response = self.upload(b'a' * (20 * 1024))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, QUOTA_ERROR)
+        self.assertFalse(Files.objects.exists())
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), BACKGROUND_TASKS_SYNC=True)
+class ChunkedUploadTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('autor', password='haslo')
+        self.project = Projects.objects.create(project_name='projekt', user=self.user)
+        self.upload = start_upload(self.project, self.user, 'file', 'notatki', 'notatki.txt', 8)
+
+    def test_chunk_moves_the_offset_and_releases_the_claim(self):
+        write_chunk(self.upload, 0, io.BytesIO(b'abcd'), 4)
+        self.upload.refresh_from_db()
+        self.assertEqual(self.upload.offset, 4)
+        self.assertIsNone(self.upload.claimedAt)
+
+    def test_chunk_at_a_claimed_offset_is_not_written(self):
+        # Another request is writing at the same offset.
+        ChunkedUploads.objects.filter(id=self.upload.id).update(claimedAt=timezone.now())
+        with self.assertRaises(UploadError) as raised:
+            write_chunk(self.upload, 0, io.BytesIO(b'abcd'), 4)
+        self.assertEqual(raised.exception.status, 409)
+        with open(temp_path(self.upload), 'rb') as written:
+            self.assertEqual(written.read(), b'')
+
+    def test_finish_with_a_taken_name_removes_the_upload(self):
+        write_chunk(self.upload, 0, io.BytesIO(b'abcdefgh'), 8)
+        # Created after the upload started, the name is checked again on finish.
+        Files.objects.create(
+            file_name='notatki', file=ContentFile(b'inne', name='inne.txt'),
+            project=self.project, user=self.user,
+        )
+        path = temp_path(self.upload)
+        with self.assertRaises(UploadError) as raised:
+            finish_upload(self.upload)
+        self.assertEqual(raised.exception.status, 409)
+        self.assertFalse(ChunkedUploads.objects.exists())
+        self.assertFalse(os.path.exists(path))
+
+    def test_finish_of_a_claimed_upload_is_refused(self):
+        write_chunk(self.upload, 0, io.BytesIO(b'abcdefgh'), 8)
+        # Another request is finishing the same upload.
+        ChunkedUploads.objects.filter(id=self.upload.id).update(claimedAt=timezone.now())
+        with self.assertRaises(UploadError) as raised:
+            finish_upload(self.upload)
+        self.assertEqual(raised.exception.status, 409)
+        self.assertFalse(Files.objects.exists())
+        self.assertTrue(os.path.exists(temp_path(self.upload)))
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class PlotReaderTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('autor', password='haslo')
+        self.project = Projects.objects.create(project_name='projekt', user=self.user)
+
+    def test_segments_start_only_at_headings(self):
+        text = '\n'.join([
+            'Rozdział 1. Początek',
+            'Part of the day was spent at home.',
+            'ill',
+            'civil',
+            'Część z nich wróciła.',
+            'Chapter 5 was the hardest to write.',
+            'Rozdział 2. Tego dnia padało, więc zostali w domu.',
+            'Chapter II: The Storm',
+            'Prologue to the evening, she said.',
+            'IV',
+            'Koniec.',
+        ]) + '\n'
+        main_file = MainFiles.objects.create(
+            file_name='powiesc', file=ContentFile(text.encode(), name='powiesc.txt'),
+            project=self.project, user=self.user,
+        )
+        page = reader_page(main_file, 1)
+        self.assertEqual(
+            [title for number, title in page['contents']],
+            ['Rozdział 1. Początek', 'Chapter II: The Storm', 'IV'],
+        )
+        self.assertIn('Rozdział 2. Tego dnia padało', page['text'])
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), BACKGROUND_TASKS_SYNC=True)
+class BlobReferenceTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('autor', password='haslo')
+        self.project = Projects.objects.create(project_name='projekt', user=self.user)
+
+    def create(self, file_name, content=b'ta sama tresc'):
+        return Files.objects.create(
+            file_name=file_name, file=ContentFile(content, name=f'{file_name}.txt'),
+            project=self.project, user=self.user,
+        )
+
+    def test_identical_contents_share_one_blob(self):
+        first, second = self.create('pierwszy'), self.create('drugi')
+        sha256 = blob_sha256(first.file.name)
+        self.assertEqual(blob_sha256(second.file.name), sha256)
+        self.assertEqual(first.file.path, second.file.path)
+        self.assertEqual(Blobs.objects.get(sha256=sha256).references, 2)
+
+    def test_blob_is_removed_with_its_last_reference(self):
+        first, second = self.create('pierwszy'), self.create('drugi')
+        storage = first.file.storage
+        sha256 = blob_sha256(first.file.name)
+        path = first.file.path
+        derivative = storage.derivative_path(sha256, 'miniatura.png')
+        os.makedirs(os.path.dirname(derivative))
+        open(derivative, 'wb').close()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertEqual(Blobs.objects.get(sha256=sha256).references, 1)
+        self.assertTrue(os.path.exists(path))
+        self.assertTrue(os.path.exists(derivative))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(Blobs.objects.filter(sha256=sha256).exists())
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(os.path.exists(storage.derivative_path(sha256)))
+
+    def test_extracted_text_is_removed_with_the_last_reference(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            first, second = self.create('pierwszy', b'opowiesc o smoku'), self.create('drugi', b'opowiesc o smoku')
+        self.assertTrue(FileContents.objects.filter(sha256=first.sha256).exists())
+        self.assertEqual(self.file_matches('smoku'), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertEqual(self.file_matches('smoku'), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(FileContents.objects.filter(sha256=first.sha256).exists())
+        self.assertEqual(self.file_matches('smoku'), 0)
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {FILE_FTS_TABLE} ({FILE_FTS_TABLE}) VALUES ('integrity-check')")
+
+    def file_matches(self, word):
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT COUNT(*) FROM {FILE_FTS_TABLE} WHERE {FILE_FTS_TABLE} MATCH %s', [word])
+            return cursor.fetchone()[0]
+
+    def test_blob_removed_before_the_reference_is_written_again(self):
+        storage = Files._meta.get_field('file').storage
+        content = ContentFile(b'usuniety w miedzyczasie', name='notatki.txt')
+        name = storage.save('notatki.txt', content)
+        # A delete() of the last other reference ran between _save and add_reference.
+        os.remove(storage.path(name))
+        add_reference(name, content.size, storage, content)
+        self.assertTrue(os.path.exists(storage.path(name)))
+        with storage.open(name) as stored:
+            self.assertEqual(stored.read(), b'usuniety w miedzyczasie')
+        self.assertEqual(Blobs.objects.get(sha256=blob_sha256(name)).references, 1)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), BACKGROUND_TASKS_SYNC=True, STORAGE_COMPRESS_EXTENSIONS=[])
+class DownloadTests(TestCase):
+    content = b'abcdefghijklmnopqrstuvwxyz'
+
+    def setUp(self):
+        self.user = User.objects.create_user('autor', password='haslo')
+        self.project = Projects.objects.create(project_name='projekt', user=self.user)
+        self.file = Files.objects.create(
+            file_name='alfabet', file=ContentFile(self.content, name='alfabet.txt'),
+            project=self.project, user=self.user,
+        )
+        self.client.force_login(self.user)
+        self.url = f'/project/{self.project.id}/file/{self.file.id}/download'
+
+    def get(self, **headers):
+        response = self.client.get(self.url, headers=headers)
+        body = b''.join(response.streaming_content) if response.streaming else response.content
+        return response, body
+
+    def test_parse_range(self):
+        self.assertEqual(parse_range('bytes=0-4', 26), (0, 4))
+        self.assertEqual(parse_range('bytes=-5', 26), (21, 25))
+        self.assertEqual(parse_range('bytes=20-', 26), (20, 25))
+        self.assertEqual(parse_range('bytes=20-100', 26), (20, 25))
+        self.assertIs(parse_range('bytes=26-', 26), False)
+        self.assertIs(parse_range('bytes=-0', 26), False)
+        self.assertIsNone(parse_range('bytes=0-1,5-6', 26))
+        self.assertIsNone(parse_range('items=0-1', 26))
+
+    def test_whole_file(self):
+        response, body = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body, self.content)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(response['ETag'], f'"{self.file.sha256}"')
+
+    def test_single_range(self):
+        response, body = self.get(Range='bytes=2-5')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(body, b'cdef')
+        self.assertEqual(response['Content-Range'], 'bytes 2-5/26')
+        self.assertEqual(response['Content-Length'], '4')
+
+    def test_suffix_range(self):
+        response, body = self.get(Range='bytes=-3')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(body, b'xyz')
+        self.assertEqual(response['Content-Range'], 'bytes 23-25/26')
+
+    def test_open_range(self):
+        response, body = self.get(Range='bytes=24-')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(body, b'yz')
+        self.assertEqual(response['Content-Range'], 'bytes 24-25/26')
+
+    def test_unsatisfiable_range(self):
+        response, _ = self.get(Range='bytes=30-40')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */26')
+
+    def test_if_none_match_gives_304(self):
+        etag = self.get()[0]['ETag']
+        response, body = self.get(If_None_Match=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(body, b'')
+        self.assertEqual(self.get(If_None_Match='"inny"')[0].status_code, 200)
+
+    def test_if_modified_since_gives_304(self):
+        last_modified = self.get()[0]['Last-Modified']
+        self.assertEqual(self.get(If_Modified_Since=last_modified)[0].status_code, 304)
+        self.assertEqual(self.get(If_Modified_Since=http_date(0))[0].status_code, 200)
+
+    def test_if_range(self):
+        first, _ = self.get()
+        response, body = self.get(Range='bytes=0-1', If_Range=first['ETag'])
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(body, b'ab')
+        response, _ = self.get(Range='bytes=0-1', If_Range=first['Last-Modified'])
+        self.assertEqual(response.status_code, 206)
+        # A changed file is sent whole.
+        response, body = self.get(Range='bytes=0-1', If_Range='"inny"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body, self.content)
+        response, _ = self.get(Range='bytes=0-1', If_Range=http_date(0))
+        self.assertEqual(response.status_code, 200)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), BACKGROUND_TASKS_SYNC=True)
+class ImportTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('autor', password='haslo')
+        self.project = Projects.objects.create(project_name='projekt', user=self.user)
+        hero = Tags.objects.create(tag_name='bohater', project=self.project, user=self.user)
+        Tags.objects.create(tag_name='miejsce', project=self.project, user=self.user)
+        anna = ProjectObjects.objects.create(
+            object_name='Anna', object_description='Siostra', project=self.project, user=self.user,
+        )
+        jan = ProjectObjects.objects.create(
+            object_name='Jan', object_description='Brat', project=self.project, user=self.user,
+        )
+        anna.tags.add(hero)
+        anna.connections.add(jan)
+        Files.objects.create(
+            file_name='notatki', file=ContentFile(b'notatki do fabuly', name='notatki.txt'),
+            project=self.project, user=self.user,
+        )
+        MainFiles.objects.create(
+            file_name='fabula', file=ContentFile(b'Rozdzial 1\nPoczatek\n', name='fabula.txt'),
+            project=self.project, user=self.user,
+        )
+
+    def export(self):
+        return io.BytesIO(b''.join(project_archive(self.project)))
+
+    def archive(self, content, sha256=None):
+        """Archive with a single file whose manifest claims the given hash."""
+        sha256 = sha256 or hashlib.sha256(content).hexdigest()
+        manifest = {
+            'format': ARCHIVE_FORMAT, 'project': {'name': 'obcy'}, 'tags': [], 'objects': [], 'connections': [],
+            'files': [{'kind': 'file', 'file_name': 'obcy', 'filename': 'obcy.txt', 'path': 'files/obcy', 'sha256': sha256}],
+        }
+        data = io.BytesIO()
+        with zipfile.ZipFile(data, 'w') as archive:
+            archive.writestr(MANIFEST_NAME, json.dumps(manifest))
+            archive.writestr('files/obcy', content)
+        data.seek(0)
+        return data
+
+    def test_exported_project_is_imported_whole(self):
+        summary = import_archive(self.export(), self.user, project_name='kopia')
+        copy = summary['project']
+        self.assertEqual(copy.project_name, 'kopia')
+        self.assertEqual(summary['created'], {'tags': 2, 'objects': 2, 'tag_links': 1, 'connections': 1, 'files': 2})
+        self.assertEqual(
+            set(Tags.objects.filter(project=copy).values_list('tag_name', flat=True)), {'bohater', 'miejsce'},
+        )
+        anna = ProjectObjects.objects.get(project=copy, object_name='Anna')
+        self.assertEqual(anna.object_description, 'Siostra')
+        self.assertEqual([tag.tag_name for tag in anna.tags.all()], ['bohater'])
+        self.assertEqual([target.object_name for target in anna.connections.all()], ['Jan'])
+
+        for model in (Files, MainFiles):
+            original = model.objects.get(project=self.project)
+            imported = model.objects.get(project=copy)
+            self.assertEqual(imported.file_name, original.file_name)
+            self.assertEqual(imported.sha256, original.sha256)
+            with imported.file.open('rb') as stored:
+                self.assertEqual(stored.read(), original.file.open('rb').read())
+            original.file.close()
+            self.assertEqual(Blobs.objects.get(sha256=original.sha256).references, 2)
+
+    def test_taken_names_are_reported_not_created(self):
+        summary = import_archive(self.export(), self.user, project=self.project)
+        self.assertEqual(summary['created'], {'tags': 0, 'objects': 0, 'tag_links': 0, 'connections': 0, 'files': 0})
+        self.assertEqual(summary['conflicts']['tags'], {'count': 2, 'names': ['bohater', 'miejsce']})
+        self.assertEqual(summary['conflicts']['objects'], {'count': 2, 'names': ['Anna', 'Jan']})
+        self.assertEqual(summary['conflicts']['files'], {'count': 2, 'names': ['notatki', 'fabula']})
+        self.assertEqual(Tags.objects.filter(project=self.project).count(), 2)
+        self.assertEqual(ProjectObjects.objects.filter(project=self.project).count(), 2)
+        self.assertEqual(Files.objects.filter(project=self.project).count(), 1)
+
+    def test_file_with_a_wrong_hash_is_not_stored(self):
+        sha256 = hashlib.sha256(b'inna tresc').hexdigest()
+        summary = import_archive(self.archive(b'podmieniona tresc', sha256), self.user)
+        self.assertEqual(summary['invalid']['files'], {'count': 1, 'names': ['obcy']})
+        self.assertEqual(summary['created']['files'], 0)
+        storage = Files._meta.get_field('file').storage
+        self.assertIsNone(storage._stored_blob(sha256))
+        self.assertIsNone(storage._stored_blob(hashlib.sha256(b'podmieniona tresc').hexdigest()))
+
+    @override_settings(STORAGE_QUOTA_PER_USER=1024)
+    def test_import_over_quota_is_rolled_back(self):
+        content = b'x' * 2048
+        storage = Files._meta.get_field('file').storage
+        with self.assertRaises(ArchiveImportError):
+            import_archive(self.archive(content), self.user)
+        self.assertFalse(Projects.objects.filter(project_name='obcy').exists())
+        self.assertFalse(Files.objects.filter(file_name='obcy').exists())
+        sha256 = hashlib.sha256(content).hexdigest()
+        self.assertIsNone(storage._stored_blob(sha256))
+        self.assertFalse(Blobs.objects.filter(sha256=sha256).exists())
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), BACKGROUND_TASKS_SYNC=True)
+class ProjectDeletionTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('autor', password='haslo')
+        self.project = Projects.objects.create(project_name='projekt', user=self.user)
+        self.kept = Projects.objects.create(project_name='zostaje', user=self.user)
+        tag = Tags.objects.create(tag_name='bohater', project=self.project, user=self.user)
+        anna = ProjectObjects.objects.create(
+            object_name='Anna', object_description='Siostra', project=self.project, user=self.user,
+        )
+        jan = ProjectObjects.objects.create(
+            object_name='Jan', object_description='Brat', project=self.project, user=self.user,
+        )
+        anna.tags.add(tag)
+        anna.connections.add(jan)
+        ProjectObjects.objects.create(
+            object_name='Ewa', object_description='Sasiadka', project=self.kept, user=self.user,
+        )
+        self.shared = self.create(self.project, 'wspolny', b'tresc w obu projektach')
+        self.own = self.create(self.project, 'wlasny', b'tresc tylko tego projektu')
+        self.create(self.kept, 'wspolny', b'tresc w obu projektach')
+
+    def create(self, project, file_name, content):
+        return Files.objects.create(
+            file_name=file_name, file=ContentFile(content, name=f'{file_name}.txt'), project=project, user=self.user,
+        )
+
+    def indexed_objects(self, project):
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT COUNT(*) FROM {FTS_TABLE} WHERE project_id = %s', [project.id])
+            return cursor.fetchone()[0]
+
+    def assert_deleted(self):
+        self.assertFalse(Projects.objects.filter(id=self.project.id).exists())
+        deletion = ProjectDeletions.objects.get(project_name='projekt')
+        self.assertIsNotNone(deletion.finishedAt)
+        self.assertEqual(deletion.progress(), 100)
+        for model in (Tags, ProjectObjects, Files):
+            self.assertFalse(model.objects.filter(project_id=self.project.id).exists())
+
+        self.assertEqual(Blobs.objects.get(sha256=self.shared.sha256).references, 1)
+        self.assertTrue(os.path.exists(self.shared.file.path))
+        self.assertFalse(Blobs.objects.filter(sha256=self.own.sha256).exists())
+        self.assertIsNone(self.own.file.storage._stored_blob(self.own.sha256))
+
+        kept_size = Files.objects.get(project=self.kept).size
+        self.assertEqual(StorageUsages.objects.get(user=self.user).used, kept_size)
+        self.kept.refresh_from_db()
+        self.assertEqual(self.kept.storage_used, kept_size)
+
+        self.assertEqual(self.indexed_objects(self.project), 0)
+        self.assertEqual(self.indexed_objects(self.kept), 1)
+
+    def test_project_is_deleted_with_its_rows_and_files(self):
+        self.assertEqual(self.indexed_objects(self.project), 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            deletion = start_deletion(self.project)
+        self.assertEqual(deletion.total, 7)
+        self.assert_deleted()
+
+    def test_interrupted_deletion_is_resumed(self):
+        # The background task never ran, as after a restart, and one batch was done.
+        start_deletion(self.project)
+        self.assertTrue(Projects.objects.get(id=self.project.id).deleting)
+        tag_links = _querysets(self.project.id)[0]
+        self.assertEqual(_delete_batch(tag_links.model, tag_links), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(resume_deletions(), 1)
+        self.assert_deleted()
+        self.assertEqual(resume_deletions(), 0)
+
+
+class TagQueryParserTests(TestCase):
+
+    def test_not_binds_tighter_than_and_and_and_tighter_than_or(self):
+        self.assertEqual(
+            parse('a OR NOT b AND c'),
+            ('or', ('tag', 'a'), ('and', ('not', ('tag', 'b')), ('tag', 'c'))),
+        )
+        self.assertEqual(parse('a AND b OR c'), ('or', ('and', ('tag', 'a'), ('tag', 'b')), ('tag', 'c')))
+
+    def test_adjacent_terms_are_joined_with_and(self):
+        self.assertEqual(parse('a NOT b'), ('and', ('tag', 'a'), ('not', ('tag', 'b'))))
+
+    def test_parentheses_group(self):
+        self.assertEqual(parse('a AND (b OR c)'), ('and', ('tag', 'a'), ('or', ('tag', 'b'), ('tag', 'c'))))
+        self.assertEqual(parse('NOT (a OR b)'), ('not', ('or', ('tag', 'a'), ('tag', 'b'))))
+
+    def test_operators_ignore_case_and_quotes_keep_spaces(self):
+        self.assertEqual(parse('a or "druga postac"'), ('or', ('tag', 'a'), ('tag', 'druga postac')))
+        self.assertEqual(parse('"AND"'), ('tag', 'AND'))
+
+    def test_malformed_queries_raise(self):
+        for text in ('', '   ', 'a AND', 'OR a', '(a OR b', 'a)', '()', 'NOT', 'a "b'):
+            with self.subTest(text=text), self.assertRaises(TagQueryError):
+                parse(text)
+
+
+class TagQueryFilterTests(TestCase):
+
+    def setUp(self):
+        user = User.objects.create_user('autor', password='haslo')
+        self.project = Projects.objects.create(project_name='projekt', user=user)
+        hero = Tags.objects.create(tag_name='bohater', project=self.project, user=user)
+        family = Tags.objects.create(tag_name='rodzina', project=self.project, user=user)
+        for name, tags in (('Anna', [hero, family]), ('Jan', [hero]), ('Ewa', [family]), ('Piotr', [])):
+            ProjectObjects.objects.create(
+                object_name=name, object_description='', project=self.project, user=user,
+            ).tags.set(tags)
+        other = Projects.objects.create(project_name='inny', user=user)
+        ProjectObjects.objects.create(
+            object_name='Obcy', object_description='', project=other, user=user,
+        ).tags.set([Tags.objects.create(tag_name='bohater', project=other, user=user)])
+
+    def names(self, text):
+        tree, _ = resolve(parse(text), self.project)
+        return sorted(filter_queryset(self.project, tree).values_list('object_name', flat=True))
+
+    def test_and(self):
+        self.assertEqual(self.names('bohater AND rodzina'), ['Anna'])
+
+    def test_or(self):
+        self.assertEqual(self.names('bohater OR rodzina'), ['Anna', 'Ewa', 'Jan'])
+
+    def test_not(self):
+        self.assertEqual(self.names('NOT bohater'), ['Ewa', 'Piotr'])
+        self.assertEqual(self.names('bohater NOT rodzina'), ['Jan'])
+
+    def test_counts(self):
+        tree, tags = resolve(parse('bohater OR rodzina'), self.project)
+        ids = {tag.tag_name: tag.id for tag in tags}
+        self.assertEqual(
+            filter_counts(self.project, tree),
+            {'total': 3, 'tags': {ids['bohater']: 2, ids['rodzina']: 2}},
+        )
+
+    def test_unknown_tag_raises(self):
+        with self.assertRaises(TagQueryError):
+            resolve(parse('bohater AND zloczynca'), self.project)
+
+
+class ShortestPathTests(TestCase):
+
+    def setUp(self):
+        # 1 -> 2 -> 3 -> 4, 1 -> 5 -> 4, 6 -> 3; 7 is alone.
+        self.adjacency = Adjacency([(1, 2), (2, 3), (3, 4), (1, 5), (5, 4), (6, 3), (7, 7)])
+
+    def test_source_is_target(self):
+        self.assertEqual(shortest_path(self.adjacency, 2, 2), [2])
+        self.assertEqual(shortest_path(self.adjacency, 99, 99), [99])
+
+    def test_shortest_of_several_paths(self):
+        self.assertEqual(shortest_path(self.adjacency, 1, 4, 'out'), [1, 5, 4])
+        self.assertEqual(shortest_path(self.adjacency, 1, 3, 'out'), [1, 2, 3])
+
+    def test_direction(self):
+        self.assertIsNone(shortest_path(self.adjacency, 4, 1, 'out'))
+        self.assertEqual(shortest_path(self.adjacency, 4, 1, 'in'), [4, 5, 1])
+        self.assertIsNone(shortest_path(self.adjacency, 1, 4, 'in'))
+        self.assertIsNone(shortest_path(self.adjacency, 1, 6, 'out'))
+        self.assertEqual(shortest_path(self.adjacency, 1, 6, 'both'), [1, 2, 3, 6])
+
+    def test_no_path(self):
+        self.assertIsNone(shortest_path(self.adjacency, 1, 7))
+        self.assertIsNone(shortest_path(self.adjacency, 1, 99))
+
+    def test_changes_are_followed(self):
+        changed = self.adjacency.changes(removed=[(5, 4)], added=[(4, 7)])
+        self.assertEqual(shortest_path(changed, 1, 4, 'out'), [1, 2, 3, 4])
+        self.assertEqual(shortest_path(changed, 1, 7, 'out'), [1, 2, 3, 4, 7])
+        self.assertEqual(shortest_path(self.adjacency, 1, 4, 'out'), [1, 5, 4])
+        removed = changed.changes(removed_nodes=[3])
+        self.assertIsNone(shortest_path(removed, 1, 7, 'out'))
+
+    @override_settings(GRAPH_MAX_DEPTH=2)
+    def test_depth_is_clamped_to_the_limit(self):
+        self.assertEqual(clamp_depth('10'), 2)
+        self.assertEqual(clamp_depth('0'), 1)
+        self.assertEqual(clamp_depth('x'), 1)
+
+    @override_settings(GRAPH_MAX_DEPTH=2)
+    def test_neighbourhood_stops_at_the_depth_limit(self):
+        user = User.objects.create_user('autor', password='haslo')
+        project = Projects.objects.create(project_name='projekt', user=user)
+        chain = [
+            ProjectObjects.objects.create(object_name=name, object_description='', project=project, user=user)
+            for name in ('A', 'B', 'C', 'D')
+        ]
+        for source, target in zip(chain, chain[1:]):
+            source.connections.add(target)
+        self.client.force_login(user)
+        response = self.client.get(
+            f'/project/{project.id}/object/{chain[0].id}/neighbourhood/json', {'depth': 10, 'direction': 'out'},
+        )
+        self.assertEqual(response.json()['depth'], 2)
+        self.assertEqual([node['name'] for node in response.json()['nodes']], ['A', 'B', 'C'])
+
+    def test_cache_stays_within_its_budget(self):
+        cache = AdjacencyCache()
+        first, second = Adjacency([(1, 2)]), Adjacency([(3, 4)])
+        with override_settings(GRAPH_CACHE_BYTES=first.nbytes + second.nbytes - 1):
+            cache.put(1, 0, first)
+            cache.put(2, 0, second)
+            self.assertIsNone(cache.get(1, 0))
+            self.assertIs(cache.get(2, 0), second)
+            self.assertLessEqual(cache.nbytes, first.nbytes + second.nbytes - 1)
+        with override_settings(GRAPH_CACHE_BYTES=first.nbytes - 1):
+            cache.put(1, 0, first)
+            self.assertIsNone(cache.get(1, 0))
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), BACKGROUND_TASKS_SYNC=True, STORAGE_COMPRESS_EXTENSIONS=['txt'])
+class CompressedStorageTests(TestCase):
+    content = 'Rozdział 1\n'.encode() + b'tekst, ktory dobrze sie kompresuje. ' * 200
+
+    def setUp(self):
+        self.user = User.objects.create_user('autor', password='haslo')
+        self.project = Projects.objects.create(project_name='projekt', user=self.user)
+        self.file = Files.objects.create(
+            file_name='notatki', file=ContentFile(self.content, name='notatki.txt'),
+            project=self.project, user=self.user,
+        )
+
+    def test_text_is_gzipped_on_disk(self):
+        storage = self.file.file.storage
+        name = self.file.file.name
+        path = storage.path(name)
+        self.assertTrue(storage.is_compressed(name))
+        self.assertTrue(path.endswith('.gz'))
+        self.assertLess(os.path.getsize(path), len(self.content))
+        with open(path, 'rb') as stored:
+            self.assertEqual(gzip.decompress(stored.read()), self.content)
+
+    def test_storage_gives_the_original_bytes(self):
+        storage = self.file.file.storage
+        name = self.file.file.name
+        self.assertEqual(storage.size(name), len(self.content))
+        self.assertEqual(self.file.size, len(self.content))
+        with storage.open(name, 'rb') as stored:
+            self.assertEqual(stored.read(), self.content)
+
+    def test_download_gives_the_original_bytes(self):
+        self.client.force_login(self.user)
+        url = f'/project/{self.project.id}/file/{self.file.id}/download'
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Content-Encoding', response)
+        self.assertEqual(response['Content-Length'], str(len(self.content)))
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+
+        response = self.client.get(url, headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), self.content)
+
+        response = self.client.get(url, headers={'Range': 'bytes=0-9'})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), self.content[:10])
+
+
+@project_required
+def _project_view(request, project):
+    return HttpResponse(project.project_name)
+
+
+@project_child_required(Tags, 'tag_pk')
+def _tag_view(request, project, tag):
+    return HttpResponse(f'{project.project_name}/{tag.tag_name}')
+
+
+class ResolverTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('autor', password='haslo')
+        self.other = User.objects.create_user('inny', password='haslo')
+        self.project = Projects.objects.create(project_name='projekt', user=self.user)
+        self.tag = Tags.objects.create(tag_name='postac', project=self.project, user=self.user)
+        self.other_project = Projects.objects.create(project_name='cudzy', user=self.other)
+        self.other_tag = Tags.objects.create(tag_name='postac', project=self.other_project, user=self.other)
+
+    def request(self):
+        request = RequestFactory().get('/')
+        request.user = self.user
+        return request
+
+    def test_project_and_child_are_resolved_in_one_query(self):
+        request = self.request()
+        with self.assertNumQueries(1):
+            tag = get_project_child(request, Tags, self.project.id, self.tag.id)
+            self.assertEqual(tag.project, self.project)
+        # Both are memoized for the request.
+        with self.assertNumQueries(0):
+            self.assertEqual(get_project(request, self.project.id), self.project)
+            self.assertEqual(get_project_child(request, Tags, self.project.id, self.tag.id), tag)
+
+    def test_decorated_views_run_one_query(self):
+        with self.assertNumQueries(1):
+            response = _project_view(self.request(), project_pk=str(self.project.id))
+        self.assertEqual(response.content, b'projekt')
+        with self.assertNumQueries(1):
+            response = _tag_view(self.request(), project_pk=str(self.project.id), tag_pk=str(self.tag.id))
+        self.assertEqual(response.content, b'projekt/postac')
+
+    def test_other_users_project_is_not_found(self):
+        self.assertIsNone(get_project(self.request(), self.other_project.id))
+        with self.assertRaises(Http404):
+            _project_view(self.request(), project_pk=str(self.other_project.id))
+
+    def test_other_users_child_is_not_found(self):
+        request = self.request()
+        self.assertIsNone(get_project_child(request, Tags, self.other_project.id, self.other_tag.id))
+        self.assertIsNone(get_project_child(request, Tags, self.project.id, self.other_tag.id))
+        with self.assertRaises(Http404):
+            _tag_view(self.request(), project_pk=str(self.other_project.id), tag_pk=str(self.other_tag.id))
+        with self.assertRaises(Http404):
+            _tag_view(self.request(), project_pk=str(self.project.id), tag_pk=str(self.other_tag.id))
+
+    def test_project_being_deleted_is_not_found(self):
+        Projects.objects.filter(id=self.project.id).update(deleting=True)
+        self.assertIsNone(get_project(self.request(), self.project.id))
+        self.assertIsNone(get_project_child(self.request(), Tags, self.project.id, self.tag.id))
+        with self.assertRaises(Http404):
+            _project_view(self.request(), project_pk=str(self.project.id))
+        with self.assertRaises(Http404):
+            _tag_view(self.request(), project_pk=str(self.project.id), tag_pk=str(self.tag.id))
+
+    def test_malformed_ids_are_not_found(self):
+        with self.assertRaises(Http404):
+            _project_view(self.request(), project_pk='x')
+        with self.assertRaises(Http404):
+            _tag_view(self.request(), project_pk=str(self.project.id), tag_pk='x')
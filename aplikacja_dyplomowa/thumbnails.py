@@ -0,0 +1,90 @@
+import logging
+import os
+import tempfile
+
+from .extraction import file_sha256
+from .storage import blob_sha256
+
+
+logger = logging.getLogger(__name__)
+
+# Longest edge in pixels, the gallery uses the smallest one.
+THUMBNAIL_SIZES = (128, 512)
+
+THUMBNAIL_FORMAT = 'webp'
+
+THUMBNAIL_CONTENT_TYPE = 'image/webp'
+
+THUMBNAIL_MAX_AGE = 365 * 24 * 60 * 60
+
+
+def content_sha256(instance):
+    return instance.sha256 or blob_sha256(instance.file.name) or file_sha256(instance.file)
+
+
+def thumbnail_path(field_file, sha256, size):
+    return field_file.storage.derivative_path(sha256, f'thumbnail_{size}.{THUMBNAIL_FORMAT}')
+
+
+def _save_image(image, path):
+    # Written under a temporary name and renamed, readers never see half a file.
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    descriptor, temporary = tempfile.mkstemp(dir=directory, suffix='.part')
+    try:
+        with os.fdopen(descriptor, 'wb') as output:
+            image.save(output, THUMBNAIL_FORMAT.upper(), quality=80, method=4)
+        os.replace(temporary, path)
+    except BaseException:
+        os.remove(temporary)
+        raise
+
+
+def generate_thumbnails(field_file, sha256, sizes=THUMBNAIL_SIZES):
+    """
+    Write the missing thumbnails of an image. The image is decoded once;
+    JPEGs are decoded at a reduced scale already, and every smaller size is
+    scaled down from the previous one. Returns False when the file can not
+    be turned into thumbnails.
+    """
+    missing = sorted((size for size in sizes if not os.path.exists(thumbnail_path(field_file, sha256, size))), reverse=True)
+    if not missing:
+        return True
+
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:
+        return False
+
+    try:
+        with field_file.storage.open(field_file.name, 'rb') as source, Image.open(source) as image:
+            image.draft('RGB', (missing[0], missing[0]))
+            image = ImageOps.exif_transpose(image)
+            if image.mode not in ('RGB', 'RGBA'):
+                image = image.convert('RGBA' if 'transparency' in image.info or image.mode in ('LA', 'PA') else 'RGB')
+            for size in missing:
+                image.thumbnail((size, size), Image.LANCZOS)
+                _save_image(image, thumbnail_path(field_file, sha256, size))
+    except (OSError, ValueError, Image.DecompressionBombError):
+        logger.warning('Could not create thumbnails of %s', field_file.name, exc_info=True)
+        return False
+    return True
+
+
+def thumbnail_file(model, pk):
+    """Background task run after an upload."""
+    instance = model.objects.filter(pk=pk).first()
+    if instance is None or not instance.file or not instance.is_image():
+        return
+    generate_thumbnails(instance.file, content_sha256(instance))
+
+
+def get_thumbnail(instance, size):
+    """Path of a thumbnail, made on the spot when the background task did not run yet. None for non-images."""
+    if size not in THUMBNAIL_SIZES or not instance.file or not instance.is_image():
+        return None
+    sha256 = content_sha256(instance)
+    path = thumbnail_path(instance.file, sha256, size)
+    if os.path.exists(path) or generate_thumbnails(instance.file, sha256):
+        return path
+    return None
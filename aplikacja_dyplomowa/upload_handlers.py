@@ -0,0 +1,94 @@
+from django.core.files.uploadhandler import FileUploadHandler, StopUpload
+
+from .custom_validators import MAX_FILE_SIZE
+from .metadata import content_matches_extension
+from .quotas import remaining
+
+
+# Room for the other form fields and the multipart boundaries.
+FORM_OVERHEAD = 64 * 1024
+
+QUOTA_ERROR = 'Przekroczono limit miejsca na pliki.'
+
+
+class LimitedUploadHandler(FileUploadHandler):
+    """
+    Goes in front of the default handlers of a form upload. The declared
+    size is checked before the body is read, the name, extension and magic
+    bytes before the first chunk is passed on, and the byte count while
+    the file streams in. A rejected upload stops the parser at the file, so
+    the fields sent before it (the CSRF token too) are still read but the
+    rest of the body is not, and nothing of the file is written to a
+    temporary file or the storage; error tells why.
+    """
+
+    def __init__(self, request, extensions, max_size=MAX_FILE_SIZE, name_taken=None, quota_left=None):
+        super().__init__(request)
+        self.extensions = extensions
+        self.max_size = max_size
+        self.name_taken = name_taken
+        self.quota_left = quota_left
+        self.error = None
+        self.pending_error = None
+
+    def _reject(self, error):
+        self.error = error
+        # The rest of the body is not read at all; the fields parsed before
+        # the file are kept. The view answers with Connection: close, the
+        # unread bytes can not be followed by another request.
+        raise StopUpload(connection_reset=True)
+
+    def _too_big(self):
+        return f'Plik jest za duży. Maksymalny rozmiar to {self.max_size // (1024 * 1024)} MB.'
+
+    def _over_quota(self, size):
+        return self.quota_left is not None and size > self.quota_left
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        # The fields before the file, the CSRF token among them, are still
+        # parsed; the upload is stopped when the file part starts.
+        if content_length > self.max_size + FORM_OVERHEAD:
+            self.pending_error = self._too_big()
+        elif self._over_quota(content_length - FORM_OVERHEAD):
+            self.pending_error = QUOTA_ERROR
+        return None
+
+    def new_file(self, field_name, file_name, content_type, content_length, charset=None, content_type_extra=None):
+        super().new_file(field_name, file_name, content_type, content_length, charset, content_type_extra)
+        if self.pending_error:
+            self._reject(self.pending_error)
+        if file_name.rsplit('.', 1)[-1].lower() not in self.extensions:
+            self._reject(f'Niedozwolony rodzaj pliku. Akceptowane rozszerzenia to: {", ".join(self.extensions)}')
+        if content_length is not None and content_length > self.max_size:
+            self._reject(self._too_big())
+        # Best effort only: form fields are not visible to upload handlers,
+        # so the name is checked here just when chunked_upload.js put it in
+        # the form action as ?file_name=. Without it (no JavaScript, other
+        # clients) the file is received and the view rejects a taken name
+        # after parsing.
+        name = self.request.GET.get('file_name')
+        if name and self.name_taken is not None and self.name_taken(name):
+            self._reject('Plik o takiej nazwie już istnieje')
+
+    def receive_data_chunk(self, raw_data, start):
+        if start == 0 and not content_matches_extension(raw_data[:16], self.file_name):
+            self._reject('Zawartość pliku nie zgadza się z jego rozszerzeniem.')
+        if start + len(raw_data) > self.max_size:
+            self._reject(self._too_big())
+        if self._over_quota(start + len(raw_data)):
+            self._reject(QUOTA_ERROR)
+        return raw_data
+
+    def file_complete(self, file_size):
+        return None
+
+
+def limit_uploads(request, model, project, extensions):
+    """Install a LimitedUploadHandler for a Files/MainFiles upload form. Has to run before request.POST is read."""
+    handler = LimitedUploadHandler(
+        request, extensions,
+        name_taken=lambda name: model.objects.filter(project=project, user=request.user, file_name=name).exists(),
+        quota_left=remaining(project, request.user.id),
+    )
+    request.upload_handlers.insert(0, handler)
+    return handler
@@ -0,0 +1,221 @@
+import hashlib
+import os
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .custom_validators import FILE_EXTENSIONS, MAIN_FILE_EXTENSIONS
+from .metadata import content_matches_extension
+from .models import Files, MainFiles, ChunkedUploads
+from .quotas import QuotaExceeded, check_quota
+
+
+TEMP_DIR = 'uploads_tmp'
+
+READ_SIZE = 64 * 1024
+
+UPLOAD_KINDS = {
+    'file': (Files, FILE_EXTENSIONS),
+    'main_file': (MainFiles, MAIN_FILE_EXTENSIONS),
+}
+
+
+class UploadError(Exception):
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def max_upload_size():
+    return getattr(settings, 'CHUNKED_UPLOAD_MAX_SIZE', 500 * 1024 * 1024)
+
+
+def max_chunk_size():
+    return getattr(settings, 'CHUNKED_UPLOAD_MAX_CHUNK_SIZE', 16 * 1024 * 1024)
+
+
+def claim_timeout():
+    return getattr(settings, 'CHUNKED_UPLOAD_CLAIM_TIMEOUT', 10 * 60)
+
+
+def temp_path(upload):
+    return os.path.join(settings.MEDIA_ROOT, TEMP_DIR, f'{upload.id}.part')
+
+
+def start_upload(project, user, kind, file_name, filename, size):
+    if kind not in UPLOAD_KINDS:
+        raise UploadError('Nieznany rodzaj pliku.')
+    model, extensions = UPLOAD_KINDS[kind]
+
+    if not file_name or len(file_name) > model._meta.get_field('file_name').max_length:
+        raise UploadError('Nazwa pliku jest pusta lub za długa.')
+    filename = os.path.basename(filename or '')
+    if filename.rsplit('.', 1)[-1].lower() not in extensions or '.' not in filename:
+        raise UploadError(f'Niedozwolony rodzaj pliku. Akceptowane rozszerzenia to: {", ".join(extensions)}')
+    try:
+        size = int(size)
+    except (TypeError, ValueError):
+        raise UploadError('Nieprawidłowy rozmiar pliku.')
+    if size <= 0 or size > max_upload_size():
+        raise UploadError(f'Plik jest za duży. Maksymalny rozmiar to {max_upload_size() // (1024 * 1024)} MB.', status=413)
+    if model.objects.filter(project=project, user=user, file_name=file_name).exists():
+        raise UploadError('Plik o takiej nazwie już istnieje', status=409)
+    try:
+        check_quota(project, user.id, size)
+    except QuotaExceeded as exception:
+        raise UploadError(str(exception), status=413)
+
+    upload = ChunkedUploads.objects.create(
+        kind=kind, file_name=file_name, filename=filename, size=size, project=project, user=user,
+    )
+    os.makedirs(os.path.dirname(temp_path(upload)), exist_ok=True)
+    open(temp_path(upload), 'wb').close()
+    return upload
+
+
+@contextmanager
+def _claimed(upload, offset):
+    """
+    Hold the upload at offset for one request, before anything is written.
+    A second request for the same upload gets a 409 until the claim is
+    released, or until it is older than claim_timeout() after a crash.
+    """
+    now = timezone.now()
+    claimed = ChunkedUploads.objects.filter(id=upload.id, offset=offset).filter(
+        Q(claimedAt__isnull=True) | Q(claimedAt__lt=now - timedelta(seconds=claim_timeout())),
+    ).update(claimedAt=now)
+    if not claimed:
+        upload.refresh_from_db(fields=['offset', 'chunks'])
+        raise UploadError(f'Przesyłanie jest w toku w innym żądaniu, oczekiwany offset to {upload.offset}.', status=409)
+    try:
+        yield now
+    finally:
+        ChunkedUploads.objects.filter(id=upload.id, claimedAt=now).update(claimedAt=None)
+
+
+def write_chunk(upload, offset, stream, length, expected_sha256=None):
+    """
+    Write length bytes from stream at offset of the upload's temp file. The
+    offset must be the current one and is claimed before anything is
+    written; the chunk is hashed while it is copied and the offset only
+    moves forward once the whole chunk is on disk.
+    """
+    if offset != upload.offset:
+        raise UploadError(f'Oczekiwany offset to {upload.offset}.', status=409)
+    if length <= 0 or length > max_chunk_size():
+        raise UploadError('Nieprawidłowy rozmiar fragmentu.', status=413)
+    if offset + length > upload.size:
+        raise UploadError('Fragment wykracza poza zadeklarowany rozmiar pliku.', status=413)
+
+    with _claimed(upload, offset) as claim:
+        return _write_claimed_chunk(upload, offset, stream, length, expected_sha256, claim)
+
+
+def _write_claimed_chunk(upload, offset, stream, length, expected_sha256, claim):
+    digest = hashlib.sha256()
+    written = 0
+    with open(temp_path(upload), 'r+b') as output:
+        output.seek(offset)
+        while written < length:
+            data = stream.read(min(READ_SIZE, length - written))
+            if not data:
+                break
+            if offset == written == 0 and not content_matches_extension(data[:16], upload.filename):
+                raise UploadError('Zawartość pliku nie zgadza się z jego rozszerzeniem.', status=415)
+            digest.update(data)
+            output.write(data)
+            written += len(data)
+        output.truncate(offset + written)
+
+    if written != length:
+        raise UploadError('Fragment został przesłany niekompletnie.')
+    chunk_sha256 = digest.hexdigest()
+    if expected_sha256 and expected_sha256.lower() != chunk_sha256:
+        raise UploadError('Suma kontrolna fragmentu się nie zgadza.')
+
+    chunks = upload.chunks + [[offset, length, chunk_sha256]]
+    # A claim taken over after the timeout no longer lets this chunk count.
+    updated = ChunkedUploads.objects.filter(id=upload.id, offset=offset, claimedAt=claim).update(
+        offset=offset + length, chunks=chunks, claimedAt=None, updatedAt=timezone.now(),
+    )
+    if not updated:
+        raise UploadError('Fragment został już zapisany przez inne żądanie.', status=409)
+    upload.offset = offset + length
+    upload.chunks = chunks
+    return chunk_sha256
+
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as source:
+        for block in iter(lambda: source.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def finish_upload(upload, expected_sha256=None):
+    """
+    Add the assembled file to the blob store and create the Files/MainFiles
+    row in one transaction. The upload is claimed for the whole finish, a
+    concurrent finish of it gets a 409.
+    """
+    if upload.offset != upload.size:
+        raise UploadError(f'Plik nie został przesłany w całości ({upload.offset} z {upload.size} bajtów).', status=409)
+
+    with _claimed(upload, upload.size):
+        return _finish_claimed_upload(upload, expected_sha256)
+
+
+def _finish_claimed_upload(upload, expected_sha256):
+    path = temp_path(upload)
+    sha256 = _file_sha256(path)
+    if expected_sha256 and expected_sha256.lower() != sha256:
+        raise UploadError('Suma kontrolna pliku się nie zgadza.')
+
+    try:
+        # Other uploads may have finished since this one started.
+        check_quota(upload.project, upload.user_id, upload.size)
+    except QuotaExceeded as exception:
+        raise UploadError(str(exception), status=413)
+
+    model, _ = UPLOAD_KINDS[upload.kind]
+    field = model._meta.get_field('file')
+    name = field.storage.blob_file_name(sha256, field.storage.get_valid_name(upload.filename), max_length=field.max_length)
+
+    field.storage.link_blob(path, sha256, upload.filename)
+    try:
+        with transaction.atomic():
+            instance = model(file_name=upload.file_name, project=upload.project, user=upload.user, sha256=sha256)
+            instance.file.name = name
+            instance.save()
+            # The row has no uploaded file add_reference could write the blob again from.
+            field.storage.ensure_blob(sha256, upload.filename, path)
+            upload.delete()
+    except IntegrityError:
+        field.storage.delete(name)
+        # The name can not be used, the assembled file is of no further use.
+        abort_upload(upload)
+        raise UploadError('Plik o takiej nazwie już istnieje', status=409)
+    os.remove(path)
+    return instance
+
+
+def abort_upload(upload):
+    if os.path.isfile(temp_path(upload)):
+        os.remove(temp_path(upload))
+    upload.delete()
+
+
+def cleanup_stale_uploads(hours=24):
+    """Remove unfinished uploads not touched for the given number of hours. Returns their number."""
+    stale = ChunkedUploads.objects.filter(updatedAt__lt=timezone.now() - timedelta(hours=hours))
+    removed = 0
+    for upload in stale.iterator():
+        abort_upload(upload)
+        removed += 1
+    return removed
@@ -13,31 +13,51 @@ urlpatterns = [
     path('denied/', views.access_denied, name='access_denied'),
     path('projects/', views.show_projects, name='project_list'),
     path('projects/create', views.create_project, name='create_project'),
+    path('projects/import', views.import_project, name='import_project'),
     path('project/<str:project_pk>/update', views.update_project, name='update_project'),
     path('project/<str:project_pk>/delete', views.delete_project, name='delete_project'),
+    path('projects/deletion/<int:deletion_pk>', views.project_deletion, name='project_deletion'),
     path('project/<str:project_pk>/', views.view_project, name='view_project'),
+    path('project/<str:project_pk>/graph/export', views.project_graph_export, name='project_graph_export'),
+    path('project/<str:project_pk>/export', views.project_export, name='project_export'),
     path('project/<str:project_pk>/tags', views.tag_list, name='tag_list'),
     path('project/<str:project_pk>/tag/create', views.tag_create, name='tag_create'),
     path('project/<str:project_pk>/tag/<str:tag_pk>/update', views.tag_update, name='tag_update'),
     path('project/<str:project_pk>/tag/<str:tag_pk>/delete', views.tag_delete, name='tag_delete'),
     path('project/<str:project_pk>/objects', views.object_list, name='object_list'),
+    path('project/<str:project_pk>/objects/search', views.object_search, name='object_search'),
     path('project/<str:project_pk>/object/create', views.object_create, name='object_create'),
     path('project/<str:project_pk>/object/<str:object_pk>/update', views.object_update, name='object_update'),
     path('project/<str:project_pk>/object/<str:object_pk>/delete', views.object_delete, name='object_delete'),
     path('project/<str:project_pk>/object/<str:object_pk>', views.object_view, name='object_view'),
+    path('project/<str:project_pk>/object/<str:object_pk>/neighbourhood', views.object_neighbourhood, name='object_neighbourhood'),
+    path('project/<str:project_pk>/object/<str:object_pk>/neighbourhood/json', views.object_neighbourhood_json, name='object_neighbourhood_json'),
+    path('project/<str:project_pk>/object/<str:object_pk>/path', views.object_path, name='object_path'),
     path('project/<str:project_pk>/object/<str:object_pk>/tags/edit', views.object_tag_edit, name='object_tags_edit'),
     path('project/<str:project_pk>/object/<str:object_pk>/connections/edit', views.object_connections_edit, name='objects_connections_edit'),
     path('project/<str:project_pk>/objects/tag/<str:tag_pk>', views.objects_by_tag, name='objects_by_tag'),
+    path('project/<str:project_pk>/objects/filter', views.objects_filter, name='objects_filter'),
+    path('project/<str:project_pk>/objects/path/json', views.objects_path_json, name='objects_path_json'),
+    path('project/<str:project_pk>/objects/bulk', views.objects_bulk_edit, name='objects_bulk_edit'),
+    path('project/<str:project_pk>/objects/bulk/json', views.objects_bulk_json, name='objects_bulk_json'),
     path('project/<str:project_pk>/files', views.project_file_list, name='project_file_list'),
+    path('project/<str:project_pk>/files/search', views.project_file_search, name='project_file_search'),
     path('project/<str:project_pk>/file/upload', views.project_file_upload, name='project_file_upload'),
     path('project/<str:project_pk>/file/<str:file_pk>', views.project_file_view, name='project_file_view'),
     path('project/<str:project_pk>/file/<str:file_pk>/delete', views.project_file_delete, name='project_file_delete'),
     path('project/<str:project_pk>/file/<str:file_pk>/update', views.project_file_update, name='project_file_update'),
+    path('project/<str:project_pk>/file/<str:file_pk>/thumbnail/<int:size>', views.project_file_thumbnail, name='project_file_thumbnail'),
     path('project/<str:project_pk>/file/<str:file_pk>/download', views.project_file_download, name='project_file_download'),
+    path('project/<str:project_pk>/file/<str:file_pk>/preview', views.project_file_preview, name='project_file_preview'),
+    path('project/<str:project_pk>/uploads', views.chunked_upload_start, name='chunked_upload_start'),
+    path('project/<str:project_pk>/upload/<str:upload_pk>', views.chunked_upload, name='chunked_upload'),
+    path('project/<str:project_pk>/upload/<str:upload_pk>/finish', views.chunked_upload_finish, name='chunked_upload_finish'),
     path('project/<str:project_pk>/plot', views.main_file_list, name='main_file_list'),
     path('project/<str:project_pk>/plot/upload', views.main_file_upload, name='main_file_upload'),
     path('project/<str:project_pk>/plot/<str:main_file_pk>', views.main_file_view, name='main_file_view'),
     path('project/<str:project_pk>/plot/<str:main_file_pk>/delete', views.main_file_delete, name='main_file_delete'),
     path('project/<str:project_pk>/plot/<str:main_file_pk>/update', views.main_file_update, name='main_file_update'),
     path('project/<str:project_pk>/plot/<str:main_file_pk>/download', views.main_file_download, name='main_file_download'),
+    path('project/<str:project_pk>/plot/<str:main_file_pk>/preview', views.main_file_preview, name='main_file_preview'),
+    path('project/<str:project_pk>/plot/<str:main_file_pk>/read', views.main_file_read, name='main_file_read'),
 ]
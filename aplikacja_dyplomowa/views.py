@@ -1,5 +1,6 @@
-import os
+import json
 
+from django.conf import settings
 from django.shortcuts import render, redirect
 
 from django.contrib.auth import authenticate, login, logout, update_session_auth_hash
@@ -19,15 +20,61 @@ from .forms import (
     FilesUpdateForm,
     MainFilesForm,
     MainFileUpdateForm,
+    BulkEditForm,
+    ProjectImportForm,
 )
 
-from .models import Projects, ProjectObjects, Tags, Files, MainFiles
+from .models import Projects, ProjectObjects, Tags, Files, MainFiles, ChunkedUploads, ProjectDeletions
+
+from .resolvers import project_required, project_child_required
+
+from .pagination import keyset_paginate
+
+from .listings import file_listing
+
+from .search import search_objects, search_files
+
+from .tag_filter import TagQueryError, parse, resolve, filter_page, filter_counts
+
+from .exports import GRAPH_FORMATS, export_graph
+
+from .archives import project_archive
+
+from .imports import ArchiveImportError, import_archive
+
+from .deletion import start_deletion
+
+from .bulk import BulkEditError, apply_operations
+
+from .downloads import serve_file
+
+from .thumbnails import THUMBNAIL_CONTENT_TYPE, THUMBNAIL_MAX_AGE, get_thumbnail
+
+from .previews import is_csv, preview_page
+
+from .readers import ReaderError, has_reader, reader_page
+
+from .upload_handlers import limit_uploads
+
+from .quotas import QuotaExceeded, check_quota, project_quota, user_quota, user_usage
+
+from .custom_validators import FILE_EXTENSIONS, MAIN_FILE_EXTENSIONS
+
+from .uploads import UploadError, start_upload, write_chunk, finish_upload, abort_upload
+
+from .graph import DIRECTIONS, clamp_depth, max_depth, neighbourhood, neighbourhood_edges, get_adjacency, shortest_path
 
 from django.db import IntegrityError, transaction
 
 from django.core.paginator import Paginator
 
-from django.http import FileResponse
+from django.urls import reverse
+
+from django.utils.cache import patch_cache_control
+
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse, StreamingHttpResponse
 
 
 # Create your views here.
@@ -96,7 +143,11 @@ def account_view(request):
     user = request.user
 
     context = {
-        'user': user
+        'user': user,
+        'storage_used': user_usage(user.id),
+        'storage_quota': user_quota(),
+        'project_quota': project_quota(),
+        'projects': Projects.objects.filter(user=user, deleting=False, storage_used__gt=0).order_by('-storage_used')[:20],
     }
     return render(request, 'accounts/account_view.html', context)
 
@@ -139,7 +190,7 @@ def account_update_password(request):
 
 @login_required(login_url='login')
 def show_projects(request):
-    projects = Projects.objects.filter(user=request.user)
+    projects = keyset_paginate(request, Projects.objects.filter(user=request.user, deleting=False), ('createdAt', 'id'))
 
     context = {
         'projects': projects
@@ -169,14 +220,32 @@ def create_project(request):
 
 
 @login_required(login_url='login')
-def update_project(request, project_pk):
-    try:
-        project = Projects.objects.get(id=project_pk)
-        if project.user != request.user:
-            return redirect('access_denied')
-    except Projects.DoesNotExist:
-        return redirect('project_list')
+def import_project(request):
+    form = ProjectImportForm(user=request.user)
+    summary = None
+    if request.method == 'POST':
+        form = ProjectImportForm(request.POST, request.FILES, user=request.user)
+        if form.is_valid():
+            try:
+                summary = import_archive(
+                    form.cleaned_data['archive'],
+                    request.user,
+                    project=form.cleaned_data['project'],
+                    project_name=form.cleaned_data['project_name'],
+                )
+            except ArchiveImportError as exception:
+                form.add_error(None, str(exception))
+
+    context = {
+        'form': form,
+        'summary': summary,
+    }
+    return render(request, 'project_structure/project_import.html', context)
+
 
+@login_required(login_url='login')
+@project_required
+def update_project(request, project):
     form = ProjectForm(instance=project)
     if request.method == 'POST':
         form = ProjectForm(request.POST, instance=project)
@@ -195,18 +264,12 @@ def update_project(request, project_pk):
 
 
 @login_required(login_url='login')
-def delete_project(request, project_pk):
-    try:
-        project = Projects.objects.get(id=project_pk)
-        if project.user != request.user:
-            return redirect('access_denied')
-    except Projects.DoesNotExist:
-        return redirect('project_list')
-
+@project_required
+def delete_project(request, project):
     form = ProjectForm(instance=project)
     if request.method == 'POST':
-        project.delete()
-        return redirect('project_list')
+        deletion = start_deletion(project)
+        return redirect('project_deletion', deletion_pk=deletion.id)
 
     context = {
         'form': form,
@@ -216,14 +279,20 @@ def delete_project(request, project_pk):
 
 
 @login_required(login_url='login')
-def view_project(request, project_pk):
-    try:
-        project = Projects.objects.get(id=project_pk)
-        if project.user != request.user:
-            return redirect('access_denied')
-    except Projects.DoesNotExist:
+def project_deletion(request, deletion_pk):
+    deletion = ProjectDeletions.objects.filter(id=deletion_pk, user=request.user).first()
+    if deletion is None:
         return redirect('project_list')
 
+    context = {
+        'deletion': deletion,
+    }
+    return render(request, 'project_structure/project_deletion.html', context)
+
+
+@login_required(login_url='login')
+@project_required
+def view_project(request, project):
     context = {
         'project': project,
         'objects': ProjectObjects.objects.filter(project=project),
@@ -234,30 +303,39 @@ def view_project(request, project_pk):
 
 
 @login_required(login_url='login')
-def tag_list(request, project_pk):
-    try:
-        project = Projects.objects.get(id=project_pk)
-        if project.user != request.user:
-            return redirect('access_denied')
-    except Projects.DoesNotExist:
-        return redirect('project_list')
+@project_required
+def project_graph_export(request, project):
+    graph_format = request.GET.get('format', 'jsonl')
+    if graph_format not in GRAPH_FORMATS:
+        graph_format = 'jsonl'
+    content_type, extension = GRAPH_FORMATS[graph_format]
+
+    response = StreamingHttpResponse(export_graph(project, graph_format), content_type=f'{content_type}; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="project_{project.id}_graph.{extension}"'
+    return response
 
+
+@login_required(login_url='login')
+@project_required
+def project_export(request, project):
+    response = StreamingHttpResponse(project_archive(project), content_type='application/zip')
+    response['Content-Disposition'] = f'attachment; filename="project_{project.id}.zip"'
+    return response
+
+
+@login_required(login_url='login')
+@project_required
+def tag_list(request, project):
     context = {
         'project': project,
-        'tags': Tags.objects.filter(project=project)
+        'tags': keyset_paginate(request, Tags.objects.filter(project=project), ('tag_name', 'id'))
     }
     return render(request, 'project_structure/tags/tag_list.html', context)
 
 
 @login_required(login_url='login')
-def tag_create(request, project_pk):
-    try:
-        project = Projects.objects.get(id=project_pk)
-        if project.user != request.user:
-            return redirect('access_denied')
-    except Projects.DoesNotExist:
-        return redirect('project_list')
-
+@project_required
+def tag_create(request, project):
     form = TagForm()
     if request.method == 'POST':
         form = TagForm(request.POST)
@@ -281,21 +359,8 @@ def tag_create(request, project_pk):
 
 
 @login_required(login_url='login')
-def tag_update(request, project_pk, tag_pk):
-    try:
-        project = Projects.objects.get(id=project_pk)
-        if project.user != request.user:
-            return redirect('access_denied')
-    except Projects.DoesNotExist:
-        return redirect('project_list')
-
-    try:
-        tag = Tags.objects.get(id=tag_pk, project=project)
-        if tag.user != request.user:
-            return redirect('access_denied')
-    except Tags.DoesNotExist:
-        return redirect('tag_list', project_pk=project_pk)
-
+@project_child_required(Tags, 'tag_pk')
+def tag_update(request, project, tag):
     form = TagForm(instance=tag)
     if request.method == 'POST':
         form = TagForm(request.POST, instance=tag)
@@ -315,21 +380,8 @@ def tag_update(request, project_pk, tag_pk):
 
 
 @login_required(login_url='login')
-def tag_delete(request, project_pk, tag_pk):
-    try:
-        project = Projects.objects.get(id=project_pk)
-        if project.user != request.user:
-            return redirect('access_denied')
-    except Projects.DoesNotExist:
-        return redirect('project_list')
-
-    try:
-        tag = Tags.objects.get(id=tag_pk)
-        if tag.user != request.user:
-            return redirect('access_denied')
-    except Tags.DoesNotExist:
-        return redirect('tag_list', project_pk=project.id)
-
+@project_child_required(Tags, 'tag_pk')
+def tag_delete(request, project, tag):
     form = TagForm(instance=tag)
     if request.method == 'POST':
         tag.delete()
@@ -344,30 +396,35 @@ def tag_delete(request, project_pk, tag_pk):
 
 
 @login_required(login_url='login')
-def object_list(request, project_pk):
-    try:
-        project = Projects.objects.get(id=project_pk)
-        if project.user != request.user:
-            return redirect('access_denied')
-    except Projects.DoesNotExist:
-        return redirect('project_list')
-
+@project_required
+def object_list(request, project):
     context = {
         'project': project,
-        'objects': ProjectObjects.objects.filter(project=project)
+        'objects': keyset_paginate(request, ProjectObjects.objects.filter(project=project), ('object_name', 'id'))
     }
     return render(request, 'project_structure/object/object_list.html', context)
 
 
 @login_required(login_url='login')
-def object_create(request, project_pk):
-    try:
-        project = Projects.objects.get(id=project_pk)
-        if project.user != request.user:
-            return redirect('access_denied')
-    except Projects.DoesNotExist:
-        return redirect('project_list')
+@project_required
+def object_search(request, project):
+    query = request.GET.get('q', '').strip()
+    page = None
+    if query:
+        paginator = Paginator(search_objects(project, query), getattr(settings, 'PAGINATION_PAGE_SIZE', 50))
+        page = paginator.get_page(request.GET.get('page'))
+
+    context = {
+        'project': project,
+        'query': query,
+        'page': page,
+    }
+    return render(request, 'project_structure/object/object_search.html', context)
+
 
+@login_required(login_url='login')
+@project_required
+def object_create(request, project):
     form = ProjectObjectForm()
     if request.method == 'POST':
         form = ProjectObjectForm(request.POST)
@@ -390,21 +447,8 @@ def object_create(request, project_pk):
 
 
 @login_required(login_url='login')
-def object_update(request, project_pk, object_pk):
-    try:
-        project = Projects.objects.get(id=project_pk)
-        if project.user != request.user:
-            return redirect('access_denied')
-    except Projects.DoesNotExist:
-        return redirect('project_list')
-
-    try:
-        object_to_update = ProjectObjects.objects.get(id=object_pk)
-        if object_to_update.user != request.user:
-            return redirect('access_denied')
-    except ProjectObjects.DoesNotExist:
-        return redirect('object_list', project_pk=project.id)
-
+@project_child_required(ProjectObjects, 'object_pk')
+def object_update(request, project, object_to_update):
     form = ProjectObjectForm(instance=object_to_update)
     if request.method == 'POST':
         form = ProjectObjectForm(request.POST, instance=object_to_update)
@@ -424,21 +468,8 @@ def object_update(request, project_pk, object_pk):
 
 
 @login_required(login_url='login')
-def object_delete(request, project_pk, object_pk):
-    try:
-        project = Projects.objects.get(id=project_pk)
-        if project.user != request.user:
-            return redirect('access_denied')
-    except Projects.DoesNotExist:
-        return redirect('project_list')
-
-    try:
-        object_to_delete = ProjectObjects.objects.get(id=object_pk)
-        if object_to_delete.user != request.user:
-            return redirect('access_denied')
-    except ProjectObjects.DoesNotExist:
-        return redirect('object_list', project_pk=project.id)
-
+@project_child_required(ProjectObjects, 'object_pk')
+def object_delete(request, project, object_to_delete):
     form = ProjectObjectForm()
     if request.method == 'POST':
         object_to_delete.delete()
@@ -453,21 +484,8 @@ def object_delete(request, project_pk, object_pk):
 
 
 @login_required(login_url='login')
-def object_view(request, project_pk, object_pk):
-    try:
-        project = Projects.objects.get(id=project_pk)
-        if project.user != request.user:
-            return redirect('access_denied')
-    except Projects.DoesNotExist:
-        return redirect('project_list')
-
-    try:
-        object_to_view = ProjectObjects.objects.get(id=object_pk)
-        if object_to_view.user != request.user:
-            return redirect('access_denied')
-    except ProjectObjects.DoesNotExist:
-        return redirect('object_list', project_pk=project.id)
-
+@project_child_required(ProjectObjects, 'object_pk')
+def object_view(request, project, object_to_view):
     tags = object_to_view.tags.all()
     connections = object_to_view.connections.all()
 
@@ -481,21 +499,111 @@ def object_view(request, project_pk, object_pk):
 
 
 @login_required(login_url='login')
-def object_tag_edit(request, project_pk, object_pk):
-    try:
-        project = Projects.objects.get(id=project_pk)
-        if project.user != request.user:
-            return redirect('access_denied')
-    except Projects.DoesNotExist:
-        return redirect('project_list')
+@project_child_required(ProjectObjects, 'object_pk')
+def object_neighbourhood(request, project, object_to_view):
+    depth = clamp_depth(request.GET.get('depth'), default=2)
+    direction = request.GET.get('direction', 'both')
+    if direction not in DIRECTIONS:
+        direction = 'both'
+
+    levels = {}
+    for object_id, object_name, distance in neighbourhood(object_to_view, depth, direction):
+        if distance > 0:
+            levels.setdefault(distance, []).append({'id': object_id, 'name': object_name})
+
+    context = {
+        'project': project,
+        'object': object_to_view,
+        'depth': depth,
+        'depths': range(1, max_depth() + 1),
+        'direction': direction,
+        'levels': sorted(levels.items()),
+    }
+    return render(request, 'project_structure/object/object_neighbourhood.html', context)
+
+
+@login_required(login_url='login')
+@project_child_required(ProjectObjects, 'object_pk')
+def object_neighbourhood_json(request, project, object_to_view):
+    depth = clamp_depth(request.GET.get('depth'))
+    direction = request.GET.get('direction', 'both')
+    if direction not in DIRECTIONS:
+        direction = 'both'
+
+    nodes = [
+        {'id': object_id, 'name': object_name, 'depth': distance}
+        for object_id, object_name, distance in neighbourhood(object_to_view, depth, direction)
+    ]
+    edges = [
+        {'from': from_id, 'to': to_id}
+        for from_id, to_id in neighbourhood_edges(object_to_view, depth, direction)
+    ]
+    return JsonResponse({'object': object_to_view.id, 'depth': depth, 'direction': direction, 'nodes': nodes, 'edges': edges})
+
+
+@login_required(login_url='login')
+@project_child_required(ProjectObjects, 'object_pk')
+def object_path(request, project, object_to_view):
+    target_name = request.GET.get('target', '').strip()
+    direction = request.GET.get('direction', 'both')
+    if direction not in DIRECTIONS:
+        direction = 'both'
+
+    target = None
+    path = None
+    error = None
+    if target_name:
+        target = ProjectObjects.objects.filter(project=project, object_name=target_name).first()
+        if target is None:
+            error = 'Obiekt o takiej nazwie nie istnieje.'
+        else:
+            path_ids = shortest_path(get_adjacency(project), object_to_view.id, target.id, direction)
+            if path_ids is not None:
+                objects = ProjectObjects.objects.filter(project=project).in_bulk(path_ids)
+                path = [objects[object_id] for object_id in path_ids]
 
+    context = {
+        'project': project,
+        'object': object_to_view,
+        'target_name': target_name,
+        'target': target,
+        'direction': direction,
+        'path': path,
+        'error': error,
+    }
+    return render(request, 'project_structure/object/object_path.html', context)
+
+
+@login_required(login_url='login')
+@project_required
+def objects_path_json(request, project):
     try:
-        object_to_view = ProjectObjects.objects.get(id=object_pk)
-        if object_to_view.user != request.user:
-            return redirect('access_denied')
-    except ProjectObjects.DoesNotExist:
-        return redirect('object_list', project_pk=project.id)
+        source_id = int(request.GET.get('from'))
+        target_id = int(request.GET.get('to'))
+    except (TypeError, ValueError):
+        return JsonResponse({'error': 'Parametry from i to muszą być identyfikatorami obiektów.'}, status=400)
+    direction = request.GET.get('direction', 'both')
+    if direction not in DIRECTIONS:
+        direction = 'both'
+
+    found = ProjectObjects.objects.filter(project=project, id__in=[source_id, target_id]).count()
+    if found != len({source_id, target_id}):
+        return JsonResponse({'error': 'Obiekt nie istnieje.'}, status=404)
+
+    path = shortest_path(get_adjacency(project), source_id, target_id, direction)
+    return JsonResponse({
+        'from': source_id,
+        'to': target_id,
+        'direction': direction,
+        'connected': path is not None,
+        'length': len(path) - 1 if path is not None else None,
+        'path': path,
+    })
 
+
+@login_required(login_url='login')
+@project_child_required(ProjectObjects, 'object_pk')
+def object_tag_edit(request, project, object_to_view):
     form = ProjectObjectAddTagForm(project=project, object_to_view=object_to_view)
     tags = Tags.objects.filter(project=project)
 
@@ -508,11 +616,11 @@ def object_tag_edit(request, project_pk, object_pk):
             tags_to_add = set(tags_from_form) - current_tags
             tags_to_remove = current_tags - set(tags_from_form)
 
-            for tag in tags_to_add:
-                object_to_view.tags.add(tag)
-
-            for tag in tags_to_remove:
-                object_to_view.tags.remove(tag)
+            with transaction.atomic():
+                if tags_to_add:
+                    object_to_view.tags.add(*tags_to_add)
+                if tags_to_remove:
+                    object_to_view.tags.remove(*tags_to_remove)
 
             return redirect('object_view', project_pk=project.id, object_pk=object_to_view.id)
 
@@ -526,21 +634,8 @@ def object_tag_edit(request, project_pk, object_pk):
 
 
 @login_required(login_url='login')
-def object_connections_edit(request, project_pk, object_pk):
-    try:
-        project = Projects.objects.get(id=project_pk)
-        if project.user != request.user:
-            return redirect('access_denied')
-    except Projects.DoesNotExist:
-        return redirect('project_list')
-
-    try:
-        object_to_view = ProjectObjects.objects.get(id=object_pk)
-        if object_to_view.user != request.user:
-            return redirect('access_denied')
-    except ProjectObjects.DoesNotExist:
-        return redirect('object_list', project_pk=project.id)
-
+@project_child_required(ProjectObjects, 'object_pk')
+def object_connections_edit(request, project, object_to_view):
     form = ProjectObjectAddConnectionForm(project=project, object_to_view=object_to_view)
     objects = ProjectObjects.objects.filter(project=project)
 
@@ -553,11 +648,11 @@ def object_connections_edit(request, project_pk, object_pk):
             connections_to_add = set(connections_from_form) - current_connections
             connections_to_remove = current_connections - set(connections_from_form)
 
-            for connection in connections_to_add:
-                object_to_view.connections.add(connection)
-
-            for connection in connections_to_remove:
-                object_to_view.connections.remove(connection)
+            with transaction.atomic():
+                if connections_to_add:
+                    object_to_view.connections.add(*connections_to_add)
+                if connections_to_remove:
+                    object_to_view.connections.remove(*connections_to_remove)
 
             return redirect('object_view', project_pk=project.id, object_pk=object_to_view.id)
 
@@ -571,22 +666,51 @@ def object_connections_edit(request, project_pk, object_pk):
 
 
 @login_required(login_url='login')
-def objects_by_tag(request, project_pk, tag_pk):
-    try:
-        project = Projects.objects.get(id=project_pk)
-        if project.user != request.user:
-            return redirect('access_denied')
-    except Projects.DoesNotExist:
-        return redirect('project_list')
+@project_required
+def objects_bulk_edit(request, project):
+    form = BulkEditForm(project=project)
+
+    if request.method == 'POST':
+        form = BulkEditForm(request.POST, project=project)
+        if form.is_valid():
+            operation = form.cleaned_data['operation']
+            objects = [project_object.id for project_object in form.cleaned_data['objects']]
+            if operation in ('add_tags', 'remove_tags'):
+                extra = {'tags': [tag.id for tag in form.cleaned_data['tags']]}
+            else:
+                extra = {'targets': form.cleaned_data['target_ids']}
+            results = apply_operations(project, [{'op': operation, 'objects': objects, **extra}])
+            messages.success(request, f'Zmieniono powiązań: {results[0]["changed"]}.')
+            return redirect(request.get_full_path())
+
+    context = {
+        'project': project,
+        'form': form,
+        'objects': keyset_paginate(request, ProjectObjects.objects.filter(project=project), ('object_name', 'id')),
+    }
+    return render(request, 'project_structure/object/objects_bulk_edit.html', context)
 
+
+@login_required(login_url='login')
+@project_required
+def objects_bulk_json(request, project):
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Dozwolona jest tylko metoda POST.'}, status=405)
     try:
-        tag = Tags.objects.get(id=tag_pk)
-        if tag.user != request.user:
-            return redirect('access_denied')
-    except Tags.DoesNotExist:
-        return redirect('view_project', project_pk=project.id)
+        payload = json.loads(request.body)
+        operations = payload['operations']
+        if not isinstance(operations, list):
+            raise BulkEditError('Pole operations musi być listą.')
+        results = apply_operations(project, operations)
+    except (ValueError, KeyError, TypeError) as exception:
+        return JsonResponse({'error': str(exception)}, status=400)
+    return JsonResponse({'results': results})
 
-    objects = ProjectObjects.objects.filter(tags__id=tag.id)
+
+@login_required(login_url='login')
+@project_child_required(Tags, 'tag_pk')
+def objects_by_tag(request, project, tag):
+    objects = filter_page(request, project, ('tag', tag.id))
 
     context = {
         'project': project,
@@ -597,37 +721,96 @@ def objects_by_tag(request, project_pk, tag_pk):
 
 
 @login_required(login_url='login')
-def project_file_list(request, project_pk):
-    try:
-        project = Projects.objects.get(id=project_pk)
-        if project.user != request.user:
-            return redirect('access_denied')
-    except Projects.DoesNotExist:
-        return redirect('project_list')
+@project_required
+def objects_filter(request, project):
+    query = request.GET.get('q', '').strip()
+    objects = None
+    counts = None
+    tags = []
+    error = None
+
+    if query:
+        try:
+            tree, tags = resolve(parse(query), project)
+        except TagQueryError as exception:
+            error = str(exception)
+        else:
+            objects = filter_page(request, project, tree)
+            counts = filter_counts(project, tree)
+            for tag in tags:
+                tag.matches = counts['tags'][tag.id]
 
-    files = Files.objects.filter(project=project)
+    context = {
+        'project': project,
+        'query': query,
+        'objects': objects,
+        'counts': counts,
+        'tags': tags,
+        'error': error,
+    }
+    return render(request, 'project_structure/object/objects_filter.html', context)
+
+
+@login_required(login_url='login')
+@project_required
+def project_file_list(request, project):
+    files, listing = file_listing(request, Files.objects.filter(project=project))
 
     context = {
         'project': project,
         'files': files,
+        'listing': listing,
     }
     return render(request, 'project_structure/files/file_list.html', context)
 
 
 @login_required(login_url='login')
-def project_file_upload(request, project_pk):
+@project_required
+def project_file_search(request, project):
+    query = request.GET.get('q', '').strip()
+    page = None
+    if query:
+        paginator = Paginator(search_files(project, query), getattr(settings, 'PAGINATION_PAGE_SIZE', 50))
+        page = paginator.get_page(request.GET.get('page'))
+
+    context = {
+        'project': project,
+        'query': query,
+        'page': page,
+    }
+    return render(request, 'project_structure/files/file_search.html', context)
+
+
+def _fits_quota(form, project, user):
     try:
-        project = Projects.objects.get(id=project_pk)
-        if project.user != request.user:
-            return redirect('access_denied')
-    except Projects.DoesNotExist:
-        return redirect('project_list')
+        check_quota(project, user.id, form.cleaned_data['file'].size)
+    except QuotaExceeded as exception:
+        form.add_error(None, str(exception))
+        return False
+    return True
+
+
+@login_required(login_url='login')
+@csrf_exempt
+@project_required
+def project_file_upload(request, project):
+    # The upload handler has to be installed before anything reads
+    # request.POST, the CSRF check included, so that runs afterwards.
+    upload_handler = limit_uploads(request, Files, project, FILE_EXTENSIONS)
+    return _project_file_upload(request, project, upload_handler)
+
 
+@csrf_protect
+def _project_file_upload(request, project, upload_handler):
     form = FilesForm()
 
     if request.method == 'POST':
         form = FilesForm(request.POST, request.FILES)
-        if form.is_valid():
+        if upload_handler.error:
+            form.add_error(None, upload_handler.error)
+        elif Files.objects.filter(project=project, user=request.user, file_name=request.POST.get('file_name')).exists():
+            form.add_error(None, 'Plik o takiej nazwie już istnieje')
+        elif form.is_valid() and _fits_quota(form, project, request.user):
             try:
                 with transaction.atomic():
                     file = form.save(commit=False)
@@ -637,8 +820,7 @@ def project_file_upload(request, project_pk):
                     return redirect('project_file_view', project_pk=project.id, file_pk=file.id)
             except IntegrityError:
                 form.add_error(None, 'Plik o takiej nazwie już istnieje')
-                file_path = file.file.path
-                os.remove(file_path)
+                file.file.storage.delete(file.file.name)
 
     form_errors = form.errors
 
@@ -647,49 +829,27 @@ def project_file_upload(request, project_pk):
         'project': project,
         'form_errors': form_errors,
     }
-    return render(request, 'project_structure/files/file_upload.html', context)
+    response = render(request, 'project_structure/files/file_upload.html', context)
+    if upload_handler.error:
+        # The rejected body was left unread.
+        response.headers['Connection'] = 'close'
+    return response
 
 
 @login_required(login_url='login')
-def project_file_view(request, project_pk, file_pk):
-    try:
-        project = Projects.objects.get(id=project_pk)
-        if project.user != request.user:
-            return redirect('access_denied')
-    except Projects.DoesNotExist:
-        return redirect('project_list')
-
-    try:
-        file = Files.objects.get(id=file_pk)
-        if file.user != request.user:
-            return redirect('access_denied')
-    except Files.DoesNotExist:
-        return redirect('project_file_list', project_pk=project.id)
-
+@project_child_required(Files, 'file_pk')
+def project_file_view(request, project, file):
     context = {
         'project': project,
         'file': file,
-        'file_size': round(file.file.size / 1024, 2)
+        'has_preview': is_csv(file.file),
     }
     return render(request, 'project_structure/files/file_view.html', context)
 
 
 @login_required(login_url='login')
-def project_file_delete(request, project_pk, file_pk):
-    try:
-        project = Projects.objects.get(id=project_pk)
-        if project.user != request.user:
-            return redirect('access_denied')
-    except Projects.DoesNotExist:
-        return redirect('project_list')
-
-    try:
-        file = Files.objects.get(id=file_pk)
-        if file.user != request.user:
-            return redirect('access_denied')
-    except Files.DoesNotExist:
-        return redirect('project_file_list', project_pk=project.id)
-
+@project_child_required(Files, 'file_pk')
+def project_file_delete(request, project, file):
     if request.method == 'POST':
         file.delete()
         return redirect('project_file_list', project_pk=project.id)
@@ -702,21 +862,8 @@ def project_file_delete(request, project_pk, file_pk):
 
 
 @login_required(login_url='login')
-def project_file_update(request, project_pk, file_pk):
-    try:
-        project = Projects.objects.get(id=project_pk)
-        if project.user != request.user:
-            return redirect('access_denied')
-    except Projects.DoesNotExist:
-        return redirect('project_list')
-
-    try:
-        file = Files.objects.get(id=file_pk)
-        if file.user != request.user:
-            return redirect('access_denied')
-    except Files.DoesNotExist:
-        return redirect('project_file_list', project_pk=project.id)
-
+@project_child_required(Files, 'file_pk')
+def project_file_update(request, project, file):
     form = FilesUpdateForm(instance=file)
     if request.method == 'POST':
         form = FilesUpdateForm(request.POST, request.FILES, instance=file)
@@ -736,56 +883,148 @@ def project_file_update(request, project_pk, file_pk):
 
 
 @login_required(login_url='login')
-def project_file_download(request, project_pk, file_pk):
+@project_child_required(Files, 'file_pk')
+def project_file_download(request, project, file):
+    return serve_file(request, file.file, file.sha256)
+
+
+def _csv_preview(request, project, instance, back_url):
+    if not is_csv(instance.file):
+        raise Http404('Podgląd jest dostępny tylko dla plików CSV.')
     try:
-        project = Projects.objects.get(id=project_pk)
-        if project.user != request.user:
-            return redirect('access_denied')
-    except Projects.DoesNotExist:
-        return redirect('project_list')
+        number = int(request.GET.get('page', 1))
+    except ValueError:
+        number = 1
+    try:
+        page = preview_page(instance, number)
+    except OSError:
+        raise Http404('Nie znaleziono pliku.')
+
+    context = {
+        'project': project,
+        'file': instance,
+        'page': page,
+        'back_url': back_url,
+    }
+    return render(request, 'project_structure/files/file_preview.html', context)
+
+
+@login_required(login_url='login')
+@project_child_required(Files, 'file_pk')
+def project_file_preview(request, project, file):
+    back_url = reverse('project_file_view', kwargs={'project_pk': project.id, 'file_pk': file.id})
+    return _csv_preview(request, project, file, back_url)
 
+
+def _upload_status(upload):
+    return {'id': str(upload.id), 'offset': upload.offset, 'size': upload.size}
+
+
+@login_required(login_url='login')
+@project_required
+def chunked_upload_start(request, project):
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Dozwolona jest tylko metoda POST.'}, status=405)
     try:
-        file = Files.objects.get(id=file_pk)
-        if file.user != request.user:
-            return redirect('access_denied')
-    except Files.DoesNotExist:
-        return redirect('project_file_list', project_pk=project.id)
+        payload = json.loads(request.body)
+        upload = start_upload(
+            project, request.user,
+            payload.get('kind'), payload.get('file_name'), payload.get('filename'), payload.get('size'),
+        )
+    except (ValueError, AttributeError):
+        return JsonResponse({'error': 'Niepoprawne żądanie.'}, status=400)
+    except UploadError as exception:
+        return JsonResponse({'error': str(exception)}, status=exception.status)
+    return JsonResponse(_upload_status(upload), status=201)
 
-    return FileResponse(file.file, as_attachment=True)
+
+@login_required(login_url='login')
+@project_child_required(ChunkedUploads, 'upload_pk')
+def chunked_upload(request, project, upload):
+    """GET returns the offset to resume from, PUT appends a chunk at Upload-Offset, DELETE aborts the upload."""
+    if request.method == 'GET':
+        return JsonResponse(_upload_status(upload))
+    if request.method == 'DELETE':
+        abort_upload(upload)
+        return HttpResponse(status=204)
+    if request.method != 'PUT':
+        return JsonResponse({'error': 'Dozwolone metody to GET, PUT i DELETE.'}, status=405)
+
+    try:
+        offset = int(request.headers.get('Upload-Offset', request.GET.get('offset', '')))
+        length = int(request.headers.get('Content-Length', ''))
+    except ValueError:
+        return JsonResponse({'error': 'Brak nagłówków Upload-Offset i Content-Length.'}, status=400)
+    try:
+        write_chunk(upload, offset, request, length, request.headers.get('X-Chunk-SHA256'))
+    except UploadError as exception:
+        return JsonResponse({'error': str(exception), **_upload_status(upload)}, status=exception.status)
+    return JsonResponse(_upload_status(upload))
 
 
 @login_required(login_url='login')
-def main_file_list(request, project_pk):
+@project_child_required(ChunkedUploads, 'upload_pk')
+def chunked_upload_finish(request, project, upload):
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Dozwolona jest tylko metoda POST.'}, status=405)
     try:
-        project = Projects.objects.get(id=project_pk)
-        if project.user != request.user:
-            return redirect('access_denied')
-    except Projects.DoesNotExist:
-        return redirect('project_list')
+        instance = finish_upload(upload, request.headers.get('X-File-SHA256'))
+    except UploadError as exception:
+        return JsonResponse({'error': str(exception), **_upload_status(upload)}, status=exception.status)
+
+    if upload.kind == 'main_file':
+        url = reverse('main_file_view', kwargs={'project_pk': project.id, 'main_file_pk': instance.id})
+    else:
+        url = reverse('project_file_view', kwargs={'project_pk': project.id, 'file_pk': instance.id})
+    return JsonResponse({'id': instance.id, 'url': url}, status=201)
+
+
+@login_required(login_url='login')
+@project_child_required(Files, 'file_pk')
+def project_file_thumbnail(request, project, file, size):
+    path = get_thumbnail(file, size)
+    if path is None:
+        raise Http404('Brak miniatury.')
 
-    main_files = MainFiles.objects.filter(project=project)
+    response = FileResponse(open(path, 'rb'), content_type=THUMBNAIL_CONTENT_TYPE)
+    # The content of an uploaded file never changes, neither do its thumbnails.
+    patch_cache_control(response, private=True, max_age=THUMBNAIL_MAX_AGE, immutable=True)
+    return response
+
+
+@login_required(login_url='login')
+@project_required
+def main_file_list(request, project):
+    main_files, listing = file_listing(request, MainFiles.objects.filter(project=project))
 
     context = {
         'project': project,
         'main_files': main_files,
+        'listing': listing,
     }
     return render(request, 'project_structure/main_files/main_file_list.html', context)
 
 
 @login_required(login_url='login')
-def main_file_upload(request, project_pk):
-    try:
-        project = Projects.objects.get(id=project_pk)
-        if project.user != request.user:
-            return redirect('access_denied')
-    except Projects.DoesNotExist:
-        return redirect('project_list')
+@csrf_exempt
+@project_required
+def main_file_upload(request, project):
+    # See project_file_upload.
+    upload_handler = limit_uploads(request, MainFiles, project, MAIN_FILE_EXTENSIONS)
+    return _main_file_upload(request, project, upload_handler)
+
 
+@csrf_protect
+def _main_file_upload(request, project, upload_handler):
     form = MainFilesForm()
 
     if request.method == 'POST':
         form = MainFilesForm(request.POST, request.FILES)
-        if form.is_valid():
+        if upload_handler.error:
+            form.add_error(None, upload_handler.error)
+        elif MainFiles.objects.filter(project=project, user=request.user, file_name=request.POST.get('file_name')).exists():
+            form.add_error(None, 'Plik o takiej nazwie już istnieje')
+        elif form.is_valid() and _fits_quota(form, project, request.user):
             try:
                 with transaction.atomic():
                     main_file = form.save(commit=False)
@@ -795,8 +1034,7 @@ def main_file_upload(request, project_pk):
                     return redirect('main_file_view', project_pk=project.id, main_file_pk=main_file.id)
             except IntegrityError:
                 form.add_error(None, 'Plik o takiej nazwie już istnieje')
-                file_path = main_file.file.path
-                os.remove(file_path)
+                main_file.file.storage.delete(main_file.file.name)
 
     form_errors = form.errors
 
@@ -805,26 +1043,16 @@ def main_file_upload(request, project_pk):
         'project': project,
         'form_errors': form_errors,
     }
-    return render(request, 'project_structure/main_files/main_file_upload.html', context)
+    response = render(request, 'project_structure/main_files/main_file_upload.html', context)
+    if upload_handler.error:
+        # The rejected body was left unread.
+        response.headers['Connection'] = 'close'
+    return response
 
 
 @login_required(login_url='login')
-def main_file_update(request, project_pk, main_file_pk):
-
-    try:
-        project = Projects.objects.get(id=project_pk)
-        if project.user != request.user:
-            return redirect('access_denied')
-    except Projects.DoesNotExist:
-        return redirect('project_list')
-
-    try:
-        main_file = MainFiles.objects.get(id=main_file_pk)
-        if main_file.user != request.user:
-            return redirect('access_denied')
-    except MainFiles.DoesNotExist:
-        return redirect('main_file_list', project_pk=project.id)
-
+@project_child_required(MainFiles, 'main_file_pk')
+def main_file_update(request, project, main_file):
     form = MainFileUpdateForm(instance=main_file)
     if request.method == 'POST':
         form = MainFileUpdateForm(request.POST, request.FILES, instance=main_file)
@@ -844,21 +1072,8 @@ def main_file_update(request, project_pk, main_file_pk):
 
 
 @login_required(login_url='login')
-def main_file_delete(request, project_pk, main_file_pk):
-    try:
-        project = Projects.objects.get(id=project_pk)
-        if project.user != request.user:
-            return redirect('access_denied')
-    except Projects.DoesNotExist:
-        return redirect('project_list')
-
-    try:
-        main_file = MainFiles.objects.get(id=main_file_pk)
-        if main_file.user != request.user:
-            return redirect('access_denied')
-    except MainFiles.DoesNotExist:
-        return redirect('main_file_list', project_pk=project.id)
-
+@project_child_required(MainFiles, 'main_file_pk')
+def main_file_delete(request, project, main_file):
     if request.method == 'POST':
         main_file.delete()
         return redirect('main_file_list', project_pk=project.id)
@@ -871,46 +1086,54 @@ def main_file_delete(request, project_pk, main_file_pk):
 
 
 @login_required(login_url='login')
-def main_file_view(request, project_pk, main_file_pk):
-    try:
-        project = Projects.objects.get(id=project_pk)
-        if project.user != request.user:
-            return redirect('access_denied')
-    except Projects.DoesNotExist:
-        return redirect('project_list')
+@project_child_required(MainFiles, 'main_file_pk')
+def main_file_view(request, project, main_file):
+    context = {
+        'project': project,
+        'main_file': main_file,
+        'has_preview': is_csv(main_file.file),
+        'has_reader': has_reader(main_file.file),
+    }
+    return render(request, 'project_structure/main_files/main_file_view.html', context)
+
 
+@login_required(login_url='login')
+@project_child_required(MainFiles, 'main_file_pk')
+def main_file_read(request, project, main_file):
+    if not has_reader(main_file.file):
+        raise Http404('Czytnik obsługuje tylko pliki TXT i DOCX.')
     try:
-        main_file = MainFiles.objects.get(id=main_file_pk)
-        if main_file.user != request.user:
-            return redirect('access_denied')
-    except MainFiles.DoesNotExist:
-        return redirect('main_file_list', project_pk=project.id)
+        number = int(request.GET.get('segment', 1))
+    except ValueError:
+        number = 1
+    page = error = None
+    try:
+        page = reader_page(main_file, number)
+    except OSError:
+        raise Http404('Nie znaleziono pliku.')
+    except ReaderError as exception:
+        error = str(exception)
 
     context = {
         'project': project,
         'main_file': main_file,
-        'main_file_size': round(main_file.file.size / 1024, 2)
+        'page': page,
+        'error': error,
     }
-    return render(request, 'project_structure/main_files/main_file_view.html', context)
+    return render(request, 'project_structure/main_files/main_file_reader.html', context)
 
 
 @login_required(login_url='login')
-def main_file_download(request, project_pk, main_file_pk):
-    try:
-        project = Projects.objects.get(id=project_pk)
-        if project.user != request.user:
-            return redirect('access_denied')
-    except Projects.DoesNotExist:
-        return redirect('project_list')
+@project_child_required(MainFiles, 'main_file_pk')
+def main_file_preview(request, project, main_file):
+    back_url = reverse('main_file_view', kwargs={'project_pk': project.id, 'main_file_pk': main_file.id})
+    return _csv_preview(request, project, main_file, back_url)
 
-    try:
-        main_file = MainFiles.objects.get(id=main_file_pk)
-        if main_file.user != request.user:
-            return redirect('access_denied')
-    except MainFiles.DoesNotExist:
-        return redirect('main_file_list', project_pk=project.id)
 
-    return FileResponse(main_file.file, as_attachment=True)
+@login_required(login_url='login')
+@project_child_required(MainFiles, 'main_file_pk')
+def main_file_download(request, project, main_file):
+    return serve_file(request, main_file.file, main_file.sha256)
 
 
 def handle_not_found(request, exception):
@@ -41,6 +41,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'aplikacja_dyplomowa.middleware.FileDeliveryStandInMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -133,3 +134,64 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = 'file_storage'
+
+PAGINATION_PAGE_SIZE = 50
+PAGINATION_MAX_PAGE_SIZE = 200
+
+# Background worker threads for work done after upload (text extraction etc.)
+BACKGROUND_WORKERS = 2
+BACKGROUND_TASKS_SYNC = False
+
+FILE_INDEX_MAX_CHARS = 2000000
+FILE_SEARCH_LIMIT = 100
+
+TAG_FILTER_CACHE_TIMEOUT = 300
+
+GRAPH_MAX_DEPTH = 5
+GRAPH_CACHE_BYTES = 64 * 1024 * 1024
+
+# CSV preview: rows per page and rows between two byte offsets kept in the row index
+CSV_PREVIEW_ROWS = 50
+CSV_PREVIEW_INDEX_STEP = 1000
+
+# Reader of plot files: chapters longer than this many bytes are split into parts
+PLOT_READER_SEGMENT_BYTES = 64 * 1024
+
+# Resumable uploads sent in chunks by the browser
+CHUNKED_UPLOAD_MAX_SIZE = 500 * 1024 * 1024
+CHUNKED_UPLOAD_MAX_CHUNK_SIZE = 16 * 1024 * 1024
+# Seconds after which a chunk write that never finished stops holding its upload
+CHUNKED_UPLOAD_CLAIM_TIMEOUT = 10 * 60
+
+# Storage quotas in bytes across Files and MainFiles, None for no limit
+STORAGE_QUOTA_PER_USER = 1024 * 1024 * 1024
+STORAGE_QUOTA_PER_PROJECT = 512 * 1024 * 1024
+
+# Uploads with these extensions are kept gzip-compressed on disk
+STORAGE_COMPRESS_EXTENSIONS = ['txt', 'csv']
+
+# Uploads are stored once per content, see aplikacja_dyplomowa.storage
+STORAGES = {
+    'default': {
+        'BACKEND': 'aplikacja_dyplomowa.storage.BlobStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+}
+
+# How downloads are sent: 'django' streams them from the worker,
+# 'x-accel-redirect' (nginx) and 'x-sendfile' (Apache, lighttpd) leave it to
+# the front proxy. For nginx MEDIA_ROOT has to be exposed as an internal
+# location under FILE_DELIVERY_INTERNAL_URL:
+#
+#     location /protected/ {
+#         internal;
+#         alias /path/to/file_storage/;
+#     }
+#
+# FILE_DELIVERY_STANDIN serves those headers from Django itself, for
+# running the offloaded modes locally without a proxy.
+FILE_DELIVERY = 'django'
+FILE_DELIVERY_INTERNAL_URL = '/protected/'
+FILE_DELIVERY_STANDIN = False
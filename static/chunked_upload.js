@@ -0,0 +1,97 @@
+// Sends files bigger than one chunk in pieces, so an interrupted upload
+// continues from the last stored offset instead of starting over.
+(function () {
+    const CHUNK_SIZE = 4 * 1024 * 1024;
+    const RETRIES = 5;
+
+    function csrfToken(form) {
+        return form.querySelector('input[name="csrfmiddlewaretoken"]').value;
+    }
+
+    async function request(url, options, form) {
+        options.headers = Object.assign({'X-CSRFToken': csrfToken(form)}, options.headers || {});
+        const response = await fetch(url, options);
+        const body = response.status === 204 ? {} : await response.json();
+        return {status: response.status, ok: response.ok, body: body};
+    }
+
+    async function currentOffset(url, form) {
+        const response = await request(url, {method: 'GET'}, form);
+        if (!response.ok) {
+            throw new Error(response.body.error);
+        }
+        return response.body.offset;
+    }
+
+    async function upload(form, file, progress) {
+        const started = await request(form.dataset.uploadUrl, {
+            method: 'POST',
+            headers: {'Content-Type': 'application/json'},
+            body: JSON.stringify({
+                kind: form.dataset.uploadKind,
+                file_name: form.querySelector('input[name="file_name"]').value,
+                filename: file.name,
+                size: file.size,
+            }),
+        }, form);
+        if (!started.ok) {
+            throw new Error(started.body.error);
+        }
+        const url = form.dataset.uploadUrl.replace(/uploads$/, 'upload/' + started.body.id);
+
+        let offset = 0;
+        let failures = 0;
+        while (offset < file.size) {
+            const chunk = file.slice(offset, offset + CHUNK_SIZE);
+            try {
+                const response = await request(url, {
+                    method: 'PUT',
+                    headers: {'Upload-Offset': String(offset), 'Content-Type': 'application/octet-stream'},
+                    body: chunk,
+                }, form);
+                if (response.ok || response.status === 409) {
+                    offset = response.body.offset;
+                    failures = 0;
+                } else {
+                    throw new Error(response.body.error);
+                }
+            } catch (error) {
+                failures += 1;
+                if (failures > RETRIES) {
+                    throw error;
+                }
+                await new Promise(resolve => setTimeout(resolve, 1000 * failures));
+                offset = await currentOffset(url, form);
+            }
+            progress.value = offset / file.size;
+        }
+
+        const finished = await request(url + '/finish', {method: 'POST'}, form);
+        if (!finished.ok) {
+            throw new Error(finished.body.error);
+        }
+        return finished.body.url;
+    }
+
+    document.querySelectorAll('form[data-upload-url]').forEach(function (form) {
+        const input = form.querySelector('input[type="file"]');
+        const progress = form.querySelector('progress');
+        const errors = form.querySelector('.upload-errors');
+
+        form.addEventListener('submit', function (event) {
+            const file = input.files[0];
+            if (!file || file.size <= CHUNK_SIZE) {
+                // Lets the server refuse a taken name before the file is received.
+                const name = form.querySelector('input[name="file_name"]').value;
+                form.action = window.location.pathname + '?file_name=' + encodeURIComponent(name);
+                return;
+            }
+            event.preventDefault();
+            progress.hidden = false;
+            errors.textContent = '';
+            upload(form, file, progress)
+                .then(url => { window.location = url; })
+                .catch(error => { errors.textContent = error.message; });
+        });
+    });
+})();